@@ -7,6 +7,7 @@ import re
 from typing import Optional, Dict
 from telegram import Update
 from config import config
+import shared_state
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,6 +22,13 @@ class RateLimiter:
 
     def is_allowed(self, user_id: int) -> bool:
         """Check if user is within rate limit"""
+        # Sharded workers count requests in the shared store
+        if shared_state.store:
+            allowed = shared_state.store.rate_limit_allow(user_id, self.max_per_minute)
+            if not allowed:
+                logger.warning(f"Rate limit exceeded for user {user_id}")
+            return allowed
+
         now = time.time()
 
         if user_id not in self.user_requests:
@@ -43,6 +51,8 @@ class RateLimiter:
 
     def reset_user(self, user_id: int):
         """Reset rate limit for a user"""
+        if shared_state.store:
+            shared_state.store.rate_limit_reset(user_id)
         if user_id in self.user_requests:
             del self.user_requests[user_id]
 
@@ -68,6 +78,14 @@ class Auth:
 
         return True
 
+    def is_admin(self, update: Update) -> bool:
+        """Check if user may run admin commands"""
+        user_id = update.effective_user.id
+        admins = set(config.ADMIN_USERS) or self.allowed_users
+
+        # An open bot (no allow-list) has no admins
+        return user_id in admins
+
     def check_rate_limit(self, user_id: int) -> bool:
         """Check if user is within rate limit"""
         return self.rate_limiter.is_allowed(user_id)
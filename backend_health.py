@@ -0,0 +1,147 @@
+"""
+Circuit breakers for the Claude backends (CLI and API)
+Each backend's recent outcomes are tracked; once too many fail, the backend
+is skipped for a cooldown instead of making every request wait for it to
+fail again. Recent latencies give the delay used for hedged requests.
+"""
+
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BACKEND_SECONDS = metrics.histogram(
+    'telegram_claude_backend_seconds',
+    'Claude backend call latency (successful calls)',
+    label='backend'
+)
+BACKEND_FAILURES = metrics.counter(
+    'telegram_claude_backend_failures_total',
+    'Claude backend calls that raised',
+    label='backend'
+)
+BACKEND_SKIPS = metrics.counter(
+    'telegram_claude_backend_skips_total',
+    'Requests that skipped a backend because its circuit was open',
+    label='backend'
+)
+HEDGES = metrics.counter(
+    'telegram_claude_hedges_total',
+    'Hedged requests, by backend that won',
+    label='winner'
+)
+
+
+class BackendError(Exception):
+    """The backend itself failed (timed out, missing, unreachable) - not the task"""
+
+
+class CircuitBreaker:
+    """
+    closed: calls go through, outcomes are recorded
+    open: failure rate over the window reached the threshold; calls are skipped
+    half_open: cooldown passed; one probe call decides between closed and open
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        failure_threshold: float = 0.5,
+        min_calls: int = 4,
+        cooldown: float = 60.0
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes: Deque[bool] = deque(maxlen=window)  # True = success
+        self.latencies: Deque[float] = deque(maxlen=window * 5)
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half_open'
+        return 'open'
+
+    @property
+    def failure_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def allow(self) -> bool:
+        """Whether a call may go to this backend now (claims the probe when half open)"""
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self.probing:
+            self.probing = True
+            logger.info(f"Probing {self.name} backend after {self.cooldown:.0f}s cooldown")
+            return True
+        BACKEND_SKIPS.inc(self.name)
+        return False
+
+    def record_success(self, latency: float):
+        self.outcomes.append(True)
+        self.latencies.append(latency)
+        BACKEND_SECONDS.observe(self.name, latency)
+        if self.opened_at is not None:
+            logger.info(f"{self.name} backend recovered, closing circuit")
+            self.opened_at = None
+            self.outcomes.clear()
+        self.probing = False
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        BACKEND_FAILURES.inc(self.name)
+        if self.probing or (
+            len(self.outcomes) >= self.min_calls and self.failure_rate >= self.failure_threshold
+        ):
+            if self.opened_at is None or self.probing:
+                logger.warning(
+                    f"Opening circuit for {self.name} backend "
+                    f"({self.failure_rate:.0%} of the last {len(self.outcomes)} calls failed)"
+                )
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release_probe(self):
+        """A probe call was cancelled before it finished - let the next call probe instead"""
+        self.probing = False
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q-quantile of recent successful latencies, or None with too few samples"""
+        if len(self.latencies) < self.min_calls:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def describe(self) -> str:
+        p95 = self.percentile(0.95)
+        latency = f", p95 {p95:.1f}s" if p95 is not None else ''
+        return f"{self.name}: {self.state} ({self.failure_rate:.0%} failures of {len(self.outcomes)}{latency})"
+
+
+class BackendHealth:
+    """One circuit breaker per backend"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def __getitem__(self, backend: str) -> CircuitBreaker:
+        if backend not in self.breakers:
+            self.breakers[backend] = CircuitBreaker(backend, **self.settings)
+        return self.breakers[backend]
+
+    def summary(self) -> str:
+        return '\n'.join(breaker.describe() for breaker in self.breakers.values())
@@ -0,0 +1,95 @@
+"""
+Background jobs for long-running button actions (test runs, builds)
+Tracks running and recently finished jobs per user for /jobs
+"""
+
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+
+class BackgroundJob:
+    """A test run or build executing on the job queue"""
+
+    LABELS = {
+        'tests': '🧪 Tests',
+        'impacted_tests': '🧪 Impacted tests',
+        'build': '🔨 Build',
+    }
+
+    def __init__(self, job_id: int, user_id: int, chat_id: int, message_id: int, kind: str, context: str):
+        self.id = job_id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.kind = kind
+        self.context = context
+        self.status = 'running'
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.output = ''  # latest output while running
+        self.result: Optional[dict] = None
+
+    @property
+    def label(self) -> str:
+        return self.LABELS.get(self.kind, self.kind)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def finish(self, result: dict):
+        self.result = result
+        self.finished_at = time.monotonic()
+        if result.get('cancelled'):
+            self.status = 'cancelled'
+        elif result.get('success'):
+            self.status = 'done'
+        else:
+            self.status = 'failed'
+
+    def describe(self) -> str:
+        """One line for /jobs"""
+        icon = {'running': '🔄', 'done': '✅', 'failed': '❌', 'cancelled': '🛑'}[self.status]
+        elapsed = format_duration(self.elapsed)
+        if self.status == 'running':
+            return f"{icon} #{self.id} {self.label} ({self.context}) - running for {elapsed}"
+        age = format_duration(time.monotonic() - self.finished_at)
+        return f"{icon} #{self.id} {self.label} ({self.context}) - {self.status} in {elapsed}, {age} ago"
+
+
+class BackgroundJobs:
+    """Registry of running jobs plus a bounded history of finished ones"""
+
+    def __init__(self, history: int = 20):
+        self._next_id = 1
+        self.running: Dict[int, BackgroundJob] = {}
+        self.recent: Deque[BackgroundJob] = deque(maxlen=history)
+
+    def create(self, user_id: int, chat_id: int, message_id: int, kind: str, context: str) -> BackgroundJob:
+        job = BackgroundJob(self._next_id, user_id, chat_id, message_id, kind, context)
+        self._next_id += 1
+        self.running[job.id] = job
+        return job
+
+    def finish(self, job: BackgroundJob, result: dict):
+        job.finish(result)
+        self.running.pop(job.id, None)
+        self.recent.appendleft(job)
+
+    def for_user(self, user_id: int) -> List[BackgroundJob]:
+        """Running jobs first, then finished ones, newest first"""
+        running = sorted(
+            (job for job in self.running.values() if job.user_id == user_id),
+            key=lambda job: job.id, reverse=True
+        )
+        return running + [job for job in self.recent if job.user_id == user_id]
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
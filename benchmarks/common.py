@@ -0,0 +1,112 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import socket
+from typing import Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (pct in 0-100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max in milliseconds"""
+    return {
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': max(values) * 1000 if values else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(host: str, port: int, timeout: float = 30.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def bot_env(stub_url: str, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Environment for running bot.py / telegram_proxy.py against a stub API"""
+    project_dir = tempfile.mkdtemp(prefix='bench-project-')
+    env = {
+        **os.environ,
+        'TELEGRAM_BOT_TOKEN': '123456:BENCHMARK',
+        'TELEGRAM_API_BASE_URL': stub_url,
+        'AUTH_METHOD': 'api',
+        'ANTHROPIC_API_KEY': 'sk-ant-benchmark',
+        'PROJECT_ROOT': project_dir,
+        'PROJECT_DIR': project_dir,
+        'PYTHONUNBUFFERED': '1',
+    }
+    env.update(extra or {})
+    return env
+
+
+def spawn(script: str, env: Dict[str, str], quiet: bool = True) -> subprocess.Popen:
+    """Start a repo script (bot.py / telegram_proxy.py) as a subprocess"""
+    return subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, script)],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL if quiet else None,
+        stderr=subprocess.DEVNULL if quiet else None,
+    )
+
+
+def stop(process: subprocess.Popen, timeout: float = 10.0):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def install_fake_claude(bin_dir: str) -> str:
+    """Put claude-code and claude wrappers for fake_claude.py into bin_dir"""
+    os.makedirs(bin_dir, exist_ok=True)
+    fake = os.path.join(REPO_ROOT, 'benchmarks', 'fake_claude.py')
+    for name in ('claude-code', 'claude'):
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{fake}" "$@"\n')
+        os.chmod(path, 0o755)
+    return bin_dir
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark for bot.py and telegram_proxy.py
+
+Drives the real handlers with synthetic Update objects. Telegram is replaced
+by the recording stub in fake_telegram.py and Claude by fake_claude.py, so no
+network or model calls are made. For each concurrency level it reports
+requests/second, p50/p95/p99 latency (until every reply for the request was
+delivered), peak RSS and subprocess spawns.
+
+Usage:
+    python benchmarks/e2e_benchmark.py
+    python benchmarks/e2e_benchmark.py --targets bot --levels 1,8,32 --latency-ms 200
+    python benchmarks/e2e_benchmark.py --output-bytes 200000 --stderr-bytes 2000000 --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from common import REPO_ROOT, bot_env, free_port, install_fake_claude, latency_summary, rss_bytes
+from fake_telegram import FakeTelegramServer
+
+sys.path.insert(0, REPO_ROOT)
+
+
+def make_update_dict(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Bench'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': text,
+        }
+    }
+
+
+def prepare_environment(args, stub: FakeTelegramServer) -> str:
+    """Export the env the bot modules read at import time; returns project dir"""
+    bin_dir = install_fake_claude(tempfile.mkdtemp(prefix='bench-bin-'))
+    env = bot_env(stub.base_url, {
+        'AUTH_METHOD': 'cli',
+        'PATH': f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+        'MESSAGE_DEBOUNCE_MS': '0',
+        'MAX_PARALLEL_SESSIONS': str(args.max_parallel or max(args.levels)),
+        'MAX_REQUESTS_PER_MINUTE': '1000000',
+        'RESULT_CACHE_ENABLED': 'false',
+        'FAKE_CLAUDE_LATENCY_MS': str(args.latency_ms),
+        'FAKE_CLAUDE_JITTER_MS': str(args.jitter_ms),
+        'FAKE_CLAUDE_OUTPUT_BYTES': str(args.output_bytes),
+        'FAKE_CLAUDE_STDERR_BYTES': str(args.stderr_bytes),
+        'SLOW_REQUEST_LOG': '',
+    })
+    if not args.telegram_limits:
+        # Measure the bot, not Telegram's flood limits
+        env.update({
+            'TELEGRAM_GLOBAL_RATE': '100000',
+            'TELEGRAM_CHAT_INTERVAL': '0',
+            'TELEGRAM_GROUP_INTERVAL': '0',
+        })
+    os.environ.update(env)
+
+    # A git checkout for the backend context, like a real deployment
+    project_dir = env['PROJECT_ROOT']
+    backend = os.path.join(project_dir, 'transcription-platform')
+    os.makedirs(backend, exist_ok=True)
+    subprocess.run(['git', 'init', '-q', backend], check=False)
+    return project_dir
+
+
+def load_target(name: str):
+    """Instantiate a target; returns (object with .app/.sender, message handler)"""
+    if name == 'bot':
+        import bot
+        instance = bot.TelegramClaudeBot()
+        return instance, instance.handle_message
+    if name == 'proxy':
+        import telegram_proxy
+        instance = telegram_proxy.TelegramClaudeProxy()
+        return instance, instance.handle_message
+    raise ValueError(f"Unknown target: {name}")
+
+
+class Recorder:
+    """Tracks the sender futures queued for each chat"""
+
+    def __init__(self, sender):
+        self.futures = defaultdict(list)
+        submit = sender._submit
+
+        def recording_submit(item):
+            future = submit(item)
+            self.futures[item.chat_id].append(future)
+            return future
+
+        sender._submit = recording_submit
+
+    async def wait_chat(self, chat_id: int) -> list:
+        futures = self.futures.pop(chat_id, [])
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+
+async def sample_rss(state: dict, interval: float = 0.02):
+    while True:
+        state['peak'] = max(state['peak'], rss_bytes())
+        await asyncio.sleep(interval)
+
+
+async def run_level(instance, handler, recorder, level: int, requests: int, prompt: str, id_base: int) -> dict:
+    from telegram import Update
+    from telegram.ext import CallbackContext
+    from metrics import SUBPROCESS_SPAWNS
+
+    app = instance.app
+    semaphore = asyncio.Semaphore(level)
+    latencies, errors = [], 0
+    spawns_before = sum(SUBPROCESS_SPAWNS.snapshot().values())
+    rss = {'peak': rss_bytes()}
+    sampler = asyncio.create_task(sample_rss(rss))
+
+    async def one(i: int):
+        nonlocal errors
+        chat_id = id_base + i
+        async with semaphore:
+            update = Update.de_json(make_update_dict(chat_id, chat_id, prompt), app.bot)
+            context = CallbackContext.from_update(update, app)
+            started = time.perf_counter()
+            try:
+                await handler(update, context)
+                results = await recorder.wait_chat(chat_id)
+                if not results or any(isinstance(r, BaseException) for r in results):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+
+    return {
+        'concurrency': level,
+        'requests': requests,
+        'errors': errors,
+        'rps': requests / elapsed if elapsed else 0.0,
+        'latency': latency_summary(latencies),
+        'peak_rss_mb': rss['peak'] / 1024 / 1024,
+        'subprocess_spawns': sum(SUBPROCESS_SPAWNS.snapshot().values()) - spawns_before,
+    }
+
+
+async def run_target(name: str, args) -> list:
+    instance, handler = load_target(name)
+    await instance.app.initialize()
+    recorder = Recorder(instance.sender)
+    results = []
+
+    try:
+        for index, level in enumerate(args.levels):
+            # Proxy prints every exchange to the console - keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = await run_level(
+                    instance, handler, recorder, level, args.requests, args.prompt,
+                    id_base=(index + 1) * 1_000_000
+                )
+            result['target'] = name
+            results.append(result)
+            if not args.json:
+                print_row(result)
+    finally:
+        await instance.sender.stop()
+        await instance.app.shutdown()
+
+    return results
+
+
+def print_header():
+    print(f"{'target':<7} {'conc':>5} {'req':>5} {'err':>4} {'req/s':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS':>9} {'spawns':>7}")
+
+
+def print_row(r: dict):
+    lat = r['latency']
+    print(f"{r['target']:<7} {r['concurrency']:>5} {r['requests']:>5} {r['errors']:>4} {r['rps']:>8.2f} "
+          f"{lat['p50_ms']:>9.1f} {lat['p95_ms']:>9.1f} {lat['p99_ms']:>9.1f} "
+          f"{r['peak_rss_mb']:>7.1f}MB {r['subprocess_spawns']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', default='bot,proxy', help="Comma-separated: bot, proxy")
+    parser.add_argument('--levels', default='1,4,16', help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=40, help="Requests per concurrency level")
+    parser.add_argument('--prompt', default="Explain how the authentication flow works")
+    parser.add_argument('--latency-ms', type=float, default=500, help="Fake Claude run time")
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--output-bytes', type=int, default=2000, help="Fake Claude stdout size")
+    parser.add_argument('--stderr-bytes', type=int, default=0, help="Fake Claude verbose stderr size")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Stub Bot API latency (s)")
+    parser.add_argument('--max-parallel', type=int, default=0,
+                        help="MAX_PARALLEL_SESSIONS for bot.py (default: highest level)")
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help="Keep the real per-chat/global Telegram pacing")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    args.levels = [int(x) for x in args.levels.split(',') if x]
+
+    stub = FakeTelegramServer(port=free_port(), latency=args.api_latency).start()
+    try:
+        prepare_environment(args, stub)
+        # Module-level logging config in bot.py/telegram_proxy.py is INFO; keep the report quiet
+        logging.disable(logging.INFO)
+
+        if not args.json:
+            print_header()
+        results = []
+        for name in args.targets.split(','):
+            results.extend(asyncio.run(run_target(name.strip(), args)))
+
+        if args.json:
+            print(json.dumps(results, indent=2))
+        return 1 if any(r['errors'] for r in results) else 0
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
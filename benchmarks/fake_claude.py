@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Scriptable stand-in for the claude-code / claude CLI
+
+Behaviour is controlled through environment variables:
+    FAKE_CLAUDE_LATENCY_MS   base run time (default 500)
+    FAKE_CLAUDE_JITTER_MS    uniform +/- jitter (default 0)
+    FAKE_CLAUDE_OUTPUT_BYTES size of the response (default 2000)
+    FAKE_CLAUDE_STDERR_BYTES verbose output written to stderr (default 0)
+    FAKE_CLAUDE_EXIT_CODE    exit status (default 0)
+    FAKE_CLAUDE_LOG          optional file; one line is appended per invocation
+    FAKE_CLAUDE_VERSION_LATENCY_MS  how long `--version` takes (default 0)
+    FAKE_CLAUDE_PROFILE      JSON file of recorded runs ({"samples": [[latency_s, output_bytes,
+                             success], ...]}); each invocation replays a random sample and
+                             overrides latency, output size and exit code
+    FAKE_CLAUDE_LATENCY_SCALE multiplier for profile latencies (default 1)
+
+Prompts are accepted on stdin (bot CLI mode) or as the last argument
+(proxy --print mode). With --output-format stream-json the response is written
+as stream-json events (init, assistant message, result), like the real CLI.
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+LINE = "The quick brown fox jumps over the lazy dog while the tests keep passing.\n"
+
+
+def _payload(size: int, prefix: str) -> str:
+    if size <= 0:
+        return ''
+    text = prefix + LINE * (size // len(LINE) + 1)
+    return text[:size]
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    if '--version' in args:
+        time.sleep(float(os.getenv('FAKE_CLAUDE_VERSION_LATENCY_MS', '0')) / 1000)
+        print("1.0.0 (Claude Code)")
+        return 0
+
+    if '--print' not in args and not sys.stdin.isatty():
+        sys.stdin.read()
+
+    log_path = os.getenv('FAKE_CLAUDE_LOG')
+    if log_path:
+        with open(log_path, 'a') as f:
+            f.write(f"{time.time()} {os.getpid()}\n")
+
+    latency = float(os.getenv('FAKE_CLAUDE_LATENCY_MS', '500'))
+    jitter = float(os.getenv('FAKE_CLAUDE_JITTER_MS', '0'))
+    delay = max(0.0, latency + random.uniform(-jitter, jitter)) / 1000
+    output_bytes = int(os.getenv('FAKE_CLAUDE_OUTPUT_BYTES', '2000'))
+    exit_code = int(os.getenv('FAKE_CLAUDE_EXIT_CODE', '0'))
+
+    profile = os.getenv('FAKE_CLAUDE_PROFILE')
+    if profile:
+        with open(profile) as f:
+            samples = json.load(f)['samples']
+        if samples:
+            latency_s, output_bytes, success = random.choice(samples)
+            delay = latency_s * float(os.getenv('FAKE_CLAUDE_LATENCY_SCALE', '1'))
+            exit_code = 0 if success else 1
+
+    stderr_bytes = int(os.getenv('FAKE_CLAUDE_STDERR_BYTES', '0'))
+    if stderr_bytes:
+        sys.stderr.write(_payload(stderr_bytes, "[verbose] tool call trace\n"))
+        sys.stderr.flush()
+
+    streaming = 'stream-json' in args
+    if streaming:
+        _event({'type': 'system', 'subtype': 'init'})
+
+    time.sleep(delay)
+
+    text = _payload(int(output_bytes), "Here is what I found:\n")
+    if streaming:
+        _event({'type': 'assistant', 'message': {'role': 'assistant', 'content': [{'type': 'text', 'text': text}]}})
+        _event({'type': 'result', 'subtype': 'success', 'is_error': exit_code != 0, 'result': text})
+    else:
+        sys.stdout.write(text)
+    sys.stdout.flush()
+    return exit_code
+
+
+def _event(event: dict):
+    sys.stdout.write(json.dumps(event) + '\n')
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
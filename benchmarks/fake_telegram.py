@@ -0,0 +1,172 @@
+"""
+Minimal stand-in for the Telegram Bot API
+Records every call so benchmarks can run without touching Telegram
+
+Point the bot at it with TELEGRAM_API_BASE_URL=http://127.0.0.1:<port>
+"""
+
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+BOT_USER = {'id': 1000, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+
+
+class FakeTelegramServer:
+    """Threaded HTTP server answering Bot API methods with canned results"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency  # simulated Bot API round trip (seconds)
+        self.calls: List[dict] = []
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._message_id = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server._handle(self)
+
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def count(self, method: str) -> int:
+        with self._lock:
+            return sum(1 for c in self.calls if c['method'] == method)
+
+    def wait_for(self, method: str, count: int, timeout: float) -> bool:
+        """Block until `count` calls of `method` were recorded"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while sum(1 for c in self.calls if c['method'] == method) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+    # Request handling -------------------------------------------------
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        # Path: /bot<token>/<method>
+        method = request.path.rstrip('/').split('/')[-1].split('?')[0]
+        params = self._parse_params(request)
+        received = time.monotonic()
+
+        if method == 'getUpdates':
+            # Webhook-only stub: behave like an idle long poll
+            time.sleep(min(float(params.get('timeout', 0) or 0), 1.0))
+        elif self.latency:
+            time.sleep(self.latency)
+
+        result = self._result_for(method, params)
+
+        with self._cond:
+            self.calls.append({'method': method, 'params': params, 'time': received})
+            self._cond.notify_all()
+
+        body = json.dumps({'ok': True, 'result': result}).encode()
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        try:
+            request.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away (e.g. the bot was stopped mid long-poll)
+            pass
+
+    @staticmethod
+    def _parse_params(request: BaseHTTPRequestHandler) -> Dict[str, str]:
+        length = int(request.headers.get('Content-Length', 0) or 0)
+        raw = request.rfile.read(length) if length else b''
+        content_type = request.headers.get('Content-Type', '')
+
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser(policy=HTTP).parsebytes(
+                b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + raw
+            )
+            params = {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                payload = part.get_payload(decode=True) or b''
+                params[name] = payload if part.get_filename() else payload.decode('utf-8', 'replace')
+            return params
+
+        if content_type.startswith('application/json'):
+            return json.loads(raw or b'{}')
+
+        return {k: v[0] for k, v in parse_qs(raw.decode('utf-8')).items()}
+
+    def _result_for(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            return []
+        if method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            with self._lock:
+                self._message_id += 1
+                message_id = int(params.get('message_id', self._message_id))
+            chat_id = int(params.get('chat_id', 0))
+            message = {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+                'from': BOT_USER,
+            }
+            if 'text' in params:
+                message['text'] = params['text']
+            return message
+        # setWebhook, deleteWebhook, sendChatAction, answerCallbackQuery, ...
+        return True
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a stub Telegram Bot API server")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="Simulated API latency (s)")
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(port=args.port, latency=args.latency).start()
+    print(f"Fake Telegram Bot API on {server.base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
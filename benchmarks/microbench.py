@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the per-response text-processing paths
+
+Times SecurityFilter.sanitize, _parse_claude_response, _extract_files_changed,
+_extract_test_results, _extract_clean_response and _format_response over the
+generated corpus (diffs, pytest/Jest logs, verbose tool traces; 1KB-10MB).
+
+Results are normalised by a fixed CPU calibration loop so a baseline recorded
+on one machine remains usable on another.
+
+Usage:
+    python benchmarks/microbench.py                               # print timings
+    python benchmarks/microbench.py --compare                     # regression gate vs benchmarks/baseline.json
+    python benchmarks/microbench.py --save benchmarks/baseline.json   # re-record the committed baseline
+    python benchmarks/microbench.py --compare other.json          # ... or against another one
+    python benchmarks/microbench.py --quick --paths sanitize,parse
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import REPO_ROOT
+import corpus
+
+sys.path.insert(0, REPO_ROOT)
+
+PATHS = ['sanitize', 'parse', 'files_changed', 'test_results', 'clean_response', 'format_response']
+
+
+def calibrate(repeat: int = 5) -> float:
+    """Seconds for a fixed string/regex workload (min of repeats)"""
+    text = 'abc def 123 ' * 20000
+    pattern = re.compile(r'(\w+)\s+(\d+)')
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        pattern.findall(text)
+        text.lower().split()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure(func, repeat: int, min_time: float = 0.05) -> float:
+    """Best per-call time: loops are grown until one repeat takes min_time"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 1000:
+            break
+        loops *= 10
+
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        best = min(best, (time.perf_counter() - started) / loops)
+    return best
+
+
+def load_targets():
+    """Import the code under test with a harmless environment"""
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:BENCHMARK')
+    os.environ.setdefault('AUTH_METHOD', 'api')
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'sk-ant-benchmark')
+
+    from auth import SecurityFilter
+    from claude_code_bridge import ClaudeCodeBridge
+    import bot
+    import telegram_proxy
+
+    return SecurityFilter, ClaudeCodeBridge(), bot.TelegramClaudeBot(), telegram_proxy.TelegramClaudeProxy()
+
+
+def make_repo() -> str:
+    """Small git checkout so the git diff inside the parser behaves as in production"""
+    repo = tempfile.mkdtemp(prefix='microbench-repo-')
+    subprocess.run(['git', 'init', '-q', repo], check=False)
+    return repo
+
+
+def build_cases(paths, kinds, sizes, targets, repo):
+    security, bridge, bot_instance, proxy = targets
+    cases = []
+    for kind in kinds:
+        for size_name in sizes:
+            text = corpus.generate(kind, corpus.SIZES[size_name])
+            result = bridge._parse_output(text, repo)
+            funcs = {
+                'sanitize': lambda t=text: security.sanitize(t),
+                'parse': lambda t=text: bridge._parse_claude_response(t, repo),
+                'files_changed': lambda t=text: bridge._extract_files_changed(t, repo),
+                'test_results': lambda t=text: bridge._extract_test_results(t),
+                'clean_response': lambda t=text: proxy._extract_clean_response(t),
+                'format_response': lambda r=result: bot_instance._format_response(r),
+            }
+            for path in paths:
+                cases.append((f"{path}/{kind}/{size_name}", funcs[path]))
+    return cases
+
+
+# Committed baseline --compare uses when no file is given
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def compare(current: dict, baseline: dict, tolerance: float, noise_floor: float = 20e-6) -> list:
+    """Cases whose calibrated time grew by more than tolerance (and by more than noise_floor seconds)"""
+    regressions = []
+    for name, seconds in current['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            continue
+        ratio = (seconds / current['calibration']) / (base / baseline['calibration'])
+        if ratio > 1 + tolerance and seconds - base > noise_floor:
+            regressions.append((name, base, seconds, ratio))
+    return regressions
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:8.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:8.2f} ms"
+    return f"{seconds:8.2f} s "
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--paths', default=','.join(PATHS), help=f"Comma-separated subset of: {', '.join(PATHS)}")
+    parser.add_argument('--kinds', default=','.join(corpus.kinds()), help="Corpus kinds")
+    parser.add_argument('--sizes', default=','.join(corpus.SIZES), help="Corpus sizes")
+    parser.add_argument('--quick', action='store_true', help="Only sizes up to 100KB")
+    parser.add_argument('--repeat', type=int, default=5, help="Repeats per case (best is kept)")
+    parser.add_argument('--save', metavar='FILE', help="Write results as a baseline")
+    parser.add_argument('--compare', metavar='FILE', nargs='?', const=BASELINE,
+                        help="Fail if slower than this baseline (default: the committed benchmarks/baseline.json)")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    paths = [p for p in args.paths.split(',') if p]
+    unknown = set(paths) - set(PATHS)
+    if unknown:
+        parser.error(f"unknown paths: {', '.join(sorted(unknown))}")
+
+    sizes = [s for s in args.sizes.split(',') if s]
+    if args.quick:
+        sizes = [s for s in sizes if corpus.SIZES[s] <= 100 * corpus.KB]
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    targets = load_targets()
+    repo = make_repo()
+    cases = build_cases(paths, args.kinds.split(','), sizes, targets, repo)
+
+    results = {'calibration': calibrate(), 'cases': {}}
+    for name, func in cases:
+        seconds = measure(func, args.repeat)
+        results['cases'][name] = seconds
+        print(f"{name:<40} {format_seconds(seconds)}", flush=True)
+        # Best of readings spread over the run, like the best-of-repeats case times:
+        # one reading at the start depends on how busy the machine was just then
+        results['calibration'] = min(results['calibration'], calibrate(repeat=2))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for name, base, seconds, ratio in regressions:
+                print(f"  {name:<40} {format_seconds(base)} -> {format_seconds(seconds)} ({ratio:.2f}x)")
+            return 1
+        print(f"\n✅ No regressions beyond {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
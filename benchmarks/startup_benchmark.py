@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark: time from process start to the first getUpdates poll
+
+Launches bot.py (or telegram_proxy.py) in polling mode against the stub Bot
+API with the fake Claude CLI on PATH, and measures how long it takes until
+the bot first polls for updates. Runs are repeated with a cold capability
+cache (probe on startup) and a warm one (probe result reused).
+
+Usage:
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --target telegram_proxy.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import REPO_ROOT, bot_env, free_port, install_fake_claude, latency_summary, spawn, stop
+from fake_telegram import FakeTelegramServer
+
+
+def time_to_first_poll(target: str, env: dict, stub: FakeTelegramServer, timeout: float) -> float:
+    stub.reset()
+    started = time.monotonic()
+    process = spawn(target, env)
+    try:
+        if not stub.wait_for('getUpdates', 1, timeout=timeout):
+            raise RuntimeError(f"{target} did not poll within {timeout}s")
+        first = next(c['time'] for c in stub.calls if c['method'] == 'getUpdates')
+        return first - started
+    finally:
+        stop(process)
+
+
+def time_to_import(target: str, env: dict) -> float:
+    """Interpreter start plus module import, without running main()"""
+    module = os.path.splitext(target)[0]
+    started = time.monotonic()
+    subprocess.run([sys.executable, '-c', f"import {module}"], cwd=REPO_ROOT, env=env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', default='bot.py', help="bot.py or telegram_proxy.py")
+    parser.add_argument('--runs', type=int, default=5, help="Runs per cache state")
+    parser.add_argument('--cli-latency-ms', type=float, default=300,
+                        help="How long the fake `claude-code --version` takes")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='startup-bench-')
+    cache_path = os.path.join(work_dir, 'capabilities.json')
+    bin_dir = install_fake_claude(os.path.join(work_dir, 'bin'))
+    stub = FakeTelegramServer(port=free_port()).start()
+
+    try:
+        env = bot_env(stub.base_url, {
+            'AUTH_METHOD': 'auto',
+            'PATH': f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            'CAPABILITY_CACHE_PATH': cache_path,
+            'FAKE_CLAUDE_VERSION_LATENCY_MS': str(args.cli_latency_ms),
+            'LOG_FILE': os.path.join(work_dir, 'bot.log'),
+        })
+
+        results = {'target': args.target, 'import': [], 'cold': [], 'warm': []}
+        for _ in range(args.runs):
+            results['import'].append(time_to_import(args.target, env))
+        for state in ('cold', 'warm'):
+            for _ in range(args.runs):
+                if state == 'cold' and os.path.exists(cache_path):
+                    os.remove(cache_path)
+                results[state].append(time_to_first_poll(args.target, env, stub, args.timeout))
+
+        summary = {
+            'target': args.target,
+            **{key: latency_summary(results[key]) for key in ('import', 'cold', 'warm')},
+        }
+        if args.json:
+            print(json.dumps(summary, indent=2))
+        else:
+            print(f"Target: {args.target} ({args.runs} runs each, fake --version {args.cli_latency_ms:.0f} ms)")
+            labels = {
+                'import': 'Module import',
+                'cold': 'First poll (cold cache)',
+                'warm': 'First poll (warm cache)',
+            }
+            for key, label in labels.items():
+                s = summary[key]
+                print(f"  {label:<26} p50 {s['p50_ms']:7.0f} ms   max {s['max_ms']:7.0f} ms")
+        return 0
+
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded production traffic file against a local build
+
+The recording (TRAFFIC_RECORD_PATH, see traffic_recorder.py) holds anonymized
+updates with their arrival times plus the latency and output size of every
+Claude run. The replay:
+
+  * starts the stub Bot API and launches the bot in webhook mode,
+  * points it at fake_claude.py, which draws each run from the recorded
+    latency/output-size samples,
+  * POSTs the updates on their original schedule divided by --speedup,
+  * waits for outbound traffic to settle and reports scheduling lag, webhook
+    latency and (via the bot's /metrics endpoint) per-stage timings.
+
+Try concurrency settings before deploying them:
+    python benchmarks/traffic_replay.py traffic.jsonl --speedup 120
+    python benchmarks/traffic_replay.py traffic.jsonl --speedup 120 --env MAX_PARALLEL_SESSIONS=6 --env UPDATE_WORKERS=8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from common import bot_env, free_port, install_fake_claude, latency_summary, spawn, stop, wait_for_port
+from fake_telegram import FakeTelegramServer
+
+
+def load_recording(path: str) -> tuple:
+    """(updates as [(offset_s, update)], backend samples as [[latency_s, output_bytes, success]])"""
+    updates, samples = [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event.get('type') == 'update':
+                updates.append((event['t'], event['update']))
+            elif event.get('type') == 'backend':
+                samples.append([event['latency'], event['output_bytes'], event.get('success', True)])
+
+    updates.sort(key=lambda item: item[0])
+    start = updates[0][0] if updates else 0
+    return [(t - start, update) for t, update in updates], samples
+
+
+async def replay(url: str, secret: str, updates: list, speedup: float) -> tuple:
+    """POST every update at its (compressed) offset; returns (lags, latencies, errors)"""
+    lags, latencies, errors = [], [], []
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+
+    async def post(client: httpx.AsyncClient, update: dict):
+        started = time.perf_counter()
+        try:
+            response = await client.post(url, json=update, headers=headers)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        tasks = []
+        origin = time.perf_counter()
+        for update_id, (offset, update) in enumerate(updates, start=1):
+            due = origin + offset / speedup
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lags.append(max(0.0, time.perf_counter() - due))
+            tasks.append(asyncio.create_task(post(client, {**update, 'update_id': update_id})))
+        await asyncio.gather(*tasks)
+
+    return lags, latencies, errors
+
+
+def wait_for_settle(stub: FakeTelegramServer, quiet: float, timeout: float) -> bool:
+    """Wait until the bot has made no Bot API call for `quiet` seconds"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        last = stub.calls[-1]['time'] if stub.calls else 0
+        if time.monotonic() - last >= quiet:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def scrape_stages(port: int) -> dict:
+    """count/avg/p95 per stage from the bot's Prometheus endpoint"""
+    try:
+        text = httpx.get(f"http://127.0.0.1:{port}/metrics", timeout=5).text
+    except httpx.HTTPError:
+        return {}
+
+    buckets, sums, counts = {}, {}, {}
+    for line in text.splitlines():
+        match = re.match(r'telegram_claude_stage_seconds_(bucket|sum|count)\{stage="([^"]+)"(?:,le="([^"]+)")?\} (\S+)', line)
+        if not match:
+            continue
+        kind, stage, le, value = match.groups()
+        if kind == 'bucket':
+            buckets.setdefault(stage, []).append((float(le), float(value)))
+        elif kind == 'sum':
+            sums[stage] = float(value)
+        else:
+            counts[stage] = float(value)
+
+    stages = {}
+    for stage, count in counts.items():
+        if not count:
+            continue
+        p95 = next((le for le, cumulative in buckets.get(stage, []) if cumulative >= 0.95 * count), None)
+        stages[stage] = {'count': int(count), 'avg_ms': sums[stage] / count * 1000, 'p95_le_ms': p95 * 1000 if p95 else None}
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording', help="JSONL file written with TRAFFIC_RECORD_PATH")
+    parser.add_argument('--target', default='bot.py', help="Script to launch (bot.py or telegram_proxy.py)")
+    parser.add_argument('--speedup', type=float, default=60.0, help="Time-compression factor for arrivals")
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help="Multiplier for recorded backend latencies (1 = as recorded)")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="Extra environment for the bot (e.g. MAX_PARALLEL_SESSIONS=6); repeatable")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Stub Bot API latency (s)")
+    parser.add_argument('--limit', type=int, default=0, help="Replay only the first N updates")
+    parser.add_argument('--settle', type=float, default=5.0, help="Quiet period that ends the run (s)")
+    parser.add_argument('--timeout', type=float, default=1800.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    updates, samples = load_recording(args.recording)
+    if args.limit:
+        updates = updates[:args.limit]
+    if not updates:
+        print("❌ Recording contains no updates", file=sys.stderr)
+        return 1
+
+    work_dir = tempfile.mkdtemp(prefix='traffic-replay-')
+    profile = os.path.join(work_dir, 'profile.json')
+    with open(profile, 'w') as f:
+        json.dump({'samples': samples}, f)
+
+    webhook_port, metrics_port = free_port(), free_port()
+    secret = 'replay-secret'
+    stub = FakeTelegramServer(port=free_port(), latency=args.api_latency).start()
+    process = None
+
+    try:
+        bin_dir = install_fake_claude(os.path.join(work_dir, 'bin'))
+        env = bot_env(stub.base_url, {
+            'AUTH_METHOD': 'cli',
+            'PATH': f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            'FAKE_CLAUDE_PROFILE': profile,
+            'FAKE_CLAUDE_LATENCY_SCALE': str(args.latency_scale),
+            'WEBHOOK_URL': f"http://127.0.0.1:{webhook_port}",
+            'WEBHOOK_PORT': str(webhook_port),
+            'WEBHOOK_SECRET': secret,
+            'METRICS_PORT': str(metrics_port),
+            'MAX_REQUESTS_PER_MINUTE': '1000000',
+            # Compress the debounce window with the arrivals, or every user's messages get merged
+            'MESSAGE_DEBOUNCE_MS': str(int(float(os.environ.get('MESSAGE_DEBOUNCE_MS', '1000')) / args.speedup)),
+            'TRAFFIC_RECORD_PATH': '',
+            'LOG_FILE': os.path.join(work_dir, 'bot.log'),
+        })
+        subprocess.run(['git', 'init', '-q', os.path.join(env['PROJECT_ROOT'], 'transcription-platform')], check=False)
+        for item in args.env:
+            key, _, value = item.partition('=')
+            env[key] = value
+
+        process = spawn(args.target, env)
+        if not stub.wait_for('setWebhook', 1, timeout=30) or not wait_for_port('127.0.0.1', webhook_port):
+            print(f"❌ {args.target} did not start its webhook listener", file=sys.stderr)
+            return 1
+
+        span = updates[-1][0]
+        if not args.json:
+            print(f"Replaying {len(updates)} updates spanning {span / 60:.1f} min "
+                  f"in ~{span / args.speedup / 60:.1f} min ({len(samples)} backend samples)")
+
+        started = time.perf_counter()
+        lags, latencies, errors = asyncio.run(
+            replay(f"http://127.0.0.1:{webhook_port}/telegram", secret, updates, args.speedup)
+        )
+        settled = wait_for_settle(stub, args.settle, args.timeout)
+        elapsed = time.perf_counter() - started - (args.settle if settled else 0)
+
+        result = {
+            'target': args.target,
+            'updates': len(updates),
+            'recorded_span_s': span,
+            'speedup': args.speedup,
+            'elapsed_s': elapsed,
+            'errors': len(errors),
+            'settled': settled,
+            'schedule_lag': latency_summary(lags),
+            'webhook_latency': latency_summary(latencies),
+            'bot_api_calls': len(stub.calls),
+            'stages': scrape_stages(metrics_port),
+        }
+
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            lag, hook = result['schedule_lag'], result['webhook_latency']
+            print(f"Finished in {elapsed:.1f}s, {len(errors)} webhook errors"
+                  f"{'' if settled else ' (timed out before traffic settled)'}")
+            print(f"Schedule lag:    p95 {lag['p95_ms']:.1f} ms, max {lag['max_ms']:.1f} ms")
+            print(f"Webhook latency: p50 {hook['p50_ms']:.1f} ms, p95 {hook['p95_ms']:.1f} ms, p99 {hook['p99_ms']:.1f} ms")
+            print(f"Bot API calls:   {result['bot_api_calls']}")
+            for stage, stats in sorted(result['stages'].items()):
+                p95 = f"≤{stats['p95_le_ms']:.0f}ms" if stats['p95_le_ms'] is not None else ">max"
+                print(f"  {stage:<20} n={stats['count']:<6} avg={stats['avg_ms']:.0f}ms p95{p95}")
+        return 0 if settled and not errors else 1
+
+    finally:
+        if process:
+            stop(process)
+        stub.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
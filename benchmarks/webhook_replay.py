@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Webhook throughput harness
+
+Starts a stub Telegram Bot API, launches bot.py (or telegram_proxy.py) in
+webhook mode against it, then POSTs recorded Update JSON to the webhook
+listener and reports ingest and end-to-end throughput.
+
+Usage:
+    python benchmarks/webhook_replay.py --requests 500 --concurrency 20
+    python benchmarks/webhook_replay.py --target telegram_proxy.py --workers 8
+    python benchmarks/webhook_replay.py --no-spawn --webhook-port 8443   # bot already running
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+from common import REPO_ROOT, bot_env, free_port, latency_summary, spawn, stop, wait_for_port
+from fake_telegram import FakeTelegramServer
+
+DEFAULT_UPDATES = os.path.join(REPO_ROOT, 'benchmarks', 'updates', 'sample_updates.jsonl')
+
+
+def load_updates(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def post_updates(url: str, secret: str, updates: list, total: int, concurrency: int) -> tuple:
+    """POST `total` updates (cycling through the recording); returns (latencies, errors)"""
+    latencies, errors = [], []
+    counter = iter(range(total))
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+
+    async def worker(client: httpx.AsyncClient):
+        for i in counter:
+            update = dict(updates[i % len(updates)])
+            update['update_id'] = i + 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json=update, headers=headers)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', default=DEFAULT_UPDATES, help="JSONL file of recorded Update objects")
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--target', default='bot.py', help="Script to launch (bot.py or telegram_proxy.py)")
+    parser.add_argument('--no-spawn', action='store_true', help="Post to an already running bot")
+    parser.add_argument('--webhook-port', type=int, default=0)
+    parser.add_argument('--webhook-path', default='telegram')
+    parser.add_argument('--secret', default='benchmark-secret')
+    parser.add_argument('--workers', type=int, default=4, help="UPDATE_WORKERS for the spawned bot")
+    parser.add_argument('--queue-size', type=int, default=0, help="UPDATE_QUEUE_SIZE for the spawned bot")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Stub Bot API latency (s)")
+    parser.add_argument('--replies-per-update', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--json', action='store_true', help="Print machine-readable result")
+    args = parser.parse_args()
+
+    webhook_port = args.webhook_port or free_port()
+    stub = FakeTelegramServer(port=free_port(), latency=args.api_latency).start()
+    process = None
+
+    try:
+        if not args.no_spawn:
+            env = bot_env(stub.base_url, {
+                'WEBHOOK_URL': f"http://127.0.0.1:{webhook_port}",
+                'WEBHOOK_LISTEN': '127.0.0.1',
+                'WEBHOOK_PORT': str(webhook_port),
+                'WEBHOOK_PATH': args.webhook_path,
+                'WEBHOOK_SECRET': args.secret,
+                'UPDATE_WORKERS': str(args.workers),
+                'UPDATE_QUEUE_SIZE': str(args.queue_size),
+            })
+            process = spawn(args.target, env)
+            if not stub.wait_for('setWebhook', 1, timeout=30) or not wait_for_port('127.0.0.1', webhook_port):
+                print(f"❌ {args.target} did not start its webhook listener", file=sys.stderr)
+                return 1
+
+        updates = load_updates(args.updates)
+        url = f"http://127.0.0.1:{webhook_port}/{args.webhook_path.strip('/')}"
+        baseline_replies = stub.count('sendMessage')
+
+        started = time.perf_counter()
+        latencies, errors = asyncio.run(
+            post_updates(url, args.secret, updates, args.requests, args.concurrency)
+        )
+        ingest_elapsed = time.perf_counter() - started
+
+        expected = baseline_replies + (args.requests - len(errors)) * args.replies_per_update
+        completed = stub.wait_for('sendMessage', expected, timeout=args.timeout)
+        e2e_elapsed = time.perf_counter() - started
+
+        result = {
+            'target': args.target,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'workers': args.workers,
+            'errors': len(errors),
+            'ingest_rps': args.requests / ingest_elapsed if ingest_elapsed else 0.0,
+            'post_latency': latency_summary(latencies),
+            'replies': stub.count('sendMessage') - baseline_replies,
+            'all_replied': completed,
+            'end_to_end_rps': args.requests / e2e_elapsed if e2e_elapsed else 0.0,
+        }
+
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            post = result['post_latency']
+            print(f"Target:          {args.target} (workers={args.workers})")
+            print(f"Requests:        {args.requests} @ concurrency {args.concurrency}, errors {len(errors)}")
+            print(f"Ingest:          {result['ingest_rps']:.1f} req/s "
+                  f"(p50 {post['p50_ms']:.1f} ms, p95 {post['p95_ms']:.1f} ms, p99 {post['p99_ms']:.1f} ms)")
+            print(f"End-to-end:      {result['end_to_end_rps']:.1f} req/s, "
+                  f"{result['replies']} replies{'' if completed else ' (timed out waiting for replies)'}")
+        return 0 if completed and not errors else 1
+
+    finally:
+        if process:
+            stop(process)
+        stub.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,27 +5,49 @@ Provides vibe coding interface via Telegram
 
 import logging
 import asyncio
+import os
+import gzip
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import MessageLimit
 from telegram.ext import (
-    Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ContextTypes,
+    TypeHandler,
     filters
 )
 
 from config import config
 from auth import auth, security
 from claude_code_bridge import bridge
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, config.LOG_LEVEL)
+from telegram_sender import TelegramSender
+from serving import build_application, run_application
+from metrics import metrics, STAGE_SECONDS, SUBPROCESS_SPAWNS
+from tracing import tracer
+from traffic_recorder import recorder
+from background_jobs import BackgroundJobs, format_duration
+from model_router import router, TIERS
+from output_store import outputs
+from impact_analysis import impact
+from log_pipeline import setup_logging, process_log_file
+from transcript_archive import archive
+import shared_state
+
+# Configure logging (each sharded worker writes its own LOG_FILE)
+setup_logging(
+    level=config.LOG_LEVEL,
+    log_file=process_log_file(
+        config.LOG_FILE, f"worker{os.environ['WORKER_INDEX']}" if 'WORKER_INDEX' in os.environ else None
+    ),
+    max_bytes=config.LOG_MAX_BYTES,
+    backup_count=config.LOG_BACKUP_COUNT,
+    max_chars=config.LOG_MAX_CHARS,
+    queue_size=config.LOG_QUEUE_SIZE
 )
 logger = logging.getLogger(__name__)
 
@@ -33,8 +55,37 @@ logger = logging.getLogger(__name__)
 class TelegramClaudeBot:
     """Main Telegram bot for Claude Code vibe coding"""
 
+    # Live output shown while a run is in progress
+    PROGRESS_EDIT_INTERVAL = 5.0
+    PROGRESS_TAIL_CHARS = 500
+    # How often background test/build jobs refresh their message
+    BACKGROUND_PROGRESS_INTERVAL = 15.0
+    # Replaces the progress message when the executor result was sent by deliver_finished_jobs()
+    DELIVERED_ELSEWHERE = "📬 The result was sent in a separate message."
+    # Full outputs above this are sent gzipped (bot uploads are capped at 50MB)
+    FULL_OUTPUT_GZIP_BYTES = 10 * 1024 * 1024
+
     def __init__(self):
-        self.app = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+        self.app = build_application(
+            config.TELEGRAM_BOT_TOKEN,
+            workers=config.UPDATE_WORKERS,
+            update_queue_size=config.UPDATE_QUEUE_SIZE,
+            base_url=config.TELEGRAM_API_BASE_URL
+        )
+        self.sender = TelegramSender(
+            self.app.bot,
+            global_per_second=config.TELEGRAM_GLOBAL_RATE,
+            chat_interval=config.TELEGRAM_CHAT_INTERVAL,
+            group_interval=config.TELEGRAM_GROUP_INTERVAL
+        )
+        # (chat_id, user_id) -> messages collected during the debounce window
+        self._pending_batches: Dict[tuple, dict] = {}
+        # Test runs and builds started from buttons (/jobs)
+        self.background = BackgroundJobs()
+        metrics.gauge(
+            'telegram_claude_outbound_queue_depth', 'Telegram calls waiting to be sent',
+            self.sender.queue_depth
+        )
         self.setup_handlers()
 
     def setup_handlers(self):
@@ -47,19 +98,26 @@ class TelegramClaudeBot:
         self.app.add_handler(CommandHandler("context", self.cmd_context))
         self.app.add_handler(CommandHandler("cancel", self.cmd_cancel))
         self.app.add_handler(CommandHandler("sessions", self.cmd_sessions))
+        self.app.add_handler(CommandHandler("jobs", self.cmd_jobs))
+        self.app.add_handler(CommandHandler("model", self.cmd_model))
+        self.app.add_handler(CommandHandler("search", self.cmd_search))
+        self.app.add_handler(CommandHandler("metrics", self.cmd_metrics))
+
+        # Long-running handlers don't block the update queue,
+        # so /cancel and the Cancel button are processed mid-run
 
         # Text messages (coding requests)
         self.app.add_handler(
-            MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message)
+            MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message, block=False)
         )
 
         # Voice messages (using Telegram's built-in transcription)
         self.app.add_handler(
-            MessageHandler(filters.VOICE, self.handle_voice)
+            MessageHandler(filters.VOICE, self.handle_voice, block=False)
         )
 
         # Callback queries (button presses)
-        self.app.add_handler(CallbackQueryHandler(self.handle_callback))
+        self.app.add_handler(CallbackQueryHandler(self.handle_callback, block=False))
 
         # Error handler
         self.app.add_error_handler(self.error_handler)
@@ -68,7 +126,8 @@ class TelegramClaudeBot:
         """Handle /start command"""
 
         if not auth.is_authorized(update):
-            await update.message.reply_text(
+            self._reply(
+                update,
                 "❌ You are not authorized to use this bot.\n"
                 f"Your Telegram ID: {update.effective_user.id}"
             )
@@ -83,6 +142,9 @@ I'm your AI coding assistant powered by Claude!
 /status - Check project status
 /context backend|frontend|root - Switch working context
 /sessions - View active sessions
+/jobs - Running and recent test/build jobs
+/model auto|fast|standard|strong - Pick the API model tier
+/search <terms> - Find answers you already got
 /cancel - Cancel current operation
 /help - Show this help
 
@@ -100,7 +162,7 @@ Just send a voice message with your request.
 **Ready to code!** 🚀
         """
 
-        await update.message.reply_text(welcome_msg, parse_mode='Markdown')
+        self._reply(update, welcome_msg, parse_mode='Markdown')
 
     async def cmd_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
@@ -116,6 +178,9 @@ Just send a voice message with your request.
 /status - Get comprehensive project status
 /context <backend|frontend|root> - Switch working directory
 /sessions - View your active coding sessions
+/jobs - Running and recent test/build jobs
+/model <auto|fast|standard|strong> - Pin the API model tier (auto routes per request)
+/search <terms> - Search your past requests, answers and changed files
 /cancel - Cancel current operation
 /help - Show this help
 
@@ -149,7 +214,7 @@ and I'll process your request.
 Have fun coding! 🚀
         """
 
-        await update.message.reply_text(help_msg, parse_mode='Markdown')
+        self._reply(update, help_msg, parse_mode='Markdown')
 
     async def cmd_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Get comprehensive project status"""
@@ -158,7 +223,7 @@ Have fun coding! 🚀
             return
 
         if not auth.check_rate_limit(update.effective_user.id):
-            await update.message.reply_text("⚠️ Rate limit exceeded. Please wait a moment.")
+            self._reply(update, "⚠️ Rate limit exceeded. Please wait a moment.")
             return
 
         await update.message.reply_chat_action("typing")
@@ -166,10 +231,10 @@ Have fun coding! 🚀
         try:
             # Get current context
             current_context = context.user_data.get('context', 'backend')
-            working_dir = self._get_working_dir(current_context)
 
-            # Get status from bridge
-            status = await bridge.get_status(working_dir)
+            # Get status from bridge (of the user's worktree when the pool is on)
+            async with bridge.workspace(update.effective_user.id, current_context) as working_dir:
+                status = await bridge.get_status(working_dir, current_context)
 
             # Format status message
             git_status = status.get('git', {})
@@ -203,6 +268,10 @@ Untracked: {git_status.get('untracked', 0)}
                 emoji = "✅" if running else "❌"
                 status_msg += f"{emoji} {service.capitalize()}: {'Running' if running else 'Stopped'}\n"
 
+            status_msg += self._format_test_status(status.get('tests', {}))
+
+            status_msg += f"\n**Outbound queue:** {self.sender.queue_depth()} pending\n"
+
             # Add action buttons
             keyboard = [
                 [
@@ -216,7 +285,8 @@ Untracked: {git_status.get('untracked', 0)}
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-            await update.message.reply_text(
+            self._reply(
+                update,
                 status_msg,
                 reply_markup=reply_markup,
                 parse_mode='Markdown'
@@ -224,7 +294,7 @@ Untracked: {git_status.get('untracked', 0)}
 
         except Exception as e:
             logger.error(f"Status command failed: {e}", exc_info=True)
-            await update.message.reply_text(f"❌ Error getting status: {str(e)}")
+            self._reply(update, f"❌ Error getting status: {str(e)}")
 
     async def cmd_context(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Switch working context"""
@@ -236,7 +306,8 @@ Untracked: {git_status.get('untracked', 0)}
         args = context.args
         if not args:
             current = context.user_data.get('context', 'backend')
-            await update.message.reply_text(
+            self._reply(
+                update,
                 f"Current context: **{current}**\n\n"
                 f"Usage: `/context backend|frontend|root`",
                 parse_mode='Markdown'
@@ -247,16 +318,20 @@ Untracked: {git_status.get('untracked', 0)}
         valid_contexts = ['backend', 'frontend', 'root']
 
         if new_context not in valid_contexts:
-            await update.message.reply_text(
+            self._reply(
+                update,
                 f"❌ Invalid context. Choose from: {', '.join(valid_contexts)}"
             )
             return
 
         # Update context
         context.user_data['context'] = new_context
+        if shared_state.store:
+            shared_state.store.set('user_context', update.effective_user.id, new_context)
         working_dir = self._get_working_dir(new_context)
 
-        await update.message.reply_text(
+        self._reply(
+            update,
             f"✅ Switched to **{new_context}** context\n"
             f"Working directory: `{working_dir}`",
             parse_mode='Markdown'
@@ -268,23 +343,115 @@ Untracked: {git_status.get('untracked', 0)}
         if not auth.is_authorized(update):
             return
 
-        user_id = update.effective_user.id
-        user_sessions = [
-            s for s in bridge.sessions.values()
-            if s.user_id == user_id
-        ]
+        user_sessions = bridge.user_sessions(update.effective_user.id)
 
         if not user_sessions:
-            await update.message.reply_text("No active sessions.")
+            self._reply(update, "No active sessions.")
             return
 
         msg = "**Your Active Sessions:**\n\n"
         for session in user_sessions:
-            age = (datetime.now() - session.last_activity).total_seconds()
-            msg += f"• **{session.context}** (idle {int(age)}s)\n"
-            msg += f"  Commands: {len(session.history)}\n\n"
+            age = (datetime.now() - session['last_activity']).total_seconds()
+            msg += f"• **{session['context']}** (idle {int(age)}s)\n"
+            msg += f"  Commands: {session['commands']}\n\n"
+        if archive:
+            msg += "Past requests stay searchable with /search after a session expires."
 
-        await update.message.reply_text(msg, parse_mode='Markdown')
+        self._reply(update, msg, parse_mode='Markdown')
+
+    async def cmd_jobs(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """List running and recent background jobs"""
+
+        if not auth.is_authorized(update):
+            return
+
+        jobs = self.background.for_user(update.effective_user.id)
+        if not jobs:
+            self._reply(update, "No background jobs. Use the 🧪 Run Tests / 🔨 Build buttons to start one.")
+            return
+
+        self._reply(update, "Background jobs:\n\n" + "\n".join(job.describe() for job in jobs))
+
+    async def cmd_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Full-text search over the user's archived requests and answers"""
+
+        if not auth.is_authorized(update):
+            return
+
+        if not archive:
+            self._reply(update, "Search is disabled (TRANSCRIPT_ARCHIVE_PATH is not set).")
+            return
+
+        terms = ' '.join(context.args or [])
+        if not terms:
+            self._reply(update, "Usage: /search <terms>, e.g. /search stripe webhook")
+            return
+
+        started = time.monotonic()
+        results = await asyncio.to_thread(archive.search, update.effective_user.id, terms)
+        took = (time.monotonic() - started) * 1000
+        if not results:
+            self._reply(update, f"No past requests match \"{terms}\".")
+            return
+
+        lines = [f"🔎 {len(results)} match(es) for \"{terms}\" ({took:.0f}ms):"]
+        buttons = []
+        for interaction in results:
+            when = datetime.fromtimestamp(interaction['created']).strftime('%Y-%m-%d %H:%M')
+            emoji = "✅" if interaction['success'] else "⚠️"
+            lines.append(
+                f"\n{emoji} #{interaction['id']} {when} [{interaction['context']}]\n"
+                f"You: {interaction['prompt'][:120]}\n"
+                f"{interaction['snippet']}"
+            )
+            if interaction['files']:
+                lines.append(f"Files: {', '.join(interaction['files'][:5])}")
+            buttons.append(InlineKeyboardButton(f"📄 #{interaction['id']}", callback_data=f"arch_{interaction['id']}"))
+
+        self.sender.send_message(
+            update.effective_chat.id,
+            security.sanitize('\n'.join(lines))[:4000],
+            reply_markup=InlineKeyboardMarkup([buttons])
+        )
+
+    async def cmd_model(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show or pin the model tier used by the API backend"""
+
+        if not auth.is_authorized(update):
+            return
+
+        user_id = update.effective_user.id
+        if context.args:
+            tier = context.args[0].lower()
+            if tier not in TIERS + ('auto',):
+                self._reply(
+                    update,
+                    f"❌ Invalid tier. Choose from: auto, {', '.join(TIERS)}"
+                )
+                return
+            router.set_override(user_id, None if tier == 'auto' else tier)
+
+        current = router.get_override(user_id) or 'auto'
+        lines = [f"Model tier: {current}", ""]
+        for tier in TIERS:
+            model, max_tokens = router.models[tier]
+            lines.append(f"• {tier}: {model} (max {max_tokens} tokens)")
+        if not router.enabled:
+            lines.append("\nAutomatic routing is off (MODEL_ROUTING=false); auto uses standard.")
+        if config.get_auth_method() != 'api':
+            lines.append("\nNote: tiers only apply to the API backend.")
+        self._reply(update, "\n".join(lines))
+
+    async def cmd_metrics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show latency/throughput metrics (admins only)"""
+
+        if not auth.is_admin(update):
+            return
+
+        summary = metrics.summary()
+        if bridge.health.breakers:
+            summary += "\n\nBackends:\n" + bridge.health.summary()
+        self._reply(update, f"📈 Metrics\n\n```\n{summary[:3800]}\n```", parse_mode='Markdown')
 
     async def cmd_cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Cancel current operation"""
@@ -292,27 +459,52 @@ Untracked: {git_status.get('untracked', 0)}
         if not auth.is_authorized(update):
             return
 
-        await update.message.reply_text("✅ Operation cancelled")
+        jobs = await bridge.cancel(update.effective_user.id)
+
+        if not jobs:
+            self._reply(update, "Nothing is running.")
+            return
+
+        self._reply(update, f"🛑 Cancelled {len(jobs)} running operation(s)")
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages (coding requests)"""
+        with tracer.trace('handle_message', **self._trace_attrs(update)):
+            await self._handle_message(update, context)
 
+    async def _handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        auth_started = time.perf_counter()
         if not auth.is_authorized(update):
-            await update.message.reply_text(
+            self._reply(
+                update,
                 f"❌ Unauthorized. Your ID: {update.effective_user.id}"
             )
             return
+        auth_elapsed = time.perf_counter() - auth_started
 
         user_id = update.effective_user.id
-
-        if not auth.check_rate_limit(user_id):
-            await update.message.reply_text(
+        chat_id = update.effective_chat.id
+
+        # Merge messages sent in quick succession into one request
+        with tracer.span('debounce') as span:
+            messages = await self._collect_batch(chat_id, user_id, update.message.text)
+            span.set(batched=len(messages))
+        if not messages:
+            return  # Added to a batch another handler is collecting
+
+        request_started = time.perf_counter()
+        rate_ok = auth.check_rate_limit(user_id)
+        STAGE_SECONDS.observe('auth_rate', auth_elapsed + time.perf_counter() - request_started)
+
+        if not rate_ok:
+            self._reply(
+                update,
                 "⚠️ Slow down! You've hit the rate limit. Try again in a minute."
             )
             return
 
-        message = update.message.text
-        logger.info(f"User {user_id} request: {message[:100]}")
+        message = "\n".join(messages)
+        logger.info(f"User {user_id} request ({len(messages)} message(s)): {message[:100]}")
 
         # Send typing indicator
         await update.message.reply_chat_action("typing")
@@ -320,21 +512,43 @@ Untracked: {git_status.get('untracked', 0)}
         # Get current context
         current_context = context.user_data.get('context', 'backend')
 
+        # Progress message with a Cancel button; replaced by the response
+        progress = self.sender.send_message(
+            chat_id, "⏳ Working on it...", reply_markup=self._cancel_markup()
+        )
+
         try:
             # Execute via Claude Code bridge
-            result = await bridge.execute_command(user_id, message, current_context)
+            result = await bridge.execute_command(
+                user_id, message, current_context,
+                chat_id=chat_id, on_progress=self._progress_updater(chat_id, progress)
+            )
+            if result.get('delivered_elsewhere'):
+                await self._replace_progress(chat_id, progress, self.DELIVERED_ELSEWHERE)
+                return
+
+            # Remembered for test selection (🧪 Run Tests)
+            if result.get('files_changed'):
+                context.user_data['files_changed'] = result['files_changed']
 
             # Format and send response
             response = self._format_response(result)
 
+            if len(messages) > 1:
+                response = f"📦 _Batched {len(messages)} messages_\n\n" + response
+
             # Sanitize sensitive data
-            response = security.sanitize(response)
+            with STAGE_SECONDS.time('sanitize'), tracer.span('sanitize', chars=len(response)):
+                response = security.sanitize(response)
 
             # Generate action buttons
             keyboard = self._generate_action_buttons(result)
             reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
 
-            await update.message.reply_text(
+            # Queue the reply - the sender paces delivery
+            await self._replace_progress(
+                chat_id,
+                progress,
                 response,
                 reply_markup=reply_markup,
                 parse_mode='Markdown'
@@ -342,15 +556,106 @@ Untracked: {git_status.get('untracked', 0)}
 
             # Send file diffs if applicable
             if result.get('files_changed'):
-                await self._send_diffs(update, result['files_changed'], current_context)
+                await self._send_diffs(
+                    chat_id, result['files_changed'], current_context, result.get('working_dir')
+                )
+
+            STAGE_SECONDS.observe('total', time.perf_counter() - request_started)
 
         except Exception as e:
             logger.error(f"Message handling failed: {e}", exc_info=True)
-            await update.message.reply_text(
+            await self._replace_progress(
+                chat_id,
+                progress,
                 f"❌ Error: {str(e)}\n\n"
                 "Try rephrasing your request or use /help for guidance."
             )
 
+    async def _collect_batch(self, chat_id: int, user_id: int, text: str) -> list:
+        """
+        Debounce messages per sender in a chat (in groups, each user's messages
+        run under their own session and context)
+
+        The first message of a burst waits until MESSAGE_DEBOUNCE_MS passes with
+        no new message, then returns the whole batch. Later messages in the
+        burst join that batch and get an empty list back.
+        """
+        window = config.MESSAGE_DEBOUNCE_MS / 1000
+        if window <= 0:
+            return [text]
+
+        key = (chat_id, user_id)
+        batch = self._pending_batches.get(key)
+        if batch:
+            batch['messages'].append(text)
+            batch['last_at'] = time.monotonic()
+            return []
+
+        batch = {'messages': [text], 'last_at': time.monotonic()}
+        self._pending_batches[key] = batch
+        try:
+            while True:
+                remaining = batch['last_at'] + window - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+        finally:
+            del self._pending_batches[key]
+
+        return batch['messages']
+
+    async def _replace_progress(self, chat_id: int, progress: asyncio.Future, text: str, **kwargs):
+        """Edit the progress message into the final reply (new message if it never arrived)"""
+        try:
+            message = await progress
+        except Exception:
+            message = None
+
+        if message:
+            self._edit(chat_id, message.message_id, text, **kwargs)
+        else:
+            self._send(chat_id, text, **kwargs)
+
+    def _progress_updater(self, chat_id: int, progress: asyncio.Future):
+        """
+        Callback showing the tail of a run's output in the progress message
+        (throttled); heartbeats call it without new output to update the elapsed time
+        """
+        started = time.monotonic()
+        last_edit = 0.0
+
+        def update(output: str):
+            nonlocal last_edit
+            if not progress.done() or progress.exception() or not progress.result():
+                return
+            if time.monotonic() - last_edit < self.PROGRESS_EDIT_INTERVAL:
+                return
+            last_edit = time.monotonic()
+            elapsed = format_duration(last_edit - started)
+            tail = security.sanitize(output[-self.PROGRESS_TAIL_CHARS:])
+            self.sender.edit_message(
+                chat_id, progress.result().message_id, f"⏳ Still working... ({elapsed})\n\n{tail}",
+                reply_markup=self._cancel_markup()
+            )
+
+        return update
+
+    async def deliver_finished_jobs(self, context: ContextTypes.DEFAULT_TYPE):
+        """Send executor results whose request handler is gone (e.g. finished during a restart)"""
+        for job in bridge.finished_jobs():
+            logger.info(f"Delivering result of job {job['id']} to chat {job['chat_id']}")
+            response = security.sanitize(self._format_response(job['result']))
+            prompt = job['prompt'][:80].replace('`', "'")
+            self._send(
+                job['chat_id'],
+                f"📬 _Finished while the bot was restarting:_ `{prompt}`\n\n" + response,
+                parse_mode='Markdown'
+            )
+
+    @staticmethod
+    def _cancel_markup() -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup([[InlineKeyboardButton("🛑 Cancel", callback_data='cancel_run')]])
+
     async def handle_voice(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle voice messages (using Telegram's built-in transcription)"""
 
@@ -370,7 +675,8 @@ Untracked: {git_status.get('untracked', 0)}
 
         if voice_text:
             logger.info(f"Voice transcription received: {voice_text[:100]}")
-            await update.message.reply_text(
+            self._reply(
+                update,
                 f"🎤 You said: _{voice_text}_\n\nProcessing...",
                 parse_mode='Markdown'
             )
@@ -379,7 +685,8 @@ Untracked: {git_status.get('untracked', 0)}
             update.message.text = voice_text
             await self.handle_message(update, context)
         else:
-            await update.message.reply_text(
+            self._reply(
+                update,
                 "🎤 Voice message received! Unfortunately, I couldn't get the transcription.\n\n"
                 "**Tip:** Make sure voice-to-text is enabled in your Telegram settings, "
                 "or send a text message instead."
@@ -387,7 +694,10 @@ Untracked: {git_status.get('untracked', 0)}
 
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle button presses"""
+        with tracer.trace('handle_callback', action=update.callback_query.data, **self._trace_attrs(update)):
+            await self._handle_callback(update, context)
 
+    async def _handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()
 
@@ -400,12 +710,24 @@ Untracked: {git_status.get('untracked', 0)}
         try:
             if action == 'run_tests':
                 await self._run_tests(query, context)
+            elif action == 'run_tests_full':
+                await self._run_full_tests(query, context)
             elif action == 'run_build':
                 await self._run_build(query, context)
             elif action == 'git_log':
                 await self._git_log(query, context)
             elif action == 'git_pull':
                 await self._git_pull(query, context)
+            elif action == 'cancel_run':
+                await self._cancel_run(query)
+            elif action.startswith('rerun_'):
+                await self._rerun(query, action[len('rerun_'):])
+            elif action.startswith(('page_', 'pgv_')):
+                self._show_output_page(query, action)
+            elif action.startswith('fullout_'):
+                self._send_full_output(query, action[len('fullout_'):])
+            elif action.startswith('arch_'):
+                await self._send_archived(query, int(action[len('arch_'):]))
             elif action.startswith('approve_'):
                 await self._approve_action(query, action)
             elif action.startswith('reject_'):
@@ -413,105 +735,359 @@ Untracked: {git_status.get('untracked', 0)}
 
         except Exception as e:
             logger.error(f"Callback handling failed: {e}", exc_info=True)
-            await query.edit_message_text(f"❌ Error: {str(e)}")
+            self._edit_query_message(query, f"❌ Error: {str(e)}")
+
+    def _reply(self, update: Update, text: str, **kwargs) -> asyncio.Future:
+        """Queue a message to the update's chat (through the sender's rate limits, like every reply)"""
+        return self._send(update.effective_chat.id, text, **kwargs)
+
+    def _edit_query_message(self, query, text: str, **kwargs):
+        """Queue an edit of the message the button belongs to"""
+        return self._edit(query.message.chat_id, query.message.message_id, text, **kwargs)
+
+    def _send(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Queue a message; if Telegram rejects it, it's sent again as plain text"""
+        sent = self.sender.send_message(chat_id, text, **kwargs)
+        sent.add_done_callback(lambda future: self._fallback(future, chat_id, None, text, kwargs))
+        return sent
+
+    def _edit(self, chat_id: int, message_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Queue an edit; if Telegram rejects it, the edit is retried as plain text, then sent as a new message"""
+        edited = self.sender.edit_message(chat_id, message_id, text, **kwargs)
+        edited.add_done_callback(lambda future: self._fallback(future, chat_id, message_id, text, kwargs))
+        return edited
+
+    def _fallback(self, future: asyncio.Future, chat_id: int, message_id: Optional[int], text: str, kwargs: dict):
+        """
+        Done-callback of a failed send/edit (e.g. text past Telegram's limit, a bad button):
+        retry once as plain text cut to the limit, then report the error in a new message
+        """
+        if future.cancelled() or future.exception() is None:
+            return
+        error = future.exception()
+        if 'message is not modified' in str(error).lower():
+            return
+
+        limit = MessageLimit.MAX_TEXT_LENGTH
+        plain = text if len(text) <= limit else text[:limit - 2] + ' …'
+        retry_kwargs = {key: value for key, value in kwargs.items() if key != 'parse_mode'}
+        if message_id:
+            retry = self.sender.edit_message(chat_id, message_id, plain, **retry_kwargs)
+        else:
+            retry = self.sender.send_message(chat_id, plain, **retry_kwargs)
+
+        def report(done: asyncio.Future):
+            if not done.cancelled() and done.exception() is not None:
+                notice = f"❌ Could not send the reply: {error}\n\n"
+                self.sender.send_message(chat_id, notice + plain[:limit - len(notice)])
+
+        retry.add_done_callback(report)
 
     async def _run_tests(self, query, context: ContextTypes.DEFAULT_TYPE):
-        """Run test suite"""
-        current_context = context.user_data.get('context', 'backend')
-        user_id = query.from_user.id
+        """Run the tests affected by the current changes first (as a background job)"""
+        async with bridge.workspace(query.from_user.id, context.user_data.get('context', 'backend')) as working_dir:
+            selection = await impact.select(working_dir, context.user_data.get('files_changed', []))
+
+        if selection.full:
+            logger.info(f"Running the full suite: {selection.full_reason}")
+            await self._run_full_tests(query, context)
+        elif not selection.tests:
+            self._edit_query_message(
+                query,
+                f"🧪 No tests import the {len(selection.changed)} changed file(s).",
+                reply_markup=self._full_suite_markup()
+            )
+        else:
+            files = '\n'.join(f"- {path}" for path in selection.tests)
+            changed = ', '.join(selection.changed[:20])
+            self._start_background_job(
+                query, context, 'impacted_tests',
+                f"Run only these test files (they cover the changed files {changed}) "
+                f"with the project's test runner and show results:\n{files}"
+            )
 
-        await query.edit_message_text("🧪 Running tests...")
+    async def _run_full_tests(self, query, context: ContextTypes.DEFAULT_TYPE):
+        """Run the whole test suite (as a background job)"""
+        self._start_background_job(query, context, 'tests', "Run the full test suite and show results")
 
-        result = await bridge.execute_command(
-            user_id,
-            "Run the full test suite and show results",
-            current_context
+    @staticmethod
+    def _full_suite_markup() -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup([[InlineKeyboardButton("🧪 Run full suite", callback_data='run_tests_full')]])
+
+    async def _run_build(self, query, context: ContextTypes.DEFAULT_TYPE):
+        """Run build (as a background job)"""
+        self._start_background_job(query, context, 'build', "Run the build process")
+
+    def _start_background_job(self, query, context: ContextTypes.DEFAULT_TYPE, kind: str, prompt: str):
+        """Hand a long task to the job queue so the callback returns immediately"""
+        job = self.background.create(
+            query.from_user.id, query.message.chat_id, query.message.message_id,
+            kind, context.user_data.get('context', 'backend')
         )
+        logger.info(f"Starting background job #{job.id} ({kind}) for user {job.user_id}")
 
-        response = self._format_response(result)
-        await query.edit_message_text(response, parse_mode='Markdown')
+        self._edit_query_message(
+            query, f"{job.label} running in the background (job #{job.id})...",
+            reply_markup=self._cancel_markup()
+        )
+        context.job_queue.run_once(
+            self._run_background_job, when=0, data=(job, prompt), name=f"background-{job.id}"
+        )
 
-    async def _run_build(self, query, context: ContextTypes.DEFAULT_TYPE):
-        """Run build"""
-        current_context = context.user_data.get('context', 'backend')
-        user_id = query.from_user.id
+    async def _run_background_job(self, context: ContextTypes.DEFAULT_TYPE):
+        job, prompt = context.job.data
+
+        def record_output(output: str):
+            job.output = output
+
+        progress = context.job_queue.run_repeating(
+            self._show_background_progress, interval=self.BACKGROUND_PROGRESS_INTERVAL,
+            data=job, name=f"background-{job.id}-progress"
+        )
+        try:
+            result = await bridge.execute_command(
+                job.user_id, prompt, job.context,
+                chat_id=job.chat_id, on_progress=record_output
+            )
+        except Exception as e:
+            logger.error(f"Background job #{job.id} failed: {e}", exc_info=True)
+            result = {'success': False, 'error': str(e), 'output': ''}
+        finally:
+            progress.schedule_removal()
+
+        self.background.finish(job, result)
+        logger.info(f"Background job #{job.id} {job.status} after {job.elapsed:.1f}s")
+        if result.get('delivered_elsewhere'):
+            self._edit(job.chat_id, job.message_id, self.DELIVERED_ELSEWHERE)
+            return
+
+        response = security.sanitize(self._format_response(result))
+        keyboard = self._generate_action_buttons(result)
+        if job.kind == 'impacted_tests':
+            keyboard += self._full_suite_markup().inline_keyboard
+        self._edit(
+            job.chat_id, job.message_id, response,
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None
+        )
+        self._notify_job_finished(job)
 
-        await query.edit_message_text("🔨 Running build...")
+    async def _show_background_progress(self, context: ContextTypes.DEFAULT_TYPE):
+        job = context.job.data
+        if job.status != 'running':
+            return
+        text = f"{job.label} running in the background (job #{job.id}, {format_duration(job.elapsed)})..."
+        if job.output:
+            text += "\n\n" + security.sanitize(job.output[-self.PROGRESS_TAIL_CHARS:])
+        self.sender.edit_message(job.chat_id, job.message_id, text, reply_markup=self._cancel_markup())
+
+    def _notify_job_finished(self, job):
+        """
+        Send a separate message when a background job ends - edits don't notify
+        the user. Honours ENABLE_NOTIFICATIONS / NOTIFY_ON_COMPLETION / NOTIFY_ON_ERROR
+        """
+        if not config.ENABLE_NOTIFICATIONS or job.status == 'cancelled':
+            return
+        if job.status == 'done' and not config.NOTIFY_ON_COMPLETION:
+            return
+        if job.status == 'failed' and not config.NOTIFY_ON_ERROR:
+            return
+
+        icon, outcome = ('✅', 'finished') if job.status == 'done' else ('❌', 'failed')
+        self.sender.send_message(
+            job.chat_id,
+            f"{icon} {job.label} {outcome} (job #{job.id}, {job.context}, {format_duration(job.elapsed)})",
+            reply_to_message_id=job.message_id
+        )
+
+    async def _rerun(self, query, cache_key: str):
+        """Re-run a cached request, bypassing the cache"""
+        request = bridge.cache.lookup_request(cache_key) if bridge.cache else None
+        if not request:
+            self._edit_query_message(query, "⚠️ This result has expired - please send the request again.")
+            return
+
+        prompt, request_context = request
+        self._edit_query_message(query, "🔄 Re-running...", reply_markup=self._cancel_markup())
 
         result = await bridge.execute_command(
-            user_id,
-            "Run the build process",
-            current_context
+            query.from_user.id,
+            prompt,
+            request_context,
+            use_cache=False
         )
+        if result.get('delivered_elsewhere'):
+            self._edit_query_message(query, self.DELIVERED_ELSEWHERE)
+            return
 
-        response = self._format_response(result)
-        await query.edit_message_text(response, parse_mode='Markdown')
+        self._edit_with_result(query, result)
+
+    def _show_output_page(self, query, action: str):
+        """
+        ◀ / ▶ buttons: page_<id>_<n> on a reply opens a pager message,
+        pgv_<id>_<n> on the pager flips it in place
+        """
+        prefix, output_id, number = action.split('_')
+        number = int(number)
+        pages = outputs.pages(output_id) if outputs else 0
+        text = outputs.page(output_id, number) if pages else None
+        if text is None:
+            self.sender.send_message(query.message.chat_id, "⚠️ This output has expired.")
+            return
+
+        nav = []
+        if number > 0:
+            nav.append(InlineKeyboardButton("◀", callback_data=f"pgv_{output_id}_{number - 1}"))
+        if number + 1 < pages:
+            nav.append(InlineKeyboardButton("▶", callback_data=f"pgv_{output_id}_{number + 1}"))
+        markup = InlineKeyboardMarkup([nav, [InlineKeyboardButton("📄 Full output", callback_data=f"fullout_{output_id}")]])
+
+        # Plain text: a page can cut through Markdown
+        text = f"📄 Page {number + 1}/{pages}\n\n{security.sanitize(text)}"
+        if prefix == 'pgv':
+            self._edit_query_message(query, text, reply_markup=markup)
+        else:
+            self.sender.send_message(query.message.chat_id, text, reply_markup=markup)
+
+    def _send_full_output(self, query, output_id: str):
+        """📄 Full output button: the whole stored output as a file"""
+        if not outputs or not outputs.pages(output_id):
+            self.sender.send_message(query.message.chat_id, "⚠️ This output has expired.")
+            return
+        data = ''.join(security.sanitize(page) for page in outputs.read(output_id)).encode('utf-8')
+        filename = 'claude-output.txt'
+        if len(data) > self.FULL_OUTPUT_GZIP_BYTES:
+            data, filename = gzip.compress(data), filename + '.gz'
+        self.sender.send_document(query.message.chat_id, data, filename=filename)
+
+    async def _send_archived(self, query, interaction_id: int):
+        """📄 #N button under /search results: the archived answer, as a file when long"""
+        interaction = archive.get(interaction_id, query.from_user.id) if archive else None
+        if not interaction:
+            self.sender.send_message(query.message.chat_id, "⚠️ This interaction is no longer archived.")
+            return
+        output = security.sanitize(interaction['output']) or 'Done'
+        if len(output) <= 4000:
+            self.sender.send_message(query.message.chat_id, output)
+        else:
+            self.sender.send_document(
+                query.message.chat_id, output.encode('utf-8'), filename=f"claude-output-{interaction_id}.txt"
+            )
+
+    async def _cancel_run(self, query):
+        """Cancel button on a progress message"""
+        jobs = await bridge.cancel(query.from_user.id)
+        if not jobs:
+            self._edit_query_message(query, "Nothing is running.")
+        # Otherwise the interrupted handler replaces this message with the partial output
+
+    def _edit_with_result(self, query, result: dict):
+        """Replace the button message with a formatted result"""
+        response = security.sanitize(self._format_response(result))
+        keyboard = self._generate_action_buttons(result)
+        self._edit_query_message(
+            query,
+            response,
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None
+        )
 
     async def _git_log(self, query, context: ContextTypes.DEFAULT_TYPE):
         """Show git log"""
-        await query.edit_message_text("📊 Fetching git log...")
+        self._edit_query_message(query, "📊 Fetching git log...")
 
         current_context = context.user_data.get('context', 'backend')
-        working_dir = self._get_working_dir(current_context)
 
-        process = await asyncio.create_subprocess_exec(
-            'git', 'log', '--oneline', '-10',
-            cwd=working_dir,
-            stdout=asyncio.subprocess.PIPE
-        )
+        async with bridge.workspace(query.from_user.id, current_context) as working_dir:
+            SUBPROCESS_SPAWNS.inc('git')
+            process = await asyncio.create_subprocess_exec(
+                'git', 'log', '--oneline', '-10',
+                cwd=working_dir,
+                stdout=asyncio.subprocess.PIPE
+            )
 
-        stdout, _ = await process.communicate()
+            stdout, _ = await process.communicate()
         log = stdout.decode()
 
-        await query.edit_message_text(
+        self._edit_query_message(
+            query,
             f"**Recent Commits:**\n```\n{log}\n```",
             parse_mode='Markdown'
         )
 
     async def _git_pull(self, query, context: ContextTypes.DEFAULT_TYPE):
         """Git pull latest"""
-        await query.edit_message_text("🔄 Pulling latest changes...")
+        self._edit_query_message(query, "🔄 Pulling latest changes...")
 
         current_context = context.user_data.get('context', 'backend')
-        working_dir = self._get_working_dir(current_context)
-
-        process = await asyncio.create_subprocess_exec(
-            'git', 'pull',
-            cwd=working_dir,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        base_dir = self._get_working_dir(current_context)
+
+        async with bridge.workspace(query.from_user.id, current_context) as working_dir:
+            # A worktree's session branch has no upstream: pull the shared checkout's one into it
+            args = ['git', 'pull']
+            if working_dir != base_dir:
+                args += await self._upstream(base_dir)
+
+            SUBPROCESS_SPAWNS.inc('git')
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                cwd=working_dir,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
 
-        stdout, stderr = await process.communicate()
+            stdout, stderr = await process.communicate()
         output = stdout.decode() + stderr.decode()
 
-        await query.edit_message_text(
+        self._edit_query_message(
+            query,
             f"✅ Git pull complete:\n```\n{output[:500]}\n```",
             parse_mode='Markdown'
         )
 
+    @staticmethod
+    async def _upstream(working_dir: str) -> list:
+        """[remote, branch] the checkout tracks, or [] when it tracks nothing"""
+        SUBPROCESS_SPAWNS.inc('git')
+        process = await asyncio.create_subprocess_exec(
+            'git', 'rev-parse', '--abbrev-ref', '--symbolic-full-name', '@{u}',
+            cwd=working_dir,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+        remote, _, branch = stdout.decode().strip().partition('/')
+        return [remote, branch] if process.returncode == 0 and branch else []
+
     async def _approve_action(self, query, action: str):
         """Approve pending action"""
-        await query.edit_message_text("✅ Approved")
+        self._edit_query_message(query, "✅ Approved")
 
     async def _reject_action(self, query, action: str):
         """Reject pending action"""
-        await query.edit_message_text("❌ Rejected")
+        self._edit_query_message(query, "❌ Rejected")
+
+    async def _send_diffs(self, chat_id: int, files: list, context: str, working_dir: Optional[str] = None):
+        """Send file diffs (from the run's worktree when it had one)"""
+        with tracer.span('send_diffs', files=len(files)):
+            await self._send_file_diffs(chat_id, files, context, working_dir)
 
-    async def _send_diffs(self, update: Update, files: list, context: str):
-        """Send file diffs"""
-        working_dir = self._get_working_dir(context)
+    async def _send_file_diffs(self, chat_id: int, files: list, context: str, working_dir: Optional[str] = None):
+        working_dir = working_dir or self._get_working_dir(context)
 
         for file_path in files[:5]:  # Limit to 5 files
             try:
-                process = await asyncio.create_subprocess_exec(
-                    'git', 'diff', file_path,
-                    cwd=working_dir,
-                    stdout=asyncio.subprocess.PIPE
-                )
+                SUBPROCESS_SPAWNS.inc('git')
+                with tracer.span('git.diff', file=file_path) as span:
+                    process = await asyncio.create_subprocess_exec(
+                        'git', 'diff', file_path,
+                        cwd=working_dir,
+                        stdout=asyncio.subprocess.PIPE
+                    )
 
-                stdout, _ = await process.communicate()
-                diff = stdout.decode()
+                    stdout, _ = await process.communicate()
+                    diff = stdout.decode()
+                    span.set(diff_chars=len(diff))
 
                 if not diff:
                     continue
@@ -521,16 +1097,14 @@ Untracked: {git_status.get('untracked', 0)}
 
                 if len(diff) > 3500:
                     # Send as file
-                    diff_file = f"/tmp/diff_{int(datetime.now().timestamp())}.patch"
-                    with open(diff_file, 'w') as f:
-                        f.write(diff)
-
-                    await update.message.reply_document(
-                        document=open(diff_file, 'rb'),
+                    self.sender.send_document(
+                        chat_id,
+                        diff.encode('utf-8'),
                         filename=f"{file_path.split('/')[-1]}.patch"
                     )
                 else:
-                    await update.message.reply_text(
+                    self.sender.send_message(
+                        chat_id,
                         f"📝 **{file_path}**\n```diff\n{diff}\n```",
                         parse_mode='Markdown'
                     )
@@ -541,14 +1115,23 @@ Untracked: {git_status.get('untracked', 0)}
     def _format_response(self, result: dict) -> str:
         """Format Claude Code result for Telegram"""
 
+        if result.get('cancelled'):
+            partial = result.get('output', '')
+            if not partial:
+                return "🛑 Cancelled before any output was produced."
+            return f"🛑 Cancelled. Partial output:\n\n{partial[-1000:]}"
+
         if not result.get('success'):
-            return f"❌ {result.get('error', 'Unknown error')}\n\n{result.get('output', '')[:1000]}"
+            return f"❌ {result.get('error', 'Unknown error')}\n\n{self._output_preview(result, 1000)}"
 
-        output = result.get('output', 'Done')
         files_changed = result.get('files_changed', [])
         tests = result.get('tests_run', {})
 
-        response = f"🤖 {output[:2000]}\n\n"
+        response = f"🤖 {self._output_preview(result, 2000)}\n\n"
+
+        if result.get('cached'):
+            cached_at = result.get('cached_at', '')[11:19]
+            response = f"♻️ _Cached result from {cached_at} - repository unchanged since._\n\n" + response
 
         if files_changed:
             response += f"📝 **Modified {len(files_changed)} file(s):**\n"
@@ -570,11 +1153,61 @@ Untracked: {git_status.get('untracked', 0)}
 
         return response
 
+    @staticmethod
+    def _format_test_status(tests: dict) -> str:
+        """/status section for the latest stored test run"""
+        run = tests.get('run')
+        if not run:
+            return "\n**Tests:** no results yet\n"
+
+        emoji = "✅" if not run['failed'] else "❌"
+        age = int(time.time() - run['created'])
+        when = f"{age // 60}m ago" if age < 3600 else f"{age // 3600}h ago"
+        staleness = "" if tests.get('current') else " (code changed since)"
+        failed = f", {run['failed']} failed" if run['failed'] else ""
+        text = (
+            f"\n{emoji} **Tests:** {run['passed']}/{run['total']} passed{failed} "
+            f"at {run['commit_sha'][:8] or '?'}, {when}{staleness}\n"
+        )
+        for failure in tests.get('failures', [])[:5]:
+            text += f"  ✗ `{failure['name']}`\n"
+        if tests.get('slowest'):
+            text += "Slowest: " + ", ".join(
+                f"`{case['name'].split('::')[-1]}` {case['duration']:.1f}s" for case in tests['slowest'][:3]
+            ) + "\n"
+        if tests.get('flaky'):
+            text += "Flaky: " + ", ".join(
+                f"`{case['name'].split('::')[-1]}` ({case['failures']}/{case['passes'] + case['failures']} failed)"
+                for case in tests['flaky']
+            ) + "\n"
+        return text
+
+    @staticmethod
+    def _output_preview(result: dict, limit: int) -> str:
+        """First page of a stored output (the rest is behind the pager buttons), else the output cut at limit"""
+        if result.get('output_pages', 0) > 1 and outputs:
+            first_page = outputs.page(result['output_id'], 0)
+            if first_page is not None:
+                return f"{first_page}\n… _page 1/{result['output_pages']}_"
+        output = result.get('output') or ('' if not result.get('success') else 'Done')
+        return output if outputs and len(output) <= outputs.page_chars else output[:limit]
+
     def _generate_action_buttons(self, result: dict) -> list:
         """Generate action buttons based on result"""
 
         buttons = []
 
+        if result.get('output_pages', 0) > 1:
+            buttons.append([
+                InlineKeyboardButton(f"▶ Page 2/{result['output_pages']}", callback_data=f"page_{result['output_id']}_1"),
+                InlineKeyboardButton("📄 Full output", callback_data=f"fullout_{result['output_id']}")
+            ])
+
+        if result.get('cached'):
+            buttons.append([
+                InlineKeyboardButton("🔄 Re-run", callback_data=f"rerun_{result['cache_key']}")
+            ])
+
         if result.get('files_changed'):
             buttons.append([
                 InlineKeyboardButton("✅ Commit Changes", callback_data='approve_commit'),
@@ -583,6 +1216,15 @@ Untracked: {git_status.get('untracked', 0)}
 
         return buttons
 
+    @staticmethod
+    def _trace_attrs(update: Update) -> dict:
+        """Trace ID and identifying attributes for an incoming update"""
+        return {
+            'trace_id': tracer.new_trace_id(f"u{update.update_id}"),
+            'user_id': update.effective_user.id if update.effective_user else None,
+            'chat_id': update.effective_chat.id if update.effective_chat else None,
+        }
+
     def _get_working_dir(self, context: str) -> str:
         """Get working directory for context"""
         paths = {
@@ -598,25 +1240,69 @@ Untracked: {git_status.get('untracked', 0)}
 
         # Notify user if possible
         if isinstance(update, Update) and update.effective_message:
-            await update.effective_message.reply_text(
+            self._reply(
+                update,
                 "❌ An error occurred while processing your request. "
                 "Please try again or contact support."
             )
 
-    def run(self):
-        """Start the bot"""
-        logger.info("🤖 Starting Telegram Claude Code Bot...")
-        logger.info(f"Allowed users: {config.ALLOWED_USERS}")
-        logger.info(f"Project root: {config.PROJECT_ROOT}")
+    @staticmethod
+    async def load_shared_context(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Pick up /context changes made while another worker owned this user's chat"""
+        if update.effective_user:
+            current = shared_state.store.get('user_context', update.effective_user.id)
+            if current:
+                context.user_data['context'] = current
 
+    def prepare(self):
+        """Set up background jobs, tracing and metrics (everything but serving updates)"""
         # Cleanup old sessions periodically
         async def cleanup_sessions(context):
-            bridge.cleanup_old_sessions(config.SESSION_TIMEOUT)
+            await bridge.cleanup_old_sessions(config.SESSION_TIMEOUT)
 
         self.app.job_queue.run_repeating(cleanup_sessions, interval=300, first=60)
 
-        # Run bot
-        self.app.run_polling(allowed_updates=Update.ALL_TYPES)
+        if bridge.jobs:
+            self.app.job_queue.run_repeating(self.deliver_finished_jobs, interval=10, first=5)
+
+        tracer.configure(config.SLOW_REQUEST_THRESHOLD_MS / 1000, config.SLOW_REQUEST_LOG)
+
+        # Record anonymized traffic ahead of all other handlers
+        recorder.configure(config.TRAFFIC_RECORD_PATH, config.TRAFFIC_RECORD_SALT)
+        if recorder.enabled:
+            self.app.add_handler(TypeHandler(Update, recorder.on_update), group=-1)
+            logger.info(f"📼 Recording traffic to {config.TRAFFIC_RECORD_PATH}")
+
+        if config.METRICS_PORT:
+            metrics.start_http_server(config.METRICS_LISTEN, config.METRICS_PORT)
+
+        # Flush queued replies before exiting
+        async def stop_sender(application):
+            await self.sender.stop()
+
+        self.app.post_shutdown = stop_sender
+
+        if shared_state.store:
+            self.app.add_handler(TypeHandler(Update, self.load_shared_context), group=-2)
+
+    def run(self):
+        """Start the bot"""
+        logger.info("🤖 Starting Telegram Claude Code Bot...")
+        logger.info(f"Allowed users: {config.ALLOWED_USERS}")
+        logger.info(f"Project root: {config.PROJECT_ROOT}")
+
+        self.prepare()
+
+        # Run bot (webhook if WEBHOOK_URL is set, otherwise polling)
+        run_application(
+            self.app,
+            webhook_url=config.WEBHOOK_URL,
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS
+        )
 
 
 def main():
@@ -627,6 +1313,11 @@ def main():
         logger.error("❌ Invalid configuration. Please check your environment variables.")
         return 1
 
+    # One receiving process feeding sharded worker processes
+    if config.BOT_WORKERS > 1:
+        import supervisor
+        return supervisor.run_supervisor(config.BOT_WORKERS)
+
     # Create and run bot
     bot = TelegramClaudeBot()
     bot.run()
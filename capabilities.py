@@ -0,0 +1,138 @@
+"""
+Capability detection for the Claude backends
+Probes the installed CLIs once and persists the result (with a TTL) so
+restarts and per-request backend resolution don't spawn `--version` again
+"""
+
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv(
+    'CAPABILITY_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'telegram-claude-bot', 'capabilities.json')
+)
+CACHE_TTL = int(os.getenv('CAPABILITY_CACHE_TTL', '86400'))
+
+# Preferred first; `claude` only counts if it reports itself as Claude Code
+CLI_COMMANDS = ('claude-code', 'claude')
+
+
+class Capabilities:
+    """What this host can run"""
+
+    def __init__(self, commands: Dict[str, Optional[str]], anthropic_sdk: bool, detected_at: float):
+        # command name -> version string (None if missing or not Claude Code)
+        self.commands = commands
+        self.anthropic_sdk = anthropic_sdk
+        self.detected_at = detected_at
+
+    def has_command(self, name: str) -> bool:
+        return bool(self.commands.get(name))
+
+    @property
+    def claude_command(self) -> Optional[str]:
+        """First usable Claude Code CLI, if any"""
+        for name in CLI_COMMANDS:
+            if self.has_command(name):
+                return name
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            'commands': self.commands,
+            'anthropic_sdk': self.anthropic_sdk,
+            'detected_at': self.detected_at,
+        }
+
+
+_lock = threading.Lock()
+_cached: Optional[Capabilities] = None
+
+
+def _binaries() -> Dict[str, Optional[list]]:
+    """Resolved path and mtime of each CLI - a reinstall or PATH change invalidates the cache"""
+    found = {}
+    for name in CLI_COMMANDS:
+        path = shutil.which(name)
+        try:
+            found[name] = [path, os.path.getmtime(path)] if path else None
+        except OSError:
+            found[name] = None
+    return found
+
+
+def _probe_version(name: str) -> Optional[str]:
+    from metrics import SUBPROCESS_SPAWNS
+
+    SUBPROCESS_SPAWNS.inc(name)
+    try:
+        result = subprocess.run([name, '--version'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    version = result.stdout.strip()
+    # Make sure `claude` is Claude Code, not the old claude CLI
+    if name == 'claude' and 'Claude Code' not in version:
+        return None
+    return version or 'unknown'
+
+
+def _load(binaries: dict) -> Optional[Capabilities]:
+    try:
+        with open(CACHE_PATH) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if time.time() - data.get('detected_at', 0) > CACHE_TTL or data.get('binaries') != binaries:
+        return None
+    return Capabilities(data['commands'], data['anthropic_sdk'], data['detected_at'])
+
+
+def _save(capabilities: Capabilities, binaries: dict):
+    try:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        tmp_path = f"{CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({**capabilities.to_dict(), 'binaries': binaries}, f)
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"Could not persist capability cache {CACHE_PATH}: {e}")
+
+
+def detect(refresh: bool = False) -> Capabilities:
+    """Capabilities of this host (memoized in-process, persisted for CACHE_TTL)"""
+    global _cached
+
+    with _lock:
+        if _cached and not refresh and time.time() - _cached.detected_at <= CACHE_TTL:
+            return _cached
+
+        binaries = _binaries()
+        capabilities = None if refresh or CACHE_TTL <= 0 else _load(binaries)
+        if capabilities is None:
+            # Stop at the first working CLI - fallbacks after it are never used
+            commands = {}
+            for name in CLI_COMMANDS:
+                usable = binaries[name] and not any(commands.values())
+                commands[name] = _probe_version(name) if usable else None
+            # find_spec checks the SDK is installed without importing it
+            capabilities = Capabilities(
+                commands, importlib.util.find_spec('anthropic') is not None, time.time()
+            )
+            if CACHE_TTL > 0:
+                _save(capabilities, binaries)
+            logger.info(f"Detected Claude backends: {capabilities.commands}")
+
+        _cached = capabilities
+        return capabilities
@@ -4,16 +4,41 @@ Manages Claude Code sessions and command execution
 """
 
 import asyncio
+import contextvars
+import hashlib
 import json
 import os
 import re
-from typing import Dict, Optional, List
+import signal
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Iterable, Optional, List, Union
 from datetime import datetime
 import logging
 from config import config
+from result_cache import ResultCache, SharedResultCache
+import shared_state
+from executor import JobStore, FINISHED, PROGRESS_CHARS
+from output_capture import CombinedOutput, OutputCapture
+from stream_json import StreamJsonDecoder
+from worktree_pool import WorktreePool
+from model_router import router
+from backend_health import BackendError, BackendHealth, HEDGES
+from output_watchdog import OutputWatchdog
+from output_store import outputs
+from auth import security
+from testrun_store import test_runs, parse_cases, parse_junit, find_junit_reports, counts
+from transcript_archive import archive
+from metrics import metrics, STAGE_SECONDS, SUBPROCESS_SPAWNS
+from tracing import tracer
+from traffic_recorder import recorder
 
 logger = logging.getLogger(__name__)
 
+# Job for the Claude run executing in the current task (set by execute_command)
+_current_job: contextvars.ContextVar = contextvars.ContextVar('current_job', default=None)
+
 
 class ClaudeCodeSession:
     """Represents a Claude Code session"""
@@ -39,6 +64,7 @@ class ClaudeCodeSession:
     def update_activity(self):
         """Update last activity timestamp"""
         self.last_activity = datetime.now()
+        self._publish()
 
     def add_to_history(self, prompt: str, result: dict):
         """Add interaction to history"""
@@ -47,22 +73,127 @@ class ClaudeCodeSession:
             'prompt': prompt,
             'result': result
         })
+        self._publish()
+
+    def _publish(self):
+        """Share a summary with the other worker processes (/sessions)"""
+        if shared_state.store:
+            shared_state.store.set('sessions', self.session_id, {
+                'user_id': self.user_id,
+                'context': self.context,
+                'last_activity': self.last_activity.isoformat(),
+                'commands': len(self.history),
+            })
+
+
+class RunningJob:
+    """An in-flight Claude run that can be cancelled"""
+
+    def __init__(self, user_id: int, context: str, prompt: str):
+        self.user_id = user_id
+        self.context = context
+        self.prompt = prompt
+        self.started_at = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self.waiter: Optional[asyncio.Task] = None
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.partial_output = ''
+        self.output_chunks = 0
+        self.cancelled = False
+        self.on_progress: Optional[Callable[[str], None]] = None
+
+    def record_output(self, text: str):
+        """Keep the tail of the output seen so far (returned if the run is cancelled)"""
+        self.partial_output = (self.partial_output + text)[-config.OUTPUT_TAIL_BYTES:]
+        self.output_chunks += 1
+        if self.on_progress:
+            self.on_progress(self.partial_output[-PROGRESS_CHARS:])
+
+    def heartbeat(self, elapsed: float, idle: float):
+        """Still running: refresh progress (elapsed time) even if there's no new output"""
+        if self.on_progress:
+            self.on_progress(self.partial_output[-PROGRESS_CHARS:])
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
 
 
 class ClaudeCodeBridge:
     """Bridge between Telegram and Claude Code"""
 
+    EXECUTOR_POLL_INTERVAL = 0.5
+    # Exit codes of the CLI pipeline that mean the backend failed, not the task
+    CLI_BACKEND_FAILURES = {
+        126: "is not executable",
+        127: "not found",
+    }
+
     def __init__(self):
         self.sessions: Dict[str, ClaudeCodeSession] = {}
+        self.running: Dict[int, List[RunningJob]] = {}
+        self.slots = asyncio.Semaphore(config.MAX_PARALLEL_SESSIONS)
+        self.cache: Optional[ResultCache] = None
+        if config.RESULT_CACHE_ENABLED:
+            limits = dict(
+                ttl=config.RESULT_CACHE_TTL,
+                max_entries=config.RESULT_CACHE_MAX_ENTRIES,
+                max_bytes=config.RESULT_CACHE_MAX_BYTES
+            )
+            if shared_state.store:
+                self.cache = SharedResultCache(shared_state.store, **limits)
+            else:
+                self.cache = ResultCache(**limits)
+        # Per-session git worktrees, so parallel sessions don't share a checkout
+        self.worktrees: Optional[WorktreePool] = (
+            WorktreePool(config.WORKTREE_ROOT, config.WORKTREE_POOL_SIZE) if config.WORKTREE_POOL_SIZE else None
+        )
+        # Circuit breakers for the CLI and API backends
+        self.health = BackendHealth(
+            failure_threshold=config.BACKEND_FAILURE_THRESHOLD,
+            cooldown=config.BACKEND_COOLDOWN
+        )
+        # Queue runs for the executor daemon instead of running them here
+        self.jobs: Optional[JobStore] = JobStore(config.EXECUTOR_DB) if config.EXECUTOR_DB else None
 
     async def execute_command(
         self,
         user_id: int,
         prompt: str,
-        context: str = "backend"
+        context: str = "backend",
+        use_cache: bool = True,
+        chat_id: Optional[int] = None,
+        on_progress: Optional[Callable[[str], None]] = None
     ) -> dict:
-        """Execute a Claude Code command"""
+        """
+        Execute a Claude Code command
+
+        chat_id: where the result goes if the bot restarts before the executor finishes
+        on_progress: called with the latest output while the run is in progress
+        """
+
+        with tracer.span('bridge.execute_command', context=context, prompt_chars=len(prompt)) as span:
+            result = await self._execute_command(
+                user_id, prompt, context, use_cache, chat_id or user_id, on_progress
+            )
+            span.set(
+                success=result.get('success'),
+                cached=bool(result.get('cached')),
+                cancelled=bool(result.get('cancelled')),
+                output_chars=len(result.get('output') or ''),
+                files_changed=len(result.get('files_changed') or [])
+            )
+            return result
 
+    async def _execute_command(
+        self,
+        user_id: int,
+        prompt: str,
+        context: str,
+        use_cache: bool,
+        chat_id: int,
+        on_progress: Optional[Callable[[str], None]]
+    ) -> dict:
         session_id = f"{user_id}_{context}"
 
         # Get or create session
@@ -72,11 +203,32 @@ class ClaudeCodeBridge:
         logger.info(f"Executing command for user {user_id} in context {context}: {prompt[:50]}...")
 
         try:
+            # Serve repeatable read-only requests from cache if the tree is unchanged
+            cache_key = None
+            if self.cache and use_cache and self.cache.is_cacheable(prompt):
+                fingerprint = await self._cache_fingerprint(session)
+                if fingerprint:
+                    cache_key = self.cache.make_key(context, prompt, fingerprint)
+                    cached = self.cache.get(cache_key)
+                    if cached:
+                        logger.info(f"Cache hit for user {user_id} in context {context}")
+                        session.add_to_history(prompt, cached)
+                        return cached
+
             # Execute the command
-            result = await self._run_claude_code(session, prompt)
+            if self.jobs:
+                result = await self._run_remote(session, prompt, chat_id, on_progress)
+            else:
+                result = await self._run_tracked(session, prompt, on_progress=on_progress)
+
+            # Only cache runs that succeeded and left the tree untouched
+            if cache_key and result.get('success') and not result.get('files_changed'):
+                self.cache.put(cache_key, prompt, context, result)
 
             # Add to history
             session.add_to_history(prompt, result)
+            if not result.get('cancelled'):
+                await self._archive(session, prompt, result)
 
             return result
 
@@ -88,6 +240,193 @@ class ClaudeCodeBridge:
                 'output': f"❌ Error: {str(e)}"
             }
 
+    async def _run_tracked(
+        self,
+        session: ClaudeCodeSession,
+        prompt: str,
+        job: Optional[RunningJob] = None,
+        on_progress: Optional[Callable[[str], None]] = None
+    ) -> dict:
+        """Run Claude in a slot, as a task that cancel() can abort"""
+
+        job = job or RunningJob(session.user_id, session.context, prompt)
+        job.on_progress = job.on_progress or on_progress
+        job.waiter = asyncio.current_task()
+        self.running.setdefault(session.user_id, []).append(job)
+        working_dir = session.working_dir
+
+        try:
+            try:
+                with STAGE_SECONDS.time('queue_wait'), tracer.span('queue_wait'):
+                    await self.slots.acquire()
+                try:
+                    if job.cancelled:
+                        raise asyncio.CancelledError()
+                    async with self._checkout(session) as working_dir:
+                        token = _current_job.set(job)
+                        try:
+                            job.task = asyncio.create_task(self._run_claude_code(session, prompt, working_dir))
+                        finally:
+                            _current_job.reset(token)
+                        run_started = time.monotonic()
+                        run_started_at = time.time()
+                        result = await job.task
+                    recorder.record_backend(
+                        session.user_id, session.context, result.get('backend', ''),
+                        time.monotonic() - run_started, len(result.get('output') or ''),
+                        bool(result.get('success')), route=result.get('route', '')
+                    )
+                    await self._record_test_run(session, result, run_started_at)
+                finally:
+                    self.slots.release()
+            except asyncio.CancelledError:
+                if not job.cancelled:
+                    # Our caller was cancelled - stop the run and propagate
+                    if job.task:
+                        job.task.cancel()
+                    raise
+
+            # A killed process may drain its output before the task sees the cancel
+            if not job.cancelled:
+                return result
+
+            logger.info(f"Run cancelled for user {session.user_id} after {job.elapsed:.1f}s")
+            return {
+                'success': False,
+                'cancelled': True,
+                'error': 'Cancelled by user',
+                'output': job.partial_output,
+                'files_changed': [],
+                'tests_run': {},
+                'working_dir': working_dir,
+                'timestamp': datetime.now().isoformat()
+            }
+
+        finally:
+            # Runs can outlast SESSION_TIMEOUT; the session only ages from when its last run ended
+            session.update_activity()
+            jobs = self.running.get(session.user_id, [])
+            if job in jobs:
+                jobs.remove(job)
+            if not jobs:
+                self.running.pop(session.user_id, None)
+
+    @asynccontextmanager
+    async def _checkout(self, session: ClaudeCodeSession):
+        """The session's working directory (its leased worktree when the pool is on), held for the block"""
+        if not self.worktrees:
+            yield session.working_dir
+            return
+        async with self.worktrees.checkout(session.session_id, session.working_dir) as working_dir:
+            yield working_dir
+
+    @asynccontextmanager
+    async def workspace(self, user_id: int, context: str):
+        """
+        Directory a user's runs in `context` work in, for git/test commands outside a run
+
+        With the executor daemon the worktree is leased in that process, so this is the shared checkout.
+        """
+        session = self._get_or_create_session(f"{user_id}_{context}", context, user_id)
+        if self.jobs:
+            yield session.working_dir
+            return
+        async with self._checkout(session) as working_dir:
+            yield working_dir
+
+    async def _cache_fingerprint(self, session: ClaudeCodeSession) -> Optional[str]:
+        """Fingerprint of the tree the session's next run executes in (None if it can't be known here)"""
+        if not self.worktrees:
+            return await self._repo_fingerprint(session.working_dir)
+        if self.jobs:
+            return None  # The executor leases the worktree in its own process
+        async with self._checkout(session) as working_dir:
+            return await self._repo_fingerprint(working_dir)
+
+    async def _run_remote(
+        self,
+        session: ClaudeCodeSession,
+        prompt: str,
+        chat_id: int,
+        on_progress: Optional[Callable[[str], None]]
+    ) -> dict:
+        """Queue the run for the executor daemon and wait for its result"""
+
+        job_id = self.jobs.submit(session.user_id, chat_id, session.context, prompt)
+        logger.info(f"Queued job {job_id} for the executor")
+        progress = ''
+        last_update = time.monotonic()
+
+        # If this task dies (bot restart), the job keeps running and
+        # deliver_finished_jobs() sends the result once polling stops
+        with STAGE_SECONDS.time('claude_execution'), tracer.span('executor_job', job_id=job_id):
+            while True:
+                await asyncio.sleep(self.EXECUTOR_POLL_INTERVAL)
+                job = self.jobs.poll(job_id)
+                if job['status'] in FINISHED:
+                    break
+                # New output, or a heartbeat so the elapsed time keeps moving
+                heartbeat = config.HEARTBEAT_INTERVAL and time.monotonic() - last_update >= config.HEARTBEAT_INTERVAL
+                if on_progress and (job['progress'] != progress or heartbeat):
+                    progress = job['progress']
+                    last_update = time.monotonic()
+                    on_progress(progress)
+
+        result = job['result']
+        if not self.jobs.claim_delivery(job_id):
+            # deliver_finished_jobs() took it (e.g. after a slow poll) and has sent it already
+            result['delivered_elsewhere'] = True
+        result.setdefault('working_dir', session.working_dir)
+        result.setdefault('files_changed', [])
+        result.setdefault('tests_run', {})
+        return result
+
+    def finished_jobs(self, stale_after: float = 30.0) -> List[dict]:
+        """Executor results whose waiting handler is gone; each is returned to one caller only"""
+        if not self.jobs:
+            return []
+        return [job for job in self.jobs.undelivered(stale_after) if self.jobs.claim_delivery(job['id'])]
+
+    async def cancel(self, user_id: int) -> List[RunningJob]:
+        """Cancel all in-flight runs for a user; returns the cancelled jobs"""
+
+        jobs = list(self.running.get(user_id, []))
+        for job in jobs:
+            await self.cancel_job(job)
+
+        if self.jobs:
+            jobs += self.jobs.request_cancel(user_id)
+
+        if jobs:
+            logger.info(f"Cancelled {len(jobs)} run(s) for user {user_id}")
+        return jobs
+
+    async def cancel_job(self, job: RunningJob):
+        """Cancel a single in-flight run"""
+        job.cancelled = True
+        if job.process:
+            await self._terminate_process(job.process)
+        if job.task:
+            job.task.cancel()
+        elif job.waiter:
+            # Still queued for a slot
+            job.waiter.cancel()
+
+    @staticmethod
+    async def _terminate_process(process: asyncio.subprocess.Process, grace: float = 2.0):
+        """Terminate a subprocess and everything it spawned"""
+        if process.returncode is not None:
+            return
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(process.wait(), timeout=grace)
+            except asyncio.TimeoutError:
+                os.killpg(process.pid, signal.SIGKILL)
+                await process.wait()
+        except ProcessLookupError:
+            pass
+
     def _get_or_create_session(
         self,
         session_id: str,
@@ -107,45 +446,127 @@ class ClaudeCodeBridge:
     async def _run_claude_code(
         self,
         session: ClaudeCodeSession,
-        prompt: str
+        prompt: str,
+        working_dir: str
     ) -> dict:
-        """Run Claude Code and capture results"""
+        """Run Claude Code in working_dir and capture results"""
 
         from config import BotConfig
 
-        working_dir = session.working_dir
-        auth_method = BotConfig.get_auth_method()
+        with STAGE_SECONDS.time('backend_resolution'), tracer.span('backend_resolution'):
+            auth_method = BotConfig.get_auth_method()
 
         logger.info(f"Using auth method: {auth_method}")
-
-        try:
-            if auth_method == 'cli':
-                # Use Claude Code CLI (for users with Claude subscriptions)
-                result = await self._call_claude_cli(prompt, working_dir)
-            elif auth_method == 'api':
-                # Use Anthropic API (for users with API keys)
-                result = await self._call_claude_api(prompt, working_dir)
+        tracer.annotate(backend=auth_method)
+
+        if auth_method not in ('cli', 'api'):
+            raise Exception("No authentication method available")
+
+        # The other backend is the fallback; backends with an open circuit are skipped
+        # (allow() is only asked right before a backend is used, as it may claim the probe)
+        backends = [auth_method, 'api' if auth_method == 'cli' else 'cli']
+        if not self.health[auth_method].allow():
+            logger.info(f"Skipping {auth_method} backend (circuit open)")
+            tracer.annotate(skipped=auth_method)
+            if self.health[backends[1]].allow():
+                backends.reverse()
             else:
-                raise Exception("No authentication method available")
+                logger.warning("Both backends' circuits are open, trying the primary anyway")
+            backends.pop()
 
-            return result
+        # Only read-only requests are hedged: cancelling the losing run could leave its
+        # edits half-applied
+        if config.HEDGING_ENABLED and len(backends) > 1 and not ResultCache.SIDE_EFFECT_PATTERN.search(prompt):
+            return await self._run_hedged(backends[0], backends[1], prompt, working_dir)
 
+        try:
+            return await self._call_backend(backends[0], prompt, working_dir)
         except Exception as e:
             logger.error(f"Execution failed: {str(e)}")
+            if len(backends) == 1 or not self.health[backends[1]].allow():
+                raise e
             # If one method fails, try the other as fallback
-            if auth_method == 'cli':
-                logger.info("CLI failed, trying API fallback...")
-                try:
-                    return await self._call_claude_api(prompt, working_dir)
-                except:
-                    raise e
-            elif auth_method == 'api':
-                logger.info("API failed, trying CLI fallback...")
-                try:
-                    return await self._call_claude_cli(prompt, working_dir)
-                except:
-                    raise e
-            raise e
+            logger.info(f"{backends[0]} failed, trying {backends[1]} fallback...")
+            tracer.annotate(fallback=backends[1], primary_error=str(e)[:200])
+            try:
+                return await self._call_backend(backends[1], prompt, working_dir)
+            except:
+                raise e
+
+    async def _run_hedged(self, primary: str, secondary: str, prompt: str, working_dir: str) -> dict:
+        """
+        Start the primary; if it hasn't answered after its recent p95 latency,
+        start the secondary too and keep whichever result comes first,
+        cancelling the other. A primary that fails sooner falls back at once.
+        """
+        delay = self.health[primary].percentile(config.HEDGE_PERCENTILE) or config.HEDGE_DELAY
+        first = asyncio.create_task(self._call_backend(primary, prompt, working_dir))
+        tasks = {first: primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                del tasks[first]
+                if first.exception() is None:
+                    return first.result()
+                primary_error = first.exception()
+                logger.error(f"Execution failed: {str(primary_error)}")
+                tracer.annotate(fallback=secondary, primary_error=str(primary_error)[:200])
+            else:
+                primary_error = None
+                logger.info(f"{primary} slower than {delay:.1f}s, hedging with {secondary}")
+                tracer.annotate(hedged=secondary, hedge_delay=round(delay, 2))
+
+            if not self.health[secondary].allow():
+                if primary_error:
+                    raise primary_error
+                return await first
+            hedge = asyncio.create_task(self._call_backend(secondary, prompt, working_dir, hedge=not primary_error))
+            tasks[hedge] = secondary
+            hedged = primary_error is None
+
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    backend = tasks.pop(task)
+                    if task.exception() is None:
+                        if hedged:
+                            HEDGES.inc(backend)
+                        return task.result()
+                    logger.error(f"Execution failed on {backend}: {task.exception()}")
+                    primary_error = primary_error or task.exception()
+            raise primary_error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _call_backend(self, backend: str, prompt: str, working_dir: str, hedge: bool = False) -> dict:
+        """One attempt on one backend, recorded by its circuit breaker"""
+        job = _current_job.get()
+        if hedge and job:
+            # Runs as its own task, so this only affects the hedge: keep its output
+            # out of the live progress until it wins
+            _current_job.set(RunningJob(job.user_id, job.context, job.prompt))
+
+        breaker = self.health[backend]
+        started = time.perf_counter()
+        try:
+            if backend == 'cli':
+                # Use Claude Code CLI (for users with Claude subscriptions)
+                result = await self._call_claude_cli(prompt, working_dir)
+            else:
+                # Use Anthropic API (for users with API keys)
+                result = await self._call_claude_api(prompt, working_dir)
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success(time.perf_counter() - started)
+        result['backend'] = backend
+        return result
 
     async def _call_claude_api(self, prompt: str, working_dir: str) -> dict:
         """Call Claude API directly (preferred method)"""
@@ -155,8 +576,8 @@ class ClaudeCodeBridge:
 
         # Import Anthropic client
         try:
-            from anthropic import Anthropic
-            client = Anthropic(api_key=config.ANTHROPIC_API_KEY)
+            from anthropic import AsyncAnthropic
+            client = AsyncAnthropic(api_key=config.ANTHROPIC_API_KEY)
 
             # Construct system prompt for coding context
             system_prompt = f"""You are a helpful coding assistant working in the directory: {working_dir}
@@ -177,21 +598,37 @@ When making changes:
 
 Format your response to be clear and actionable."""
 
-            # Call Claude
-            response = client.messages.create(
-                model=config.CLAUDE_MODEL,
-                max_tokens=4096,
-                system=system_prompt,
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }]
-            )
-
-            output = response.content[0].text
+            # Call Claude (streamed, so cancelling the task aborts the HTTP stream)
+            job = _current_job.get()
+            route = router.route(job.user_id if job else 0, prompt, job.context if job else '')
+            tracer.annotate(model=route.model, route=route.tier, route_reason=route.reason)
+            parts = []
+            started = time.perf_counter()
+            with STAGE_SECONDS.time('claude_execution'), \
+                    tracer.span('claude_api', model=route.model) as span:
+                async with client.messages.stream(
+                    model=route.model,
+                    max_tokens=route.max_tokens,
+                    system=system_prompt,
+                    messages=[{
+                        "role": "user",
+                        "content": prompt
+                    }]
+                ) as stream:
+                    async for event in stream:
+                        if event.type == 'content_block_delta':
+                            parts.append(event.delta.text)
+                            if job:
+                                job.record_output(event.delta.text)
+
+                output = ''.join(parts)
+                span.set(output_chars=len(output))
+            router.record(route, time.perf_counter() - started)
 
             # Parse output for structured data
             result = self._parse_claude_response(output, working_dir)
+            result['model'] = route.model
+            result['route'] = route.tier
 
             return result
 
@@ -208,23 +645,93 @@ Format your response to be clear and actionable."""
         import shlex
         escaped_prompt = shlex.quote(prompt)
 
-        # Execute command via subprocess
-        cmd = f'cd {working_dir} && echo {escaped_prompt} | timeout {config.CLAUDE_TIMEOUT} claude-code --non-interactive 2>&1 || true'
-
-        process = await asyncio.create_subprocess_shell(
-            cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+        # Execute command via subprocess, streaming events as they happen so the
+        # output watchdog can tell a working run from a hung one (no fixed timeout)
+        cmd = (
+            f'cd {working_dir} && echo {escaped_prompt} | '
+            'claude-code --non-interactive --output-format stream-json --verbose 2>&1'
         )
 
-        stdout, stderr = await process.communicate()
-        output = stdout.decode() + stderr.decode()
+        with tracer.span('claude_cli', prompt_chars=len(prompt)) as cli_span:
+            # Own process group so cancel() and the watchdog can kill the shell and claude-code together
+            execution_started = time.perf_counter()
+            SUBPROCESS_SPAWNS.inc('claude-code')
+            process = await asyncio.create_subprocess_shell(
+                cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
+            )
+
+            job = _current_job.get()
+            if job:
+                job.process = process
 
-        return self._parse_claude_response(output, working_dir)
+            watchdog = OutputWatchdog(
+                config.CLAUDE_IDLE_TIMEOUT,
+                config.CLAUDE_MAX_RUNTIME,
+                config.HEARTBEAT_INTERVAL,
+                job.heartbeat if job else None
+            )
 
-    def _parse_claude_response(self, output: str, working_dir: str) -> dict:
+            def record(text: str):
+                # Every event counts as activity, even one without text (e.g. a tool starting)
+                watchdog.touch()
+                if job and text:
+                    job.record_output(text)
+
+            # The events as text (what Claude said, tool calls and their output),
+            # spooled to disk past OUTPUT_SPOOL_THRESHOLD; parsed from there
+            stdout = self._new_capture()
+            stderr = self._new_capture()
+            watch = asyncio.create_task(watchdog.watch(process, self._terminate_process))
+            try:
+                try:
+                    await asyncio.gather(
+                        StreamJsonDecoder().read_from(process.stdout, stdout, record),
+                        stderr.read_from(process.stderr, lambda chunk: record(chunk.decode(errors='replace')))
+                    )
+                    await process.wait()
+                except asyncio.CancelledError:
+                    await self._terminate_process(process)
+                    raise
+                finally:
+                    watch.cancel()
+                    STAGE_SECONDS.observe('claude_execution', time.perf_counter() - execution_started)
+
+                cli_span.set(output_chars=stdout.size + stderr.size, exit_code=process.returncode)
+                if watchdog.reason:
+                    cli_span.set(watchdog=watchdog.reason)
+                    raise BackendError(f"claude-code stopped: {watchdog.reason}")
+                if process.returncode in self.CLI_BACKEND_FAILURES:
+                    raise BackendError(
+                        f"claude-code {self.CLI_BACKEND_FAILURES[process.returncode]}: {stdout.tail()[-200:].strip()}"
+                    )
+                return self._parse_claude_response(CombinedOutput(stdout, stderr), working_dir)
+            finally:
+                stdout.close()
+                stderr.close()
+
+    @staticmethod
+    def _new_capture() -> OutputCapture:
+        return OutputCapture(
+            spool_threshold=config.OUTPUT_SPOOL_THRESHOLD,
+            max_bytes=config.OUTPUT_MAX_BYTES,
+            tail_bytes=config.OUTPUT_TAIL_BYTES
+        )
+
+    def _parse_claude_response(self, output: Union[str, CombinedOutput], working_dir: str) -> dict:
         """Parse Claude's response into structured format"""
+        size = len(output) if isinstance(output, str) else output.size
+        with STAGE_SECONDS.time('parse'), tracer.span('parse', output_chars=size):
+            return self._parse_output(output, working_dir)
+
+    @staticmethod
+    def _blocks(output: Union[str, CombinedOutput]) -> Iterable[str]:
+        """Text to scan: the string itself, or a capture read back block by block"""
+        return [output] if isinstance(output, str) else output.blocks()
 
+    def _parse_output(self, output: Union[str, CombinedOutput], working_dir: str) -> dict:
         # Extract files changed
         files_changed = self._extract_files_changed(output, working_dir)
 
@@ -232,18 +739,33 @@ Format your response to be clear and actionable."""
         tests_run = self._extract_test_results(output)
 
         # Check for errors
-        has_error = bool(re.search(r'(error|exception|failed|traceback)', output, re.IGNORECASE))
+        error_pattern = re.compile(r'(error|exception|failed|traceback)', re.IGNORECASE)
+        has_error = any(error_pattern.search(block) for block in self._blocks(output))
 
-        return {
+        result = {
             'success': not has_error,
-            'output': output,
+            # Large captures keep only their head and tail in the result
+            'output': output if isinstance(output, str) else output.summary(),
             'files_changed': files_changed,
             'tests_run': tests_run,
             'working_dir': working_dir,
             'timestamp': datetime.now().isoformat()
         }
 
-    def _extract_files_changed(self, output: str, working_dir: str) -> List[str]:
+        # The full output (secrets redacted before they reach disk), for paging through it from the reply
+        size = len(output) if isinstance(output, str) else output.size
+        if outputs and size > outputs.page_chars:
+            try:
+                with tracer.span('store_output'):
+                    result['output_id'], result['output_pages'] = outputs.put(
+                        security.sanitize(block) for block in self._blocks(output)
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"Could not store full output: {e}")
+
+        return result
+
+    def _extract_files_changed(self, output: Union[str, CombinedOutput], working_dir: str) -> List[str]:
         """Extract list of files that were modified"""
 
         files = []
@@ -255,20 +777,22 @@ Format your response to be clear and actionable."""
             r'Writing to\s+([^\n]+)',
         ]
 
-        for pattern in patterns:
-            matches = re.findall(pattern, output, re.IGNORECASE)
-            files.extend(matches)
+        for block in self._blocks(output):
+            for pattern in patterns:
+                files.extend(re.findall(pattern, block, re.IGNORECASE))
 
         # Get actual git changes
         try:
             import subprocess
-            result = subprocess.run(
-                ['git', 'diff', '--name-only'],
-                cwd=working_dir,
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
+            SUBPROCESS_SPAWNS.inc('git')
+            with tracer.span('git.diff_names'):
+                result = subprocess.run(
+                    ['git', 'diff', '--name-only'],
+                    cwd=working_dir,
+                    capture_output=True,
+                    text=True,
+                    timeout=5
+                )
             if result.returncode == 0:
                 git_files = [f.strip() for f in result.stdout.split('\n') if f.strip()]
                 files.extend(git_files)
@@ -278,7 +802,7 @@ Format your response to be clear and actionable."""
         # Remove duplicates and return
         return list(set(files))
 
-    def _extract_test_results(self, output: str) -> dict:
+    def _extract_test_results(self, output: Union[str, CombinedOutput]) -> dict:
         """Extract test execution results"""
 
         tests = {
@@ -289,23 +813,39 @@ Format your response to be clear and actionable."""
             'ran': False
         }
 
-        # pytest format
-        pytest_match = re.search(
-            r'(\d+)\s+passed(?:,\s+(\d+)\s+failed)?(?:,\s+(\d+)\s+skipped)?',
-            output
-        )
+        # First match of each format, scanning block by block
+        pytest_match = jest_match = unittest_match = None
+        for block in self._blocks(output):
+            # pytest format (pytest itself lists failures first)
+            pytest_match = pytest_match or re.search(
+                r'(?:(\d+)\s+failed,\s+)?(\d+)\s+passed(?:,\s+(\d+)\s+failed)?(?:,\s+(\d+)\s+skipped)?',
+                block
+            )
+            # Jest/npm test format
+            jest_match = jest_match or re.search(
+                r'Tests:\s+(?:(\d+)\s+failed,\s+)?(\d+)\s+passed,\s+(\d+)\s+total',
+                block
+            )
+            # unittest/Django format (no counts per outcome, those come from the per-test lines)
+            unittest_match = unittest_match or re.search(r'^Ran \d+ tests? in ', block, re.MULTILINE)
+            if pytest_match and jest_match:
+                break
+
+        # Per-test outcomes, for the test result store (popped before the result is returned).
+        # They only count as a test run next to a runner's summary line
+        cases = parse_cases(self._blocks(output))
+        if cases:
+            tests['cases'] = cases
+            if unittest_match and not (pytest_match or jest_match):
+                tests.update(counts(cases))
+
         if pytest_match:
             tests['ran'] = True
-            tests['passed'] = int(pytest_match.group(1))
-            tests['failed'] = int(pytest_match.group(2) or 0)
-            tests['skipped'] = int(pytest_match.group(3) or 0)
+            tests['passed'] = int(pytest_match.group(2))
+            tests['failed'] = int(pytest_match.group(1) or pytest_match.group(3) or 0)
+            tests['skipped'] = int(pytest_match.group(4) or 0)
             tests['total'] = tests['passed'] + tests['failed'] + tests['skipped']
 
-        # Jest/npm test format
-        jest_match = re.search(
-            r'Tests:\s+(?:(\d+)\s+failed,\s+)?(\d+)\s+passed,\s+(\d+)\s+total',
-            output
-        )
         if jest_match:
             tests['ran'] = True
             tests['failed'] = int(jest_match.group(1) or 0)
@@ -315,13 +855,85 @@ Format your response to be clear and actionable."""
 
         return tests
 
-    async def get_status(self, working_dir: str) -> dict:
+    async def _archive(self, session: ClaudeCodeSession, prompt: str, result: dict):
+        """Append the interaction to the searchable transcript archive (/search), secrets redacted"""
+        if not archive:
+            return
+        try:
+            with tracer.span('archive_transcript'):
+                await asyncio.to_thread(
+                    archive.add, session.user_id, session.context, security.sanitize(prompt),
+                    security.sanitize(result.get('output') or ''),
+                    result.get('files_changed') or [], bool(result.get('success'))
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not archive interaction: {e}")
+
+    async def _record_test_run(self, session: ClaudeCodeSession, result: dict, started_at: float):
+        """Store the run's test results (from its output, or JUnit XML it wrote) for /status"""
+        tests = result.get('tests_run') or {}
+        cases = tests.pop('cases', [])
+        if not test_runs:
+            return
+
+        working_dir = result.get('working_dir') or session.working_dir
+        source = 'output'
+        try:
+            reports = await asyncio.to_thread(find_junit_reports, working_dir, started_at)
+            junit_cases = await asyncio.to_thread(parse_junit, reports) if reports else []
+            if junit_cases:
+                cases, source = junit_cases, 'junit'
+                if not tests.get('ran'):
+                    tests.update(counts(cases))
+            if not tests.get('ran'):
+                return
+
+            fingerprint = await self._repo_fingerprint(working_dir) or ''
+            with tracer.span('store_test_run', cases=len(cases)):
+                await asyncio.to_thread(
+                    test_runs.record, session.context, fingerprint.split(':')[0], fingerprint, source, tests, cases
+                )
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Could not store test results: {e}")
+
+    async def _repo_fingerprint(self, working_dir: str) -> Optional[str]:
+        """HEAD commit plus a hash of uncommitted changes (None outside a git repo)"""
+
+        async def git(*args) -> Optional[bytes]:
+            SUBPROCESS_SPAWNS.inc('git')
+            process = await asyncio.create_subprocess_exec(
+                'git', *args,
+                cwd=working_dir,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            stdout, _ = await process.communicate()
+            return stdout if process.returncode == 0 else None
+
+        try:
+            with tracer.span('git.fingerprint'):
+                head, status, diff = await asyncio.gather(
+                    git('rev-parse', 'HEAD'),
+                    git('status', '--porcelain', '-z'),
+                    git('diff', 'HEAD', '--binary')
+                )
+        except Exception as e:
+            logger.warning(f"Could not fingerprint repository: {e}")
+            return None
+
+        if head is None or status is None or diff is None:
+            return None
+
+        dirty = hashlib.sha256(status + b'\0' + diff).hexdigest()[:16]
+        return f"{head.decode().strip()}:{dirty}"
+
+    async def get_status(self, working_dir: str, context: Optional[str] = None) -> dict:
         """Get project status"""
 
         status = {
             'git': await self._get_git_status(working_dir),
             'services': await self._get_services_status(),
-            'tests': await self._get_last_test_status(working_dir),
+            'tests': await self._get_last_test_status(working_dir, context),
         }
 
         return status
@@ -330,6 +942,7 @@ Format your response to be clear and actionable."""
         """Get git status"""
 
         try:
+            SUBPROCESS_SPAWNS.inc('git')
             process = await asyncio.create_subprocess_exec(
                 'git', 'status', '--short',
                 cwd=working_dir,
@@ -379,6 +992,7 @@ Format your response to be clear and actionable."""
     async def _check_port(self, port: int) -> bool:
         """Check if a port is open"""
         try:
+            SUBPROCESS_SPAWNS.inc('lsof')
             process = await asyncio.create_subprocess_exec(
                 'lsof', f'-i:{port}',
                 stdout=asyncio.subprocess.PIPE,
@@ -392,6 +1006,7 @@ Format your response to be clear and actionable."""
     async def _check_process(self, name: str) -> bool:
         """Check if a process is running"""
         try:
+            SUBPROCESS_SPAWNS.inc('pgrep')
             process = await asyncio.create_subprocess_exec(
                 'pgrep', '-f', name,
                 stdout=asyncio.subprocess.PIPE,
@@ -402,28 +1017,87 @@ Format your response to be clear and actionable."""
         except:
             return False
 
-    async def _get_last_test_status(self, working_dir: str) -> dict:
-        """Get last test run status"""
-        # This would check for latest test output or run quick tests
-        return {'status': 'unknown'}
+    async def _get_last_test_status(self, working_dir: str, context: Optional[str] = None) -> dict:
+        """Latest stored test run for the context, with its failures, slowest and flaky tests"""
+        if not test_runs or not context:
+            return {'status': 'unknown'}
 
-    def cleanup_old_sessions(self, max_age_seconds: int = 3600):
-        """Remove old inactive sessions"""
+        try:
+            run = await asyncio.to_thread(test_runs.latest, context)
+            if not run:
+                return {'status': 'unknown'}
+            failures, slowest, flaky = await asyncio.gather(
+                asyncio.to_thread(test_runs.failures, run['id']),
+                asyncio.to_thread(test_runs.slowest, run['id']),
+                asyncio.to_thread(test_runs.flaky, context)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read test results: {e}")
+            return {'status': 'unknown'}
+
+        fingerprint = await self._repo_fingerprint(working_dir)
+        return {
+            'status': 'failed' if run['failed'] else 'passed',
+            'run': run,
+            'current': bool(fingerprint) and fingerprint == run['fingerprint'],
+            'failures': failures,
+            'slowest': slowest,
+            'flaky': flaky,
+        }
+
+    async def cleanup_old_sessions(self, max_age_seconds: int = 3600):
+        """Remove old inactive sessions (and return their worktrees to the pool)"""
 
         now = datetime.now()
         to_remove = []
 
         for session_id, session in self.sessions.items():
             age = (now - session.last_activity).total_seconds()
-            if age > max_age_seconds:
+            running = any(job.context == session.context for job in self.running.get(session.user_id, []))
+            if age > max_age_seconds and not running:
                 to_remove.append(session_id)
 
         for session_id in to_remove:
+            # A worktree still in use (e.g. a status check holding it) keeps its session for next time
+            if self.worktrees and not await self.worktrees.release(session_id):
+                continue
             logger.info(f"Removing old session: {session_id}")
             del self.sessions[session_id]
 
+        if shared_state.store:
+            shared_state.store.purge('sessions', max_age_seconds)
+
         return len(to_remove)
 
+    def user_sessions(self, user_id: int) -> List[dict]:
+        """Summaries of a user's sessions (across all workers when sharded)"""
+        if shared_state.store:
+            summaries = [s for _, s in shared_state.store.items('sessions') if s['user_id'] == user_id]
+            for summary in summaries:
+                summary['last_activity'] = datetime.fromisoformat(summary['last_activity'])
+            return summaries
+
+        return [
+            {
+                'user_id': s.user_id,
+                'context': s.context,
+                'last_activity': s.last_activity,
+                'commands': len(s.history),
+            }
+            for s in self.sessions.values()
+            if s.user_id == user_id
+        ]
+
 
 # Global bridge instance
 bridge = ClaudeCodeBridge()
+
+metrics.gauge('telegram_claude_active_sessions', 'Claude sessions in memory', lambda: len(bridge.sessions))
+metrics.gauge(
+    'telegram_claude_running_jobs', 'Claude runs in flight',
+    lambda: sum(len(jobs) for jobs in bridge.running.values())
+)
+metrics.gauge(
+    'telegram_claude_queued_jobs', 'Claude runs waiting for a free slot',
+    lambda: sum(1 for jobs in bridge.running.values() for job in jobs if job.task is None)
+)
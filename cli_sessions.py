@@ -0,0 +1,126 @@
+"""
+Persistent map from (user, context) to a Claude CLI conversation
+The proxy resumes each user's own conversation by ID (--resume) instead of
+whatever ran last in the project directory (--continue). Conversations are
+rotated once they get too old, too long or too large, so the transcript the
+CLI reloads on every turn stays bounded.
+"""
+
+import asyncio
+import glob
+import json
+import os
+import time
+import uuid
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Where the CLI keeps conversation transcripts (<project slug>/<session id>.jsonl)
+CLI_PROJECTS_DIR = os.path.join(os.path.expanduser('~'), '.claude', 'projects')
+
+
+class CLISession:
+    """One CLI conversation"""
+
+    def __init__(self, session_id: str, created: float, turns: int = 0, chars: int = 0):
+        self.session_id = session_id
+        self.created = created
+        self.turns = turns
+        self.chars = chars  # prompt + reply characters exchanged so far
+
+    @property
+    def started(self) -> bool:
+        """Whether the CLI already has this conversation (resume it rather than create it)"""
+        return self.turns > 0
+
+    def to_dict(self) -> dict:
+        return {'session_id': self.session_id, 'created': self.created, 'turns': self.turns, 'chars': self.chars}
+
+
+class CLISessionStore:
+    """
+    (user, context) -> CLISession, persisted as JSON at `path`
+
+    A session is rotated (replaced by a new one) when it is older than max_age
+    seconds, has max_turns turns, or its transcript exceeds max_bytes.
+    """
+
+    def __init__(self, path: str, max_age: float, max_turns: int, max_bytes: int):
+        self.path = path
+        self.max_age = max_age
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self.sessions: Dict[str, CLISession] = self._load()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def key(user_id: int, context: str) -> str:
+        return f"{user_id}:{context}"
+
+    def lock(self, key: str) -> asyncio.Lock:
+        """Turns of one conversation must not overlap (concurrent resumes fork it)"""
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+        return self._locks[key]
+
+    def get(self, key: str) -> CLISession:
+        """The conversation to use for the next turn, rotating a stale one"""
+        session = self.sessions.get(key)
+        if session:
+            reason = self._stale(session)
+            if not reason:
+                return session
+            logger.info(f"Rotating CLI session {session.session_id} for {key}: {reason}")
+        return self.rotate(key)
+
+    def rotate(self, key: str) -> CLISession:
+        """Start a fresh conversation for `key`"""
+        session = CLISession(str(uuid.uuid4()), time.time())
+        self.sessions[key] = session
+        self._save()
+        return session
+
+    def record_turn(self, key: str, session: CLISession, chars: int):
+        session.turns += 1
+        session.chars += chars
+        if self.sessions.get(key) is session:
+            self._save()
+
+    def _stale(self, session: CLISession) -> Optional[str]:
+        if time.time() - session.created > self.max_age:
+            return f"older than {self.max_age / 3600:.0f}h"
+        if session.turns >= self.max_turns:
+            return f"{session.turns} turns"
+        size = self.transcript_size(session)
+        if size > self.max_bytes:
+            return f"transcript is {size // 1024}KB"
+        return None
+
+    @staticmethod
+    def transcript_size(session: CLISession) -> int:
+        """Bytes the CLI reloads to resume: its transcript file, or our own estimate without one"""
+        paths = glob.glob(os.path.join(CLI_PROJECTS_DIR, '*', f"{session.session_id}.jsonl"))
+        try:
+            return max(os.path.getsize(path) for path in paths) if paths else session.chars
+        except OSError:
+            return session.chars
+
+    def _load(self) -> Dict[str, CLISession]:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return {key: CLISession(**value) for key, value in data.items()}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({key: session.to_dict() for key, session in self.sessions.items()}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist CLI sessions {self.path}: {e}")
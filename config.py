@@ -4,7 +4,7 @@ Configuration for Telegram Claude Code Bot
 
 import os
 from typing import List, Dict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 @dataclass
 class BotConfig:
@@ -26,9 +26,14 @@ class BotConfig:
     OPENAI_API_KEY: str = os.getenv('OPENAI_API_KEY', '')
 
     # Allowed Telegram User IDs (get from @userinfobot)
-    ALLOWED_USERS: List[int] = [
+    ALLOWED_USERS: List[int] = field(default_factory=lambda: [
         int(uid) for uid in os.getenv('ALLOWED_USER_IDS', '').split(',') if uid
-    ]
+    ])
+
+    # Admin Telegram User IDs (e.g. /metrics); defaults to ALLOWED_USERS when unset
+    ADMIN_USERS: List[int] = field(default_factory=lambda: [
+        int(uid) for uid in os.getenv('ADMIN_USER_IDS', '').split(',') if uid
+    ])
 
     # Project paths
     PROJECT_ROOT: str = os.getenv('PROJECT_ROOT', '/home/ubuntu/project')
@@ -37,7 +42,28 @@ class BotConfig:
 
     # Claude Code settings
     CLAUDE_MODEL: str = os.getenv('CLAUDE_MODEL', 'claude-sonnet-4-5-20250929')
-    CLAUDE_TIMEOUT: int = int(os.getenv('CLAUDE_TIMEOUT', '300'))  # 5 minutes
+    # CLI runs end after CLAUDE_IDLE_TIMEOUT seconds without a stream event (message, tool
+    # call or result), or CLAUDE_MAX_RUNTIME in total
+    CLAUDE_IDLE_TIMEOUT: int = int(os.getenv('CLAUDE_IDLE_TIMEOUT', '300'))
+    CLAUDE_MAX_RUNTIME: int = int(os.getenv('CLAUDE_MAX_RUNTIME', '3600'))  # 0 = no cap
+    HEARTBEAT_INTERVAL: int = int(os.getenv('HEARTBEAT_INTERVAL', '30'))  # "still working" updates
+    CLAUDE_MAX_TOKENS: int = int(os.getenv('CLAUDE_MAX_TOKENS', '4096'))
+
+    # Backend circuit breakers: skip the CLI or API for a while once this share of recent calls failed
+    BACKEND_FAILURE_THRESHOLD: float = float(os.getenv('BACKEND_FAILURE_THRESHOLD', '0.5'))
+    BACKEND_COOLDOWN: float = float(os.getenv('BACKEND_COOLDOWN', '60'))
+    # Hedging: start the other backend when the first is slower than its recent p95 (read-only requests)
+    HEDGING_ENABLED: bool = os.getenv('HEDGING_ENABLED', 'false').lower() == 'true'
+    HEDGE_PERCENTILE: float = float(os.getenv('HEDGE_PERCENTILE', '0.95'))
+    HEDGE_DELAY: float = float(os.getenv('HEDGE_DELAY', '60'))  # until there are enough samples
+
+    # API model routing: quick lookups go to a fast model, heavy work to a strong one
+    MODEL_ROUTING: bool = os.getenv('MODEL_ROUTING', 'false').lower() == 'true'
+    CLAUDE_FAST_MODEL: str = os.getenv('CLAUDE_FAST_MODEL', 'claude-haiku-4-5-20251001')
+    CLAUDE_FAST_MAX_TOKENS: int = int(os.getenv('CLAUDE_FAST_MAX_TOKENS', '1024'))
+    CLAUDE_STRONG_MODEL: str = os.getenv('CLAUDE_STRONG_MODEL', 'claude-opus-4-1-20250805')
+    CLAUDE_STRONG_MAX_TOKENS: int = int(os.getenv('CLAUDE_STRONG_MAX_TOKENS', '8192'))
+    MODEL_OVERRIDES: str = os.getenv('MODEL_OVERRIDES', '')  # user_id:tier,... (also /model)
 
     # Voice transcription settings
     VOICE_MODEL: str = os.getenv('VOICE_MODEL', 'whisper-1')  # or 'base', 'small', 'medium', 'large'
@@ -46,46 +72,123 @@ class BotConfig:
     # Rate limiting
     MAX_REQUESTS_PER_MINUTE: int = int(os.getenv('MAX_REQUESTS_PER_MINUTE', '10'))
 
+    # Outbound Telegram pacing (Bot API flood limits)
+    TELEGRAM_GLOBAL_RATE: float = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))  # msgs/sec, all chats
+    TELEGRAM_CHAT_INTERVAL: float = float(os.getenv('TELEGRAM_CHAT_INTERVAL', '1.0'))  # secs between msgs per chat
+    TELEGRAM_GROUP_INTERVAL: float = float(os.getenv('TELEGRAM_GROUP_INTERVAL', '3.0'))  # groups: 20/min
+
+    # Update delivery: long polling (default) or webhook
+    # Webhook mode is enabled by setting WEBHOOK_URL (public HTTPS base URL)
+    WEBHOOK_URL: str = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_LISTEN: str = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+    WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', '8443'))
+    WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', 'telegram')
+    WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET', '')
+    WEBHOOK_MAX_CONNECTIONS: int = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+    UPDATE_WORKERS: int = int(os.getenv('UPDATE_WORKERS', '1'))  # concurrent update handlers
+    UPDATE_QUEUE_SIZE: int = int(os.getenv('UPDATE_QUEUE_SIZE', '0'))  # 0 = unbounded
+    TELEGRAM_API_BASE_URL: str = os.getenv('TELEGRAM_API_BASE_URL', '')  # e.g. local stub for load tests
+
+    # Sharded worker processes (chats are split across BOT_WORKERS processes, 1 = single process)
+    BOT_WORKERS: int = int(os.getenv('BOT_WORKERS', '1'))
+    # Seconds the supervisor waits, in total, for workers to finish their running requests on
+    # shutdown before killing them (keep it below systemd's TimeoutStopSec, 90s by default)
+    WORKER_STOP_TIMEOUT: int = int(os.getenv('WORKER_STOP_TIMEOUT', '75'))
+    # SQLite file for state shared between workers (rate limits, result cache, sessions);
+    # a single process keeps that state in memory unless this is set
+    SHARED_STATE_PATH: str = os.getenv(
+        'SHARED_STATE_PATH',
+        os.path.join(os.path.expanduser('~'), '.cache', 'telegram-claude-bot', 'shared_state.db')
+        if BOT_WORKERS > 1 else ''
+    )
+
+    # Messages from one sender in a chat within this window are merged into one request (0 = off)
+    MESSAGE_DEBOUNCE_MS: int = int(os.getenv('MESSAGE_DEBOUNCE_MS', '1000'))
+
     # Session management
     SESSION_TIMEOUT: int = int(os.getenv('SESSION_TIMEOUT', '3600'))  # 1 hour
     MAX_PARALLEL_SESSIONS: int = int(os.getenv('MAX_PARALLEL_SESSIONS', '3'))
 
+    # Git worktree per session so parallel sessions don't share a checkout (0 = off).
+    # Sessions work on claude/<user>_<context> branches; pool size per repository
+    WORKTREE_POOL_SIZE: int = int(os.getenv('WORKTREE_POOL_SIZE', '0'))
+    WORKTREE_ROOT: str = os.path.expanduser(
+        os.getenv('WORKTREE_ROOT', '~/.cache/telegram-claude-bot/worktrees')
+    )
+
+    # Out-of-process executor: runs are queued in this SQLite file and run by
+    # `python executor.py` (empty = run Claude inside the bot process)
+    EXECUTOR_DB: str = os.getenv('EXECUTOR_DB', '')
+    EXECUTOR_MAX_ATTEMPTS: int = int(os.getenv('EXECUTOR_MAX_ATTEMPTS', '2'))  # read-only runs retried after an executor crash
+
     # Notification settings
     ENABLE_NOTIFICATIONS: bool = os.getenv('ENABLE_NOTIFICATIONS', 'true').lower() == 'true'
     NOTIFY_ON_ERROR: bool = os.getenv('NOTIFY_ON_ERROR', 'true').lower() == 'true'
     NOTIFY_ON_COMPLETION: bool = os.getenv('NOTIFY_ON_COMPLETION', 'true').lower() == 'true'
 
+    # Result cache for read-only requests (keyed on repo state)
+    RESULT_CACHE_ENABLED: bool = os.getenv('RESULT_CACHE_ENABLED', 'false').lower() == 'true'
+    RESULT_CACHE_TTL: int = int(os.getenv('RESULT_CACHE_TTL', '600'))  # 10 minutes
+    RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '128'))
+    RESULT_CACHE_MAX_BYTES: int = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+    # Claude CLI output capture: spooled to a temp file past the threshold, capped at
+    # OUTPUT_MAX_BYTES; replies and cancelled runs keep the last OUTPUT_TAIL_BYTES
+    OUTPUT_SPOOL_THRESHOLD: int = int(os.getenv('OUTPUT_SPOOL_THRESHOLD', str(1024 * 1024)))
+    OUTPUT_MAX_BYTES: int = int(os.getenv('OUTPUT_MAX_BYTES', str(100 * 1024 * 1024)))
+    OUTPUT_TAIL_BYTES: int = int(os.getenv('OUTPUT_TAIL_BYTES', str(64 * 1024)))
+    # Full outputs longer than a page are kept compressed for the ◀ / ▶ pager ('' = off)
+    OUTPUT_STORE_PATH: str = os.getenv(
+        'OUTPUT_STORE_PATH',
+        os.path.join(os.path.expanduser('~'), '.cache', 'telegram-claude-bot', 'outputs.db')
+    )
+    OUTPUT_STORE_MAX_BYTES: int = int(os.getenv('OUTPUT_STORE_MAX_BYTES', str(64 * 1024 * 1024)))
+    OUTPUT_STORE_TTL: int = int(os.getenv('OUTPUT_STORE_TTL', str(7 * 24 * 3600)))
+    OUTPUT_PAGE_CHARS: int = int(os.getenv('OUTPUT_PAGE_CHARS', '3000'))
+    # Every interaction (prompt, output, changed files), full-text searchable with /search ('' = off)
+    TRANSCRIPT_ARCHIVE_PATH: str = os.getenv(
+        'TRANSCRIPT_ARCHIVE_PATH',
+        os.path.join(os.path.expanduser('~'), '.cache', 'telegram-claude-bot', 'transcripts.db')
+    )
+    # Test results of every run (per test, per commit) shown by /status ('' = off)
+    TEST_RESULTS_DB: str = os.getenv(
+        'TEST_RESULTS_DB',
+        os.path.join(os.path.expanduser('~'), '.cache', 'telegram-claude-bot', 'test_results.db')
+    )
+
     # Git settings
     GIT_AUTO_COMMIT: bool = os.getenv('GIT_AUTO_COMMIT', 'false').lower() == 'true'
     GIT_AUTO_PUSH: bool = os.getenv('GIT_AUTO_PUSH', 'false').lower() == 'true'
 
+    # Request tracing: requests slower than this get their span tree written to SLOW_REQUEST_LOG
+    SLOW_REQUEST_THRESHOLD_MS: int = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '30000'))
+    SLOW_REQUEST_LOG: str = os.getenv(
+        'SLOW_REQUEST_LOG',
+        os.path.join(os.path.dirname(os.getenv('LOG_FILE', '/var/log/telegram-claude-bot/bot.log')), 'slow_requests.jsonl')
+    )
+
+    # Traffic recording for load replays (anonymized updates + backend timings, empty = off)
+    TRAFFIC_RECORD_PATH: str = os.getenv('TRAFFIC_RECORD_PATH', '')
+    TRAFFIC_RECORD_SALT: str = os.getenv('TRAFFIC_RECORD_SALT', '')
+
+    # Metrics endpoint (Prometheus text format, 0 = disabled)
+    METRICS_LISTEN: str = os.getenv('METRICS_LISTEN', '127.0.0.1')
+    METRICS_PORT: int = int(os.getenv('METRICS_PORT', '0'))
+
     # Logging
     LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')
-    LOG_FILE: str = os.getenv('LOG_FILE', '/var/log/telegram-claude-bot/bot.log')
+    LOG_FILE: str = os.getenv('LOG_FILE', '/var/log/telegram-claude-bot/bot.log')  # '' = console only
+    # Written by a background thread; rotated at LOG_MAX_BYTES into LOG_BACKUP_COUNT .gz files
+    LOG_MAX_BYTES: int = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT: int = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    LOG_MAX_CHARS: int = int(os.getenv('LOG_MAX_CHARS', '10000'))  # longer messages are cut (0 = no limit)
+    LOG_QUEUE_SIZE: int = int(os.getenv('LOG_QUEUE_SIZE', '10000'))  # records past this are dropped
 
     @classmethod
     def is_claude_cli_available(cls) -> bool:
-        """Check if Claude Code CLI is installed and authenticated"""
-        import subprocess
-        try:
-            # Check if claude-code command exists
-            result = subprocess.run(
-                ['which', 'claude-code'],
-                capture_output=True,
-                timeout=5
-            )
-            if result.returncode != 0:
-                return False
-
-            # Check if authenticated (try --version as a simple check)
-            result = subprocess.run(
-                ['claude-code', '--version'],
-                capture_output=True,
-                timeout=5
-            )
-            return result.returncode == 0
-        except Exception:
-            return False
+        """Check if Claude Code CLI is installed and authenticated (cached probe)"""
+        import capabilities
+        return capabilities.detect().has_command('claude-code')
 
     @classmethod
     def get_auth_method(cls) -> str:
@@ -127,6 +230,11 @@ class BotConfig:
             if not config.ANTHROPIC_API_KEY:
                 print("❌ AUTH_METHOD='api' but ANTHROPIC_API_KEY not set!")
                 return False
+            import capabilities
+            if not capabilities.detect().anthropic_sdk:
+                print("❌ AUTH_METHOD='api' but the anthropic package is not installed!")
+                print("   Install with: pip install anthropic")
+                return False
             print(f"✅ Using Anthropic API authentication")
         elif auth_method == 'cli':
             if not cls.is_claude_cli_available():
@@ -136,6 +244,9 @@ class BotConfig:
                 return False
             print(f"✅ Using Claude Code CLI authentication")
 
+        if config.WEBHOOK_URL and not config.WEBHOOK_SECRET:
+            print("⚠️  Warning: WEBHOOK_URL set without WEBHOOK_SECRET - webhook requests are not authenticated!")
+
         if not config.ALLOWED_USERS:
             print("⚠️  Warning: ALLOWED_USER_IDS not set - bot will accept requests from anyone!")
 
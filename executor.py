@@ -0,0 +1,333 @@
+"""
+Out-of-process executor for Claude runs
+With EXECUTOR_DB set, the bot queues runs in a SQLite database instead of running
+them itself; the executor daemon (python executor.py) claims and runs them,
+writing progress and results back. Runs survive bot restarts, and results that
+finished while the bot was down are delivered when it comes back.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+import logging
+from config import config
+from result_cache import ResultCache
+from log_pipeline import setup_logging, process_log_file
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    context TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    progress TEXT NOT NULL DEFAULT '',
+    result TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    waiter_seen REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+FINISHED = ('done', 'cancelled', 'failed')
+
+# Characters of live output kept in the progress column
+PROGRESS_CHARS = 2000
+
+
+class JobStore:
+    """Durable job queue shared by the bot (submits, waits) and the executor (claims, runs)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    # Bot side ---------------------------------------------------------
+
+    def submit(self, user_id: int, chat_id: int, context: str, prompt: str) -> int:
+        now = time.time()
+        cursor = self._connect().execute(
+            'INSERT INTO jobs (user_id, chat_id, context, prompt, created, waiter_seen) VALUES (?, ?, ?, ?, ?, ?)',
+            (user_id, chat_id, context, prompt, now, now)
+        )
+        return cursor.lastrowid
+
+    def poll(self, job_id: int) -> Optional[dict]:
+        """Current state of a job; also tells the bot's deliverer someone is still waiting on it"""
+        db = self._connect()
+        db.execute('UPDATE jobs SET waiter_seen = ? WHERE id = ?', (time.time(), job_id))
+        return self._row(db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    def request_cancel(self, user_id: int) -> List[int]:
+        """Cancel a user's unfinished jobs; queued ones end at once, running ones when the executor notices"""
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = db.execute(
+                "SELECT id, status FROM jobs WHERE user_id = ? AND status IN ('queued', 'running')", (user_id,)
+            ).fetchall()
+            result = json.dumps({'success': False, 'cancelled': True, 'error': 'Cancelled by user', 'output': ''})
+            for row in rows:
+                if row['status'] == 'queued':
+                    db.execute(
+                        "UPDATE jobs SET status = 'cancelled', result = ?, finished = ? WHERE id = ?",
+                        (result, time.time(), row['id'])
+                    )
+                else:
+                    db.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (row['id'],))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return [row['id'] for row in rows]
+
+    def claim_delivery(self, job_id: int) -> bool:
+        """True for exactly one caller - whoever sends the result to the chat"""
+        cursor = self._connect().execute(
+            'UPDATE jobs SET delivered = 1 WHERE id = ? AND delivered = 0', (job_id,)
+        )
+        return cursor.rowcount == 1
+
+    def undelivered(self, stale_after: float) -> List[dict]:
+        """Finished jobs nobody has polled for stale_after seconds (their bot handler is gone)"""
+        rows = self._connect().execute(
+            f"SELECT * FROM jobs WHERE status IN {FINISHED} AND delivered = 0 AND waiter_seen < ? ORDER BY id",
+            (time.time() - stale_after,)
+        ).fetchall()
+        return [self._row(row) for row in rows]
+
+    # Executor side ----------------------------------------------------
+
+    def claim(self) -> Optional[dict]:
+        """Take the oldest queued job and mark it running"""
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', started = ?, attempts = attempts + 1 WHERE id = ?",
+                    (time.time(), row['id'])
+                )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return self.get(row['id']) if row else None
+
+    def get(self, job_id: int) -> Optional[dict]:
+        return self._row(self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    def set_progress(self, job_id: int, progress: str):
+        self._connect().execute(
+            'UPDATE jobs SET progress = ? WHERE id = ?', (progress[-PROGRESS_CHARS:], job_id)
+        )
+
+    def cancel_requested(self, job_ids: List[int]) -> List[int]:
+        if not job_ids:
+            return []
+        marks = ','.join('?' * len(job_ids))
+        rows = self._connect().execute(
+            f'SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({marks})', job_ids
+        ).fetchall()
+        return [row['id'] for row in rows]
+
+    def finish(self, job_id: int, status: str, result: dict):
+        self._connect().execute(
+            'UPDATE jobs SET status = ?, result = ?, finished = ? WHERE id = ?',
+            (status, json.dumps(result, default=str), time.time(), job_id)
+        )
+
+    def recover(self, max_attempts: int) -> int:
+        """
+        Settle jobs left running by an executor that died: cancel the ones the user
+        cancelled, requeue read-only prompts (up to max_attempts) and fail the rest -
+        rerunning a prompt that edits, commits or deploys could apply it twice
+        """
+        cancelled = json.dumps({'success': False, 'cancelled': True, 'error': 'Cancelled by user', 'output': ''})
+        failed = json.dumps({
+            'success': False,
+            'error': 'Executor restarted while the run was in progress; re-send if still wanted',
+            'output': ''
+        })
+        requeued = 0
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = db.execute(
+                "SELECT id, prompt, attempts, cancel_requested FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            for row in rows:
+                if row['cancel_requested']:
+                    status, result = 'cancelled', cancelled
+                elif row['attempts'] < max_attempts and not ResultCache.SIDE_EFFECT_PATTERN.search(row['prompt']):
+                    db.execute("UPDATE jobs SET status = 'queued' WHERE id = ?", (row['id'],))
+                    requeued += 1
+                    continue
+                else:
+                    status, result = 'failed', failed
+                db.execute(
+                    'UPDATE jobs SET status = ?, result = ?, finished = ? WHERE id = ?',
+                    (status, result, time.time(), row['id'])
+                )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return requeued
+
+    def purge(self, older_than: float):
+        """Drop delivered jobs finished more than older_than seconds ago"""
+        self._connect().execute(
+            'DELETE FROM jobs WHERE delivered = 1 AND finished < ?', (time.time() - older_than,)
+        )
+
+
+class Executor:
+    """Claims queued jobs and runs them through the bridge, up to MAX_PARALLEL_SESSIONS at a time"""
+
+    POLL_INTERVAL = 0.5
+    RETENTION = 7 * 24 * 3600
+
+    def __init__(self, store: JobStore, parallel: int):
+        self.store = store
+        self.parallel = parallel
+        self.active = {}  # job id -> (RunningJob, asyncio.Task)
+        self.published = {}  # job id -> output chunks already written as progress
+        self.stopping = False
+
+    async def run(self):
+        from claude_code_bridge import bridge
+
+        requeued = self.store.recover(config.EXECUTOR_MAX_ATTEMPTS)
+        if requeued:
+            logger.info(f"Requeued {requeued} job(s) interrupted by the last shutdown")
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        last_purge = 0.0
+        while not self.stopping or self.active:
+            while not self.stopping and len(self.active) < self.parallel:
+                job = self.store.claim()
+                if not job:
+                    break
+                self._start(job)
+
+            await self._sync_active()
+
+            if time.monotonic() - last_purge > 3600:
+                self.store.purge(self.RETENTION)
+                await bridge.cleanup_old_sessions(config.SESSION_TIMEOUT)
+                last_purge = time.monotonic()
+
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+        logger.info("Executor stopped")
+
+    def stop(self):
+        """Stop claiming new jobs; running ones are allowed to finish"""
+        if not self.stopping:
+            logger.info(f"Stopping after {len(self.active)} running job(s) finish...")
+        self.stopping = True
+
+    def _start(self, job: dict):
+        from claude_code_bridge import RunningJob
+
+        logger.info(f"Running job {job['id']} for user {job['user_id']} in {job['context']} (attempt {job['attempts']})")
+        running = RunningJob(job['user_id'], job['context'], job['prompt'])
+        task = asyncio.create_task(self._run(job, running))
+        self.active[job['id']] = (running, task)
+
+    async def _run(self, job: dict, running):
+        from claude_code_bridge import bridge
+
+        session = bridge._get_or_create_session(f"{job['user_id']}_{job['context']}", job['context'], job['user_id'])
+        try:
+            result = await bridge._run_tracked(session, job['prompt'], running)
+            status = 'cancelled' if result.get('cancelled') else 'done'
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {e}", exc_info=True)
+            result = {'success': False, 'error': str(e), 'output': f"❌ Error: {str(e)}"}
+            status = 'failed'
+
+        self.store.finish(job['id'], status, result)
+        logger.info(f"Job {job['id']} {status} after {running.elapsed:.1f}s")
+        self.active.pop(job['id'], None)
+        self.published.pop(job['id'], None)
+
+    async def _sync_active(self):
+        """Publish live output and act on /cancel requests from the bot"""
+        from claude_code_bridge import bridge
+
+        for job_id, (running, _) in list(self.active.items()):
+            if running.output_chunks != self.published.get(job_id, 0):
+                self.published[job_id] = running.output_chunks
+                self.store.set_progress(job_id, running.partial_output)
+
+        for job_id in self.store.cancel_requested(list(self.active)):
+            running, _ = self.active[job_id]
+            if not running.cancelled:
+                logger.info(f"Cancelling job {job_id}")
+                await bridge.cancel_job(running)
+
+
+def main():
+    """Run the executor daemon"""
+    setup_logging(
+        level=config.LOG_LEVEL,
+        log_file=process_log_file(config.LOG_FILE, 'executor'),
+        max_bytes=config.LOG_MAX_BYTES,
+        backup_count=config.LOG_BACKUP_COUNT,
+        max_chars=config.LOG_MAX_CHARS,
+        queue_size=config.LOG_QUEUE_SIZE
+    )
+
+    if not config.EXECUTOR_DB:
+        logger.error("❌ EXECUTOR_DB is not set")
+        return 1
+
+    logger.info(f"⚙️  Claude executor on {config.EXECUTOR_DB} ({config.MAX_PARALLEL_SESSIONS} parallel runs)")
+    executor = Executor(JobStore(config.EXECUTOR_DB), config.MAX_PARALLEL_SESSIONS)
+    asyncio.run(executor.run())
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Test impact analysis for the Run Tests button
+Maps changed files to the test files that (transitively) import them, using
+an import graph of the working directory: Python imports, and relative
+imports/requires for JavaScript and TypeScript. Parsed imports are cached by
+file mtime, so only edited files are re-read on the next run.
+"""
+
+import ast
+import asyncio
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+from metrics import SUBPROCESS_SPAWNS
+
+logger = logging.getLogger(__name__)
+
+SKIP_DIRS = {
+    '.git', 'node_modules', '__pycache__', '.venv', 'venv', 'env', '.tox',
+    'build', 'dist', '.expo', '.next', 'coverage', 'staticfiles'
+}
+PY_EXTENSIONS = ('.py',)
+JS_EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx')
+
+# Changing one of these can affect any test - run everything
+GLOBAL_FILES = re.compile(
+    r'(^|/)(settings[^/]*\.py|conftest\.py|manage\.py|pytest\.ini|setup\.cfg|tox\.ini|pyproject\.toml|'
+    r'requirements[^/]*\.txt|package\.json|package-lock\.json|yarn\.lock|jest\.config\.[jt]s|'
+    r'babel\.config\.js|tsconfig\.json)$'
+)
+TEST_FILE = re.compile(
+    r'(^|/)(test_[^/]*\.py|[^/]*_tests?\.py|tests\.py|[^/]*\.(test|spec)\.[jt]sx?)$|(^|/)(tests|__tests__)/'
+)
+JS_IMPORT = re.compile(
+    r"""(?:\bfrom\s*|\brequire\(\s*|\bimport\(\s*|^\s*import\s*)['"](\.{1,2}/[^'"]*)['"]""",
+    re.MULTILINE
+)
+
+
+class Selection:
+    """Tests to run for a set of changed files"""
+
+    def __init__(self, changed: List[str], tests: List[str], full_reason: Optional[str] = None):
+        self.changed = changed
+        self.tests = tests
+        self.full_reason = full_reason  # set when only the full suite is safe
+
+    @property
+    def full(self) -> bool:
+        return self.full_reason is not None
+
+
+class ImportGraph:
+    """Reverse import graph of one working directory (file -> files importing it)"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._parsed: Dict[str, Tuple[float, Set[str]]] = {}  # path -> (mtime, imported paths)
+
+    def update(self) -> Dict[str, Set[str]]:
+        """Re-read files changed since the last call; returns the reverse graph"""
+        files = self._source_files()
+        modules = self._module_index(files)
+        for path in list(self._parsed):
+            if path not in files:
+                del self._parsed[path]
+        for path, mtime in files.items():
+            cached = self._parsed.get(path)
+            if not cached or cached[0] != mtime:
+                self._parsed[path] = (mtime, self._imports(path, modules, files))
+
+        importers: Dict[str, Set[str]] = {}
+        for path, (_, imported) in self._parsed.items():
+            for target in imported:
+                importers.setdefault(target, set()).add(path)
+        return importers
+
+    def _source_files(self) -> Dict[str, float]:
+        files = {}
+        for directory, dirs, names in os.walk(self.root):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith('.')]
+            for name in names:
+                if name.endswith(PY_EXTENSIONS + JS_EXTENSIONS):
+                    path = os.path.join(directory, name)
+                    try:
+                        files[os.path.relpath(path, self.root)] = os.path.getmtime(path)
+                    except OSError:
+                        continue
+        return files
+
+    @staticmethod
+    def _module_index(files: Iterable[str]) -> Dict[str, str]:
+        """Dotted Python module name -> path"""
+        modules = {}
+        for path in files:
+            if path.endswith('.py'):
+                name = path[:-3].replace(os.sep, '.')
+                if name.endswith('.__init__'):
+                    name = name[:-len('.__init__')]
+                modules[name] = path
+        return modules
+
+    def _imports(self, path: str, modules: Dict[str, str], files: Dict[str, float]) -> Set[str]:
+        try:
+            with open(os.path.join(self.root, path), encoding='utf-8', errors='replace') as f:
+                source = f.read()
+        except OSError:
+            return set()
+        if path.endswith('.py'):
+            return self._python_imports(path, source, modules)
+        return self._js_imports(path, source, files)
+
+    @staticmethod
+    def _python_imports(path: str, source: str, modules: Dict[str, str]) -> Set[str]:
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            return set()
+
+        # Package of the file (for __init__.py, the package it defines)
+        package = path[:-3].replace(os.sep, '.').split('.')[:-1]
+        names = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ''
+                if node.level:
+                    parent = package[:len(package) - node.level + 1] if node.level > 1 else package
+                    base = '.'.join(parent + ([base] if base else []))
+                names.append(base)
+                names.extend(f"{base}.{alias.name}" for alias in node.names)
+
+        imported = set()
+        for name in names:
+            # Longest known module prefix: a.b.c may be module a.b plus attribute c
+            parts = name.split('.')
+            while parts:
+                target = modules.get('.'.join(parts))
+                if target:
+                    imported.add(target)
+                    break
+                parts.pop()
+        imported.discard(path)
+        return imported
+
+    @staticmethod
+    def _js_imports(path: str, source: str, files: Dict[str, float]) -> Set[str]:
+        imported = set()
+        directory = os.path.dirname(path)
+        for spec in JS_IMPORT.findall(source):
+            base = os.path.normpath(os.path.join(directory, spec))
+            for candidate in [base] + [base + ext for ext in JS_EXTENSIONS] + \
+                    [os.path.join(base, 'index' + ext) for ext in JS_EXTENSIONS]:
+                if candidate in files:
+                    imported.add(candidate)
+                    break
+        return imported
+
+
+class TestImpact:
+    """Selects the tests affected by changed files, per working directory"""
+
+    def __init__(self, max_tests: int = 200):
+        self.max_tests = max_tests
+        self._graphs: Dict[str, ImportGraph] = {}
+
+    async def select(self, working_dir: str, extra_changed: Iterable[str] = ()) -> Selection:
+        """Tests affected by uncommitted git changes plus extra_changed (e.g. a run's files_changed)"""
+        changed = sorted(set(await self.changed_files(working_dir)) | {
+            self._relative(working_dir, path) for path in extra_changed
+        } - {None})
+        if not changed:
+            return Selection([], [], "no changed files found")
+
+        global_change = next((path for path in changed if GLOBAL_FILES.search(path)), None)
+        if global_change:
+            return Selection(changed, [], f"{global_change} affects every test")
+
+        graph = self._graphs.setdefault(working_dir, ImportGraph(working_dir))
+        importers = await asyncio.to_thread(graph.update)
+        tests = self._affected_tests(changed, importers)
+        if len(tests) > self.max_tests:
+            return Selection(changed, tests, f"{len(tests)} tests affected")
+        return Selection(changed, tests)
+
+    @staticmethod
+    def _affected_tests(changed: List[str], importers: Dict[str, Set[str]]) -> List[str]:
+        seen = set(changed)
+        queue = list(changed)
+        while queue:
+            for importer in importers.get(queue.pop(), ()):
+                if importer not in seen:
+                    seen.add(importer)
+                    queue.append(importer)
+        return sorted(
+            path for path in seen
+            if TEST_FILE.search(path) and path.endswith(PY_EXTENSIONS + JS_EXTENSIONS)
+        )
+
+    @staticmethod
+    def _relative(working_dir: str, path: str) -> Optional[str]:
+        """A files_changed entry as a path inside working_dir (None if it's elsewhere)"""
+        path = path.strip()
+        absolute = path if os.path.isabs(path) else os.path.join(working_dir, path)
+        relative = os.path.relpath(absolute, working_dir)
+        return None if relative.startswith('..') else relative
+
+    @staticmethod
+    async def changed_files(working_dir: str) -> List[str]:
+        """Modified, staged and untracked files, relative to working_dir"""
+        files = []
+        for args in (('diff', '--name-only', '--relative', 'HEAD'), ('ls-files', '--others', '--exclude-standard')):
+            SUBPROCESS_SPAWNS.inc('git')
+            process = await asyncio.create_subprocess_exec(
+                'git', *args,
+                cwd=working_dir,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            stdout, _ = await process.communicate()
+            if process.returncode == 0:
+                files.extend(line.strip() for line in stdout.decode().splitlines() if line.strip())
+        return files
+
+
+# Global selector
+impact = TestImpact()
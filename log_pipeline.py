@@ -0,0 +1,147 @@
+"""
+Non-blocking logging
+Log calls only put the record on a queue; a background thread formats it and
+writes it to the console and a size-rotated, gzip-compressed LOG_FILE. Long
+messages (full Claude outputs, huge tracebacks) are cut to max_chars, and when
+the queue is full records are dropped and counted instead of stalling the
+event loop.
+"""
+
+import atexit
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+from typing import Optional
+
+from metrics import metrics
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Logger for conversation transcripts (prompts and full outputs); ECHO_OUTPUT
+# decides whether it also reaches the console
+TRANSCRIPT_LOGGER = 'transcript'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+LOG_RECORDS_DROPPED = metrics.counter(
+    'telegram_claude_log_records_dropped_total',
+    'Log records dropped because the log queue was full'
+)
+
+
+def process_log_file(path: str, name: Optional[str]) -> str:
+    """LOG_FILE for one process (bot.log -> bot.executor.log): rotation isn't safe across processes"""
+    if not path or not name:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{name}{ext}"
+
+
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """Formats the message on the caller's thread (cut to max_chars) and never blocks on a full queue"""
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int = 0):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        if self.max_chars and len(record.msg) > self.max_chars:
+            cut = len(record.msg) - self.max_chars
+            record.msg = record.message = f"{record.msg[:self.max_chars]}… [{cut} chars truncated]"
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler whose rotated files are gzipped (bot.log.1.gz, bot.log.2.gz, ...)"""
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source: str, dest: str):
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+
+def _stop_listener():
+    """Stop the current listener, writing out the records still queued"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+class _NotTranscript(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.name != TRANSCRIPT_LOGGER
+
+
+def setup_logging(
+    level: str = 'INFO',
+    log_file: str = '',
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    max_chars: int = 10000,
+    queue_size: int = 10000,
+    echo_transcripts: bool = True
+) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a queue to a writer thread
+
+    log_file: rotated at max_bytes, keeping backup_count gzipped files ('' = console only)
+    max_chars: longest message kept, tracebacks included (0 = no limit)
+    echo_transcripts: also print TRANSCRIPT_LOGGER records on the console
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(formatter)
+    if not echo_transcripts:
+        console.addFilter(_NotTranscript())
+    handlers.append(console)
+
+    file_error = None
+    if log_file:
+        try:
+            os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+            file_handler = CompressingRotatingFileHandler(log_file, max_bytes, backup_count)
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        except OSError as e:
+            file_error = e
+
+    global _listener
+    if _listener:
+        _listener.stop()
+    else:
+        # Once per process: flush what's queued on exit
+        atexit.register(_stop_listener)
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    listener = _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(TruncatingQueueHandler(log_queue, max_chars))
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    listener.start()
+
+    if file_error:
+        logging.getLogger(__name__).warning(f"Logging to console only, cannot write {log_file}: {file_error}")
+    return listener
@@ -0,0 +1,237 @@
+"""
+In-process metrics (histograms, counters, gauges)
+Exposed in Prometheus text format over a local HTTP endpoint
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds - covers fast local steps through multi-minute Claude runs
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0
+)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one label dimension"""
+
+    def __init__(self, name: str, help_text: str, label: str = 'stage', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._series[label_value] = series
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += seconds
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, label_value: str):
+        """Observe the duration of a with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_value, time.perf_counter() - started)
+
+    def quantile(self, label_value: str, q: float) -> Optional[float]:
+        """Bucket upper bound containing the q-quantile (an estimate)"""
+        with self._lock:
+            series = self._series.get(label_value)
+            if not series or not series['count']:
+                return None
+            target = q * series['count']
+            running = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                running += count
+                if running >= target:
+                    return bound
+            return float('inf')
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {k: {**v, 'counts': list(v['counts'])} for k, v in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, series in sorted(self.snapshot().items()):
+            running = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                running += count
+                lines.append(
+                    f'{self.name}_bucket{{{self.label}="{label_value}",le="{_format_value(bound)}"}} {running}'
+                )
+            lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="+Inf"}} {series["count"]}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {series["sum"]}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {series["count"]}')
+        return lines
+
+
+class Counter:
+    """Monotonic counter with an optional label dimension"""
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str = '', amount: float = 1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_value, value in sorted(self.snapshot().items()):
+            labels = f'{{{self.label}="{label_value}"}}' if self.label else ''
+            lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def value(self) -> float:
+        try:
+            return float(self.read())
+        except Exception:
+            return float('nan')
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {self.value()}",
+        ]
+
+
+class MetricsRegistry:
+    """Holds all metrics and serves them"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._server = None
+
+    def histogram(self, name: str, help_text: str, **kwargs) -> Histogram:
+        return self._register(name, lambda: Histogram(name, help_text, **kwargs))
+
+    def counter(self, name: str, help_text: str, **kwargs) -> Counter:
+        return self._register(name, lambda: Counter(name, help_text, **kwargs))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> Gauge:
+        # Re-registering replaces the callback (e.g. a new bot instance)
+        self._metrics[name] = Gauge(name, help_text, read)
+        return self._metrics[name]
+
+    def _register(self, name: str, factory):
+        if name not in self._metrics:
+            self._metrics[name] = factory()
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Compact human-readable summary (for the /metrics command)"""
+        lines = []
+        for metric in self._metrics.values():
+            if isinstance(metric, Histogram):
+                for label_value, series in sorted(metric.snapshot().items()):
+                    avg_ms = series['sum'] / series['count'] * 1000 if series['count'] else 0
+                    p95 = metric.quantile(label_value, 0.95)
+                    p95_text = f"≤{p95 * 1000:.0f}ms" if p95 not in (None, float('inf')) else ">max"
+                    lines.append(
+                        f"{label_value:<18} n={series['count']:<5} avg={avg_ms:.0f}ms p95{p95_text}"
+                    )
+            elif isinstance(metric, Counter):
+                for label_value, value in sorted(metric.snapshot().items()):
+                    name = f"{metric.name}[{label_value}]" if label_value else metric.name
+                    lines.append(f"{name} = {value:g}")
+            elif isinstance(metric, Gauge):
+                lines.append(f"{metric.name} = {metric.value():g}")
+        return "\n".join(lines) if lines else "No metrics recorded yet."
+
+    def start_http_server(self, listen: str, port: int):
+        """Serve /metrics from a daemon thread"""
+        # Only deployments with METRICS_PORT set pay for http.server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((listen, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info(f"📈 Metrics endpoint on http://{listen}:{port}/metrics")
+
+    def stop_http_server(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Global registry and the metrics shared across modules
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    'telegram_claude_stage_seconds',
+    'Time spent in each stage of request handling'
+)
+SUBPROCESS_SPAWNS = metrics.counter(
+    'telegram_claude_subprocess_spawns_total',
+    'Subprocesses spawned, by command',
+    label='command'
+)
@@ -0,0 +1,142 @@
+"""
+Model routing for the API backend
+Picks a faster or stronger model, with a matching max_tokens, from cheap local
+heuristics (prompt length, keywords, context). Users can pin a tier with /model;
+decisions and latencies are exported per tier so the rules can be tuned.
+"""
+
+import re
+from typing import Dict, Optional, Tuple
+import logging
+
+from config import config
+from metrics import metrics
+import shared_state
+
+logger = logging.getLogger(__name__)
+
+TIERS = ('fast', 'standard', 'strong')
+
+ROUTE_SECONDS = metrics.histogram(
+    'telegram_claude_model_route_seconds',
+    'Claude API latency by routing tier',
+    label='tier'
+)
+ROUTE_DECISIONS = metrics.counter(
+    'telegram_claude_model_routes_total',
+    'Routing decisions, by tier and reason',
+    label='route'
+)
+
+
+class Route:
+    """Model choice for one request"""
+
+    def __init__(self, tier: str, model: str, max_tokens: int, reason: str, detail: str = ''):
+        self.tier = tier
+        self.model = model
+        self.max_tokens = max_tokens
+        self.reason = reason  # low-cardinality category (metrics label)
+        self.detail = detail  # e.g. the keyword that matched (logs/traces only)
+
+    def __repr__(self):
+        return f"Route({self.tier}, {self.model}, max_tokens={self.max_tokens}, {self.reason}: {self.detail})"
+
+
+class ModelRouter:
+    """Classifies prompts into fast / standard / strong tiers"""
+
+    # Heavy work: needs the strongest model and room for long answers
+    STRONG_PATTERN = re.compile(
+        r"\b(refactor\w*|redesign\w*|architect\w*|implement\w*|migrat\w*|rewrite|"
+        r"race condition|deadlock|memory leak|security|vulnerab\w*|optimi[sz]\w*|performance)\b",
+        re.IGNORECASE
+    )
+    # Lookups and summaries: a fast model answers these well
+    FAST_PATTERN = re.compile(
+        r"\b(status|git (?:log|status|diff|branch)|show|list|which|where is|what is|what's|"
+        r"how many|version|summari[sz]e|summary)\b",
+        re.IGNORECASE
+    )
+    FAST_MAX_CHARS = 200
+    STRONG_MIN_CHARS = 1500
+
+    def __init__(self, models: Dict[str, Tuple[str, int]], enabled: bool = True,
+                 overrides: Optional[Dict[int, str]] = None):
+        self.models = models  # tier -> (model, max_tokens)
+        self.enabled = enabled
+        self._overrides: Dict[int, str] = dict(overrides or {})
+
+    def classify(self, prompt: str, context: str) -> Tuple[str, str, str]:
+        """(tier, reason, detail) from the prompt alone"""
+        strong = self.STRONG_PATTERN.search(prompt)
+        if strong:
+            return 'strong', 'keyword', strong.group(0).lower()
+        if len(prompt) >= self.STRONG_MIN_CHARS:
+            return 'strong', 'length', f"{len(prompt)} chars"
+        fast = self.FAST_PATTERN.search(prompt)
+        if fast and len(prompt) <= self.FAST_MAX_CHARS:
+            # The root context spans every project - don't skimp there
+            if context == 'root':
+                return 'standard', 'context', 'root'
+            return 'fast', 'keyword', fast.group(0).lower()
+        return 'standard', 'default', ''
+
+    def route(self, user_id: int, prompt: str, context: str) -> Route:
+        override = self.get_override(user_id)
+        if override:
+            tier, reason, detail = override, 'override', f"user {user_id}"
+        elif not self.enabled:
+            tier, reason, detail = 'standard', 'disabled', ''
+        else:
+            tier, reason, detail = self.classify(prompt, context)
+
+        model, max_tokens = self.models[tier]
+        route = Route(tier, model, max_tokens, reason, detail)
+        ROUTE_DECISIONS.inc(f"{tier}/{reason}")
+        logger.info(f"Routing to {route}")
+        return route
+
+    def record(self, route: Route, latency: float):
+        ROUTE_SECONDS.observe(route.tier, latency)
+
+    # Per-user overrides (/model) ----------------------------------------
+
+    def get_override(self, user_id: int) -> Optional[str]:
+        if shared_state.store:
+            stored = shared_state.store.get('model_override', user_id)
+            if stored:
+                return None if stored == 'auto' else stored
+        return self._overrides.get(user_id)
+
+    def set_override(self, user_id: int, tier: Optional[str]):
+        """Pin a user to a tier (None = automatic routing)"""
+        if tier:
+            self._overrides[user_id] = tier
+        else:
+            self._overrides.pop(user_id, None)
+        if shared_state.store:
+            # 'auto' rather than a delete, so it also masks a MODEL_OVERRIDES entry in other workers
+            shared_state.store.set('model_override', user_id, tier or 'auto')
+
+
+def _parse_overrides(value: str) -> Dict[int, str]:
+    """MODEL_OVERRIDES=123456:strong,789:fast"""
+    overrides = {}
+    for item in value.split(','):
+        user_id, _, tier = item.partition(':')
+        if user_id.strip() and tier.strip() in TIERS:
+            overrides[int(user_id)] = tier.strip()
+    return overrides
+
+
+# Global router
+router = ModelRouter(
+    {
+        'fast': (config.CLAUDE_FAST_MODEL, config.CLAUDE_FAST_MAX_TOKENS),
+        'standard': (config.CLAUDE_MODEL, config.CLAUDE_MAX_TOKENS),
+        'strong': (config.CLAUDE_STRONG_MODEL, config.CLAUDE_STRONG_MAX_TOKENS),
+    },
+    enabled=config.MODEL_ROUTING,
+    overrides=_parse_overrides(config.MODEL_OVERRIDES)
+)
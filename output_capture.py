@@ -0,0 +1,160 @@
+"""
+Bounded capture of subprocess output
+Output is kept in memory up to a threshold and spooled to a temporary file
+beyond it, so verbose runs don't hold several copies of megabytes of text.
+The first and last few KB are kept in memory for the Telegram reply, and
+parsers read the spool back in blocks.
+"""
+
+import asyncio
+import codecs
+import tempfile
+from typing import Iterator, Optional
+
+
+class TailBuffer:
+    """Fixed-size ring buffer keeping the last `limit` bytes written"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._buf = bytearray()
+
+    def write(self, data: bytes):
+        if len(data) >= self.limit:
+            self._buf = bytearray(data[-self.limit:])
+            return
+        self._buf += data
+        overflow = len(self._buf) - self.limit
+        if overflow > 0:
+            del self._buf[:overflow]
+
+    def getvalue(self) -> bytes:
+        return bytes(self._buf)
+
+
+class OutputCapture:
+    """
+    Captures one output stream
+
+    spool_threshold: bytes held in memory before spilling to a temp file
+    max_bytes: bytes kept in total; later output only reaches the tail buffer
+    head_bytes / tail_bytes: kept in memory for summary()
+    """
+
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(
+        self,
+        spool_threshold: int = 1024 * 1024,
+        max_bytes: int = 100 * 1024 * 1024,
+        head_bytes: int = 16 * 1024,
+        tail_bytes: int = 64 * 1024
+    ):
+        self.max_bytes = max_bytes
+        self.head_bytes = head_bytes
+        self.size = 0  # bytes written, including any dropped past max_bytes
+        self._spool = tempfile.SpooledTemporaryFile(max_size=spool_threshold, prefix='claude-output-')
+        self._head = bytearray()
+        self._tail = TailBuffer(tail_bytes)
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > self.max_bytes
+
+    def write(self, data: bytes):
+        kept = self.max_bytes - self.size
+        if kept > 0:
+            self._spool.write(data[:kept])
+        if len(self._head) < self.head_bytes:
+            self._head += data[:self.head_bytes - len(self._head)]
+        self._tail.write(data)
+        self.size += len(data)
+
+    async def read_from(self, stream: asyncio.StreamReader, on_chunk=None):
+        """Drain an asyncio stream into the capture"""
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            self.write(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+
+    def tail(self) -> str:
+        """Last tail_bytes of output, starting at a line boundary when possible"""
+        data = self._tail.getvalue()
+        text = data.decode('utf-8', errors='replace')
+        if self.size > len(data) and '\n' in text:
+            text = text[text.index('\n') + 1:]
+        return text
+
+    def summary(self) -> str:
+        """Whole output if it's small, otherwise the head and tail around an omission marker"""
+        if self.size <= self.head_bytes + self._tail.limit:
+            return self.text()
+        head = bytes(self._head).decode('utf-8', errors='replace')
+        head = head[:head.rfind('\n') + 1] or head
+        tail = self.tail()
+        omitted = self.size - len(head.encode()) - len(tail.encode())
+        return f"{head}\n… [{omitted:,} bytes omitted] …\n\n{tail}"
+
+    def text(self) -> str:
+        """Everything captured (only for output known to be small)"""
+        return ''.join(self.blocks())
+
+    def blocks(self, block_size: Optional[int] = None) -> Iterator[str]:
+        """
+        Decoded output in blocks of about block_size that end on line
+        boundaries, so line-oriented regexes never see a split line. When
+        output was cut at max_bytes, the tail buffer follows the kept part.
+        """
+        block_size = block_size or self.BLOCK_SIZE
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        pending = ''
+        self._spool.seek(0)
+        while True:
+            data = self._spool.read(block_size)
+            if not data:
+                break
+            text = pending + decoder.decode(data)
+            cut = text.rfind('\n') + 1
+            if cut:
+                yield text[:cut]
+                pending = text[cut:]
+            else:
+                pending = text
+        pending += decoder.decode(b'', final=True)
+        if pending:
+            yield pending
+        self._spool.seek(0, 2)
+
+        if self.truncated:
+            yield f"\n… [output truncated at {self.max_bytes:,} bytes] …\n"
+            yield self.tail()
+
+    def close(self):
+        self._spool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CombinedOutput:
+    """Several captures read back one after another (e.g. stdout then stderr)"""
+
+    def __init__(self, *captures: OutputCapture):
+        self.captures = captures
+
+    @property
+    def size(self) -> int:
+        return sum(capture.size for capture in self.captures)
+
+    def blocks(self) -> Iterator[str]:
+        for capture in self.captures:
+            yield from capture.blocks()
+
+    def summary(self) -> str:
+        return ''.join(capture.summary() for capture in self.captures)
@@ -0,0 +1,151 @@
+"""
+Compressed store of full Claude outputs for paging in Telegram
+Replies show the first page; later pages and the whole output are fetched
+on demand from the inline buttons. Pages are zlib-compressed rows in SQLite,
+so the executor daemon and the bot read the same store, and the oldest
+outputs are dropped once the store passes its size limit.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from typing import Iterable, Iterator, Optional
+import logging
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    id TEXT PRIMARY KEY,
+    pages INTEGER NOT NULL,
+    chars INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS output_pages (
+    output_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (output_id, page)
+);
+CREATE INDEX IF NOT EXISTS outputs_created ON outputs (created);
+"""
+
+
+def paginate(blocks: Iterable[str], page_chars: int) -> Iterator[str]:
+    """Split streamed text into pages of at most page_chars, ending on line boundaries when possible"""
+    pending = ''
+    for block in blocks:
+        text = pending + block
+        start = 0
+        while len(text) - start >= page_chars:
+            end = start + page_chars
+            cut = text.rfind('\n', start, end) + 1
+            if cut <= start:
+                cut = end  # A single line longer than a page
+            yield text[start:cut]
+            start = cut
+        pending = text[start:]
+    if pending:
+        yield pending
+
+
+class OutputStore:
+    """Paged, compressed outputs bounded by max_bytes (compressed) and ttl seconds"""
+
+    def __init__(self, path: str, max_bytes: int, ttl: float, page_chars: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.page_chars = page_chars
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def put(self, blocks: Iterable[str]) -> tuple:
+        """Store an output read block by block; returns (output id, page count)"""
+        output_id = uuid.uuid4().hex[:16]
+        pages = chars = size = 0
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            for pages, page in enumerate(paginate(blocks, self.page_chars), 1):
+                data = zlib.compress(page.encode('utf-8'), 6)
+                db.execute(
+                    'INSERT INTO output_pages (output_id, page, data) VALUES (?, ?, ?)',
+                    (output_id, pages - 1, data)
+                )
+                chars += len(page)
+                size += len(data)
+            db.execute(
+                'INSERT INTO outputs (id, pages, chars, bytes, created) VALUES (?, ?, ?, ?, ?)',
+                (output_id, pages, chars, size, time.time())
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._trim()
+        return output_id, pages
+
+    def pages(self, output_id: str) -> int:
+        """Page count, or 0 if the output has expired"""
+        row = self._connect().execute('SELECT pages FROM outputs WHERE id = ?', (output_id,)).fetchone()
+        return row[0] if row else 0
+
+    def page(self, output_id: str, number: int) -> Optional[str]:
+        row = self._connect().execute(
+            'SELECT data FROM output_pages WHERE output_id = ? AND page = ?', (output_id, number)
+        ).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    def read(self, output_id: str) -> Iterator[str]:
+        """Every page in order"""
+        rows = self._connect().execute(
+            'SELECT data FROM output_pages WHERE output_id = ? ORDER BY page', (output_id,)
+        )
+        for (data,) in rows:
+            yield zlib.decompress(data).decode('utf-8')
+
+    def _trim(self):
+        """Drop expired outputs, then the oldest ones until the store fits in max_bytes"""
+        db = self._connect()
+        cutoff = time.time() - self.ttl
+        expired = [row[0] for row in db.execute('SELECT id FROM outputs WHERE created < ?', (cutoff,))]
+        total = db.execute('SELECT COALESCE(SUM(bytes), 0) FROM outputs WHERE created >= ?', (cutoff,)).fetchone()[0]
+        if total > self.max_bytes:
+            rows = db.execute('SELECT id, bytes FROM outputs WHERE created >= ? ORDER BY created', (cutoff,))
+            for output_id, size in rows.fetchall():
+                if total <= self.max_bytes:
+                    break
+                expired.append(output_id)
+                total -= size
+        for output_id in expired:
+            db.execute('DELETE FROM output_pages WHERE output_id = ?', (output_id,))
+            db.execute('DELETE FROM outputs WHERE id = ?', (output_id,))
+        if expired:
+            logger.info(f"Dropped {len(expired)} stored output(s)")
+
+
+# Global store (None when OUTPUT_STORE_PATH is empty)
+outputs: Optional[OutputStore] = OutputStore(
+    config.OUTPUT_STORE_PATH,
+    config.OUTPUT_STORE_MAX_BYTES,
+    config.OUTPUT_STORE_TTL,
+    config.OUTPUT_PAGE_CHARS
+) if config.OUTPUT_STORE_PATH else None
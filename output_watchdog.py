@@ -0,0 +1,98 @@
+"""
+Output-idle watchdog for Claude subprocesses
+A run is ended when it prints nothing for idle_timeout seconds, or when it
+passes hard_timeout no matter what, instead of at a fixed wall-clock limit:
+productive long runs keep going and hung ones are stopped early. While the
+run is active a heartbeat callback reports the elapsed time.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+WATCHDOG_KILLS = metrics.counter(
+    'telegram_claude_watchdog_kills_total',
+    'Claude runs ended by the output watchdog',
+    label='reason'
+)
+
+
+async def _kill(process: asyncio.subprocess.Process):
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+    await process.wait()
+
+
+class OutputWatchdog:
+    """
+    Watches one subprocess; call touch() whenever it produces output
+
+    idle_timeout: seconds without output before the run is ended (0 = no idle limit,
+        for commands that print nothing until they finish)
+    hard_timeout: seconds the run may take in total (0 = no cap)
+    heartbeat_interval / on_heartbeat: called with (elapsed, idle) seconds while running
+    """
+
+    CHECK_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        idle_timeout: float,
+        hard_timeout: float = 0,
+        heartbeat_interval: float = 0,
+        on_heartbeat: Optional[Callable[[float, float], None]] = None
+    ):
+        self.idle_timeout = idle_timeout
+        self.hard_timeout = hard_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.on_heartbeat = on_heartbeat
+        self.started_at = time.monotonic()
+        self.last_output = self.started_at
+        self.reason: Optional[str] = None  # set when the watchdog ended the run
+
+    def touch(self, *_):
+        """Record output activity (usable directly as an OutputCapture on_chunk callback)"""
+        self.last_output = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def idle(self) -> float:
+        return time.monotonic() - self.last_output
+
+    async def watch(
+        self,
+        process: asyncio.subprocess.Process,
+        terminate: Callable[[asyncio.subprocess.Process], Awaitable] = _kill
+    ):
+        """Run alongside the process until it exits; terminate it on idle or hard timeout"""
+        last_heartbeat = self.started_at
+        while process.returncode is None:
+            await asyncio.sleep(self.CHECK_INTERVAL)
+            if process.returncode is not None:
+                return
+
+            if self.idle_timeout and self.idle >= self.idle_timeout:
+                self.reason = f"no output for {self.idle_timeout:.0f}s"
+                WATCHDOG_KILLS.inc('idle')
+            elif self.hard_timeout and self.elapsed >= self.hard_timeout:
+                self.reason = f"still running after {self.hard_timeout:.0f}s"
+                WATCHDOG_KILLS.inc('hard_timeout')
+            if self.reason:
+                logger.warning(f"Stopping process {process.pid}: {self.reason}")
+                await terminate(process)
+                return
+
+            now = time.monotonic()
+            if self.on_heartbeat and self.heartbeat_interval and now - last_heartbeat >= self.heartbeat_interval:
+                last_heartbeat = now
+                self.on_heartbeat(self.elapsed, self.idle)
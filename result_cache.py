@@ -0,0 +1,165 @@
+"""
+Result cache for repeatable read-only Claude requests
+Entries are keyed on context + normalized prompt + repository fingerprint
+"""
+
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """LRU + TTL cache bounded by entry count and total output size"""
+
+    # Prompts that imply side effects are never served from cache
+    SIDE_EFFECT_PATTERN = re.compile(
+        r'\b(fix|add|create|write|edit|change|update|delete|remove|rename|refactor|'
+        r'implement|install|commit|push|pull|merge|rebase|deploy|migrate|restart|'
+        r'revert|apply|generate)\b',
+        re.IGNORECASE
+    )
+
+    def __init__(self, ttl: int = 600, max_entries: int = 128, max_bytes: int = 16 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Case/whitespace/trailing-punctuation insensitive form of a prompt"""
+        return re.sub(r'\s+', ' ', prompt).strip().rstrip('?.!').lower()
+
+    def is_cacheable(self, prompt: str) -> bool:
+        """Only read-only looking requests are cached"""
+        return not self.SIDE_EFFECT_PATTERN.search(prompt)
+
+    @classmethod
+    def make_key(cls, context: str, prompt: str, fingerprint: str) -> str:
+        raw = f"{context}\0{cls.normalize_prompt(prompt)}\0{fingerprint}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return a copy of the cached result marked as a hit, or None"""
+        entry = self._entries.get(key)
+        if entry is None or self._expired(entry):
+            if entry is not None:
+                self._evict(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return {
+            **entry['result'],
+            'cached': True,
+            'cached_at': entry['stored_at'],
+            'cache_key': key,
+        }
+
+    def put(self, key: str, prompt: str, context: str, result: dict):
+        size = len(result.get('output', '') or '')
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._evict(key)
+
+        self._entries[key] = {
+            'prompt': prompt,
+            'context': context,
+            'result': result,
+            'size': size,
+            'stored_at': datetime.now().isoformat(),
+            'created': time.monotonic(),
+        }
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._evict(oldest)
+
+    def lookup_request(self, key: str) -> Optional[Tuple[str, str]]:
+        """(prompt, context) behind a cache key, for the re-run button"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry['prompt'], entry['context']
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def _expired(self, entry: dict) -> bool:
+        return time.monotonic() - entry['created'] > self.ttl
+
+    def _evict(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+
+
+class SharedResultCache(ResultCache):
+    """ResultCache backed by the shared store, so every worker process sees each entry"""
+
+    NAMESPACE = 'result_cache'
+
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.store.get(self.NAMESPACE, key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return {
+            **entry['result'],
+            'cached': True,
+            'cached_at': entry['stored_at'],
+            'cache_key': key,
+        }
+
+    def put(self, key: str, prompt: str, context: str, result: dict):
+        size = len(result.get('output', '') or '')
+        if size > self.max_bytes:
+            return
+
+        entry = {
+            'prompt': prompt,
+            'context': context,
+            'result': result,
+            'stored_at': datetime.now().isoformat(),
+        }
+        self.store.set(self.NAMESPACE, key, entry, ttl=self.ttl, size=size)
+        # Evicts the oldest writes (not least recently read) once over budget
+        self.store.trim(self.NAMESPACE, self.max_entries, self.max_bytes)
+
+    def lookup_request(self, key: str) -> Optional[Tuple[str, str]]:
+        entry = self.store.get(self.NAMESPACE, key)
+        if entry is None:
+            return None
+        return entry['prompt'], entry['context']
+
+    def stats(self) -> dict:
+        entries, size = self.store.totals(self.NAMESPACE)
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
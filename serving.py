@@ -0,0 +1,78 @@
+"""
+Application construction and serving (long polling or webhook)
+Shared by bot.py and telegram_proxy.py
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+
+def build_application(
+    token: str,
+    workers: int = 1,
+    update_queue_size: int = 0,
+    base_url: str = ''
+) -> Application:
+    """
+    Build the PTB Application
+
+    workers: number of updates processed concurrently (1 = sequential)
+    update_queue_size: bound on queued, not-yet-processed updates (0 = unbounded)
+    base_url: alternate Bot API endpoint (e.g. a local stub for load tests)
+    """
+    builder = Application.builder().token(token)
+
+    if workers > 1:
+        builder = builder.concurrent_updates(workers)
+
+    if update_queue_size > 0:
+        builder = builder.update_queue(asyncio.Queue(maxsize=update_queue_size))
+
+    if base_url:
+        base_url = base_url.rstrip('/')
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+
+    return builder.build()
+
+
+def run_application(
+    app: Application,
+    webhook_url: str = '',
+    listen: str = '127.0.0.1',
+    port: int = 8443,
+    url_path: str = 'telegram',
+    secret_token: Optional[str] = None,
+    max_connections: int = 40
+):
+    """Serve updates via webhook if webhook_url is set, otherwise long polling"""
+
+    if not webhook_url:
+        logger.info("Receiving updates via long polling")
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
+        return
+
+    url_path = url_path.strip('/')
+    full_url = f"{webhook_url.rstrip('/')}/{url_path}"
+
+    if not secret_token:
+        logger.warning("⚠️  Webhook running without WEBHOOK_SECRET - requests are not authenticated!")
+
+    logger.info(f"Receiving updates via webhook on {listen}:{port}/{url_path} ({full_url})")
+
+    # PTB rejects requests whose X-Telegram-Bot-Api-Secret-Token header
+    # does not match secret_token with 403
+    app.run_webhook(
+        listen=listen,
+        port=port,
+        url_path=url_path,
+        webhook_url=full_url,
+        secret_token=secret_token or None,
+        max_connections=max_connections,
+        allowed_updates=Update.ALL_TYPES
+    )
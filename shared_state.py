@@ -0,0 +1,141 @@
+"""
+Local state shared by the sharded worker processes
+A SQLite database (WAL mode) holding rate-limit events, the result cache,
+session summaries and per-user settings, so every worker sees the same state
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional
+import logging
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_events (
+    user_id INTEGER NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rate_events_user ON rate_events (user_id, ts);
+
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL,
+    expires REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS kv_updated ON kv (namespace, updated);
+"""
+
+
+class SharedStore:
+    """Thread- and process-safe key/value store with a sliding-window rate limiter"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections can't be shared)"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    # Rate limiting ----------------------------------------------------
+
+    def rate_limit_allow(self, user_id: int, max_per_window: int, window: float = 60.0) -> bool:
+        """Record a request if the user is under the limit (atomic across processes)"""
+        now = time.time()
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('DELETE FROM rate_events WHERE user_id = ? AND ts < ?', (user_id, now - window))
+            (count,) = db.execute('SELECT COUNT(*) FROM rate_events WHERE user_id = ?', (user_id,)).fetchone()
+            allowed = count < max_per_window
+            if allowed:
+                db.execute('INSERT INTO rate_events (user_id, ts) VALUES (?, ?)', (user_id, now))
+            db.execute('COMMIT')
+            return allowed
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def rate_limit_reset(self, user_id: int):
+        self._connect().execute('DELETE FROM rate_events WHERE user_id = ?', (user_id,))
+
+    # Key/value --------------------------------------------------------
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._connect().execute(
+            'SELECT value, expires FROM kv WHERE namespace = ? AND key = ?', (namespace, str(key))
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires is not None and expires < time.time():
+            self.delete(namespace, key)
+            return None
+        return json.loads(value)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None, size: int = 0):
+        now = time.time()
+        self._connect().execute(
+            'INSERT OR REPLACE INTO kv (namespace, key, value, size, updated, expires) VALUES (?, ?, ?, ?, ?, ?)',
+            (namespace, str(key), json.dumps(value, default=str), size, now, now + ttl if ttl else None)
+        )
+
+    def delete(self, namespace: str, key: str):
+        self._connect().execute('DELETE FROM kv WHERE namespace = ? AND key = ?', (namespace, str(key)))
+
+    def items(self, namespace: str) -> List[tuple]:
+        """(key, value) pairs that haven't expired"""
+        rows = self._connect().execute(
+            'SELECT key, value FROM kv WHERE namespace = ? AND (expires IS NULL OR expires >= ?)',
+            (namespace, time.time())
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def totals(self, namespace: str) -> tuple:
+        """(entry count, summed size) of a namespace"""
+        return self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM kv WHERE namespace = ?', (namespace,)
+        ).fetchone()
+
+    def trim(self, namespace: str, max_entries: int, max_bytes: int):
+        """Evict least recently written entries until within both bounds"""
+        db = self._connect()
+        db.execute('DELETE FROM kv WHERE namespace = ? AND expires < ?', (namespace, time.time()))
+        while True:
+            count, size = self.totals(namespace)
+            if count <= max_entries and size <= max_bytes:
+                return
+            db.execute(
+                'DELETE FROM kv WHERE rowid = (SELECT rowid FROM kv WHERE namespace = ? ORDER BY updated LIMIT 1)',
+                (namespace,)
+            )
+
+    def purge(self, namespace: str, older_than: float):
+        """Drop entries not written for older_than seconds"""
+        self._connect().execute(
+            'DELETE FROM kv WHERE namespace = ? AND updated < ?', (namespace, time.time() - older_than)
+        )
+
+
+# Global store - set when SHARED_STATE_PATH is configured (the supervisor sets it for its workers)
+store: Optional[SharedStore] = SharedStore(config.SHARED_STATE_PATH) if config.SHARED_STATE_PATH else None
@@ -0,0 +1,128 @@
+"""
+Claude CLI stream-json output as text
+With `--output-format stream-json --verbose` the CLI prints one JSON event per
+line as it works (messages, tool calls, tool results), so the output watchdog
+sees a working run instead of silence until the end. The decoder turns those
+events back into the plain text the parsers and replies expect: what Claude
+said, the tools it ran and what they printed.
+"""
+
+import asyncio
+import json
+from typing import Callable, List, Optional
+
+from output_capture import OutputCapture
+
+# Tools that change a file: shown as "Edited: path" / "Wrote: path", which the file parser picks up
+FILE_TOOLS = {'Edit': 'Edited', 'MultiEdit': 'Edited', 'NotebookEdit': 'Edited', 'Write': 'Wrote'}
+
+# Longest tool argument shown in a tool call line
+TOOL_DETAIL_CHARS = 200
+
+
+def _content_text(content) -> str:
+    """Text of a message or tool result content (a string or a list of typed parts)"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return '\n'.join(
+            part.get('text', '') for part in content if isinstance(part, dict) and part.get('type') == 'text'
+        )
+    return ''
+
+
+def _tool_call(part: dict) -> str:
+    name = part.get('name') or 'tool'
+    tool_input = part.get('input') if isinstance(part.get('input'), dict) else {}
+    path = tool_input.get('file_path') or tool_input.get('notebook_path')
+    if name in FILE_TOOLS and path:
+        return f"{FILE_TOOLS[name]}: {path}"
+    detail = tool_input.get('command') or path or tool_input.get('pattern') or ''
+    return f"● {name}({str(detail)[:TOOL_DETAIL_CHARS]})"
+
+
+class StreamJsonDecoder:
+    """Turns stream-json output, fed in chunks of any size, into transcript text"""
+
+    def __init__(self):
+        self._pending = b''
+        self.result: Optional[str] = None  # text of the final `result` event
+        self.texts: List[str] = []  # what the assistant said, in order
+        self.other: List[str] = []  # lines that aren't events, e.g. CLI errors
+
+    @property
+    def reply(self) -> str:
+        """The answer: the final result, else what the assistant said so far (after any CLI errors)"""
+        text = self.result if self.result is not None else '\n\n'.join(self.texts)
+        return '\n'.join(self.other + [text]).strip()
+
+    def feed(self, chunk: bytes) -> str:
+        lines = (self._pending + chunk).split(b'\n')
+        self._pending = lines.pop()
+        return ''.join(self._line(line) for line in lines)
+
+    def flush(self) -> str:
+        line, self._pending = self._pending, b''
+        return self._line(line)
+
+    async def read_from(
+        self,
+        stream: asyncio.StreamReader,
+        capture: OutputCapture,
+        on_chunk: Optional[Callable[[str], None]] = None
+    ):
+        """Drain the event stream, writing the transcript to capture; on_chunk(text) is called
+        for every chunk read, with '' when the events carried no text"""
+        while True:
+            chunk = await stream.read(65536)
+            text = self.feed(chunk) if chunk else self.flush()
+            if text:
+                capture.write(text.encode('utf-8'))
+            if on_chunk and (chunk or text):
+                on_chunk(text)
+            if not chunk:
+                break
+
+    def _line(self, raw: bytes) -> str:
+        line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+        if not line.strip():
+            return ''
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            self.other.append(line)
+            return line + '\n'
+
+        kind = event.get('type')
+        message = event.get('message') if isinstance(event.get('message'), dict) else {}
+        parts = message.get('content') if isinstance(message.get('content'), list) else []
+        lines = []
+        if kind == 'assistant':
+            for part in parts:
+                if not isinstance(part, dict):
+                    continue
+                if part.get('type') == 'text':
+                    self.texts.append(part.get('text', ''))
+                    lines.append(part.get('text', ''))
+                elif part.get('type') == 'tool_use':
+                    lines.append(_tool_call(part))
+        elif kind == 'user':
+            for part in parts:
+                if isinstance(part, dict) and part.get('type') == 'tool_result':
+                    lines.append(_content_text(part.get('content')))
+        elif kind == 'result' and isinstance(event.get('result'), str):
+            self.result = event['result']
+            if event.get('is_error'):
+                lines.append(f"Error: {self.result}")
+        return ''.join(text + '\n' for text in lines if text)
+
+
+def stream_json_reply(capture: OutputCapture) -> str:
+    """Reply text from captured stream-json output: the final result, else the assistant's text so far"""
+    decoder = StreamJsonDecoder()
+    for block in capture.blocks():
+        decoder.feed(block.encode('utf-8'))
+    decoder.flush()
+    return decoder.reply
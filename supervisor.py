@@ -0,0 +1,188 @@
+"""
+Sharded multi-process mode (BOT_WORKERS > 1)
+The front process receives updates (polling or webhook) and routes each one to a
+worker process by chat id, so a chat is always handled by the same worker. Workers
+run the full bot and reply to Telegram directly; rate limits, the result cache,
+session summaries and /context choices are shared through shared_state.
+"""
+
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler
+
+from config import config
+from serving import build_application, run_application
+
+logger = logging.getLogger(__name__)
+
+# Workers are started fresh (not forked) so none of the front process's
+# event loop, sockets or threads leak into them
+_mp = multiprocessing.get_context('spawn')
+
+
+def shard_for(update: Update, workers: int) -> int:
+    """Worker index owning an update (by chat, falling back to the user)"""
+    if update.effective_chat:
+        key = update.effective_chat.id
+    elif update.effective_user:
+        key = update.effective_user.id
+    else:
+        key = 0
+    return key % workers
+
+
+def worker_env(index: int, workers: int) -> Dict[str, str]:
+    """Environment overrides for one worker: shared state, and its slice of the global limits"""
+    env = {
+        'WORKER_INDEX': str(index),
+        'SHARED_STATE_PATH': config.SHARED_STATE_PATH,
+        'TELEGRAM_GLOBAL_RATE': str(config.TELEGRAM_GLOBAL_RATE / workers),
+        'MAX_PARALLEL_SESSIONS': str(max(1, math.ceil(config.MAX_PARALLEL_SESSIONS / workers))),
+        'BOT_WORKERS': '1',
+    }
+    if config.METRICS_PORT:
+        # The front process keeps METRICS_PORT; workers take the ports after it
+        env['METRICS_PORT'] = str(config.METRICS_PORT + 1 + index)
+    return env
+
+
+@contextmanager
+def _environ(overrides: Dict[str, str]):
+    """Temporarily apply overrides (spawned children copy os.environ at start)"""
+    saved = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class Supervisor:
+    """Starts the worker processes, routes updates to them and restarts any that die"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.queues: List[multiprocessing.Queue] = [_mp.Queue() for _ in range(workers)]
+        self.processes: List[multiprocessing.Process] = [None] * workers
+        self.app = build_application(
+            config.TELEGRAM_BOT_TOKEN,
+            update_queue_size=config.UPDATE_QUEUE_SIZE,
+            base_url=config.TELEGRAM_API_BASE_URL
+        )
+        self.app.add_handler(TypeHandler(Update, self.route))
+
+    def start_worker(self, index: int):
+        with _environ(worker_env(index, self.workers)):
+            process = _mp.Process(
+                target=_worker_main, args=(index, self.queues[index]),
+                name=f"bot-worker-{index}", daemon=False
+            )
+            process.start()
+        self.processes[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    async def route(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        index = shard_for(update, self.workers)
+        self.queues[index].put(update.to_json())
+
+    async def check_workers(self, context: ContextTypes.DEFAULT_TYPE):
+        for index, process in enumerate(self.processes):
+            if not process.is_alive():
+                logger.error(f"Worker {index} exited with {process.exitcode}, restarting")
+                self.start_worker(index)
+
+    async def stop_workers(self, application):
+        for q in self.queues:
+            q.put(None)
+        # Workers finish the requests they're running before exiting; all of them
+        # share one deadline, so shutdown fits in systemd's stop timeout (90s)
+        deadline = time.monotonic() + config.WORKER_STOP_TIMEOUT
+        while any(process.is_alive() for process in self.processes) and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                # Workers ignore SIGTERM (see _worker_main), so terminate() wouldn't stop them
+                logger.warning(f"Worker {index} did not stop within {config.WORKER_STOP_TIMEOUT}s, killing it")
+                process.kill()
+                process.join(5)
+
+    def run(self):
+        for index in range(self.workers):
+            self.start_worker(index)
+
+        self.app.job_queue.run_repeating(self.check_workers, interval=5, first=5)
+        self.app.post_shutdown = self.stop_workers
+
+        if config.METRICS_PORT:
+            from metrics import metrics
+            metrics.start_http_server(config.METRICS_LISTEN, config.METRICS_PORT)
+
+        run_application(
+            self.app,
+            webhook_url=config.WEBHOOK_URL,
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS
+        )
+
+
+def run_supervisor(workers: int):
+    """Entry point for bot.py when BOT_WORKERS > 1"""
+    logger.info(f"🤖 Starting Telegram Claude Code Bot with {workers} worker processes...")
+    Supervisor(workers).run()
+
+
+def _worker_main(index: int, updates: multiprocessing.Queue):
+    """Worker process: run the bot on the updates routed to this shard"""
+    # Ctrl+C / SIGTERM go to the front process, which stops workers via the queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    from bot import TelegramClaudeBot
+
+    bot = TelegramClaudeBot()
+    bot.prepare()
+    asyncio.run(_serve_worker(bot.app, updates))
+
+
+async def _serve_worker(app, updates: multiprocessing.Queue):
+    parent = os.getppid()
+    loop = asyncio.get_running_loop()
+
+    await app.initialize()
+    await app.start()
+    try:
+        while True:
+            try:
+                payload = await loop.run_in_executor(None, updates.get, True, 1.0)
+            except queue.Empty:
+                if os.getppid() != parent:
+                    logger.warning("Front process is gone, stopping worker")
+                    break
+                continue
+            if payload is None:
+                break
+            await app.update_queue.put(Update.de_json(json.loads(payload), app.bot))
+    finally:
+        await app.stop()
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
@@ -15,15 +15,35 @@ Just like chatting with Claude Code directly!
 import os
 import asyncio
 import logging
+import re
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from telegram.ext import CommandHandler, MessageHandler, filters, ContextTypes
+
+import capabilities
+from telegram_sender import TelegramSender
+from metrics import SUBPROCESS_SPAWNS
+from output_capture import OutputCapture
+from output_watchdog import OutputWatchdog
+from stream_json import stream_json_reply
+from background_jobs import format_duration
+from cli_sessions import CLISession, CLISessionStore
+from serving import build_application, run_application
+from log_pipeline import setup_logging, TRANSCRIPT_LOGGER
+
+# Logging goes through a queue to a writer thread (console + optional rotated LOG_FILE);
+# ECHO_OUTPUT=false keeps prompts and full Claude output off the console
+ECHO_OUTPUT = os.getenv('ECHO_OUTPUT', 'true').lower() == 'true'
+setup_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    log_file=os.getenv('LOG_FILE', ''),
+    max_bytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+    backup_count=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+    max_chars=int(os.getenv('LOG_MAX_CHARS', '10000')),
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+    echo_transcripts=ECHO_OUTPUT
 )
 logger = logging.getLogger(__name__)
+transcript = logging.getLogger(TRANSCRIPT_LOGGER)
 
 # Reduce noise from httpx (Telegram API calls)
 logging.getLogger('httpx').setLevel(logging.WARNING)
@@ -34,6 +54,39 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 ALLOWED_USER_IDS = [int(uid) for uid in os.getenv('ALLOWED_USER_IDS', '').split(',') if uid]
 PROJECT_DIR = os.getenv('PROJECT_DIR', os.getcwd())
 
+# Optional webhook mode (long polling unless WEBHOOK_URL is set)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '1'))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '0'))
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', '')
+
+# Output past the threshold is spooled to a temp file; replies keep its head and tail
+OUTPUT_SPOOL_THRESHOLD = int(os.getenv('OUTPUT_SPOOL_THRESHOLD', str(1024 * 1024)))
+OUTPUT_TAIL_BYTES = int(os.getenv('OUTPUT_TAIL_BYTES', str(64 * 1024)))
+
+# Runs end after CLAUDE_IDLE_TIMEOUT seconds without a stream event (message or tool
+# call/result), or CLAUDE_MAX_RUNTIME in total
+CLAUDE_IDLE_TIMEOUT = int(os.getenv('CLAUDE_IDLE_TIMEOUT', '600'))
+CLAUDE_MAX_RUNTIME = int(os.getenv('CLAUDE_MAX_RUNTIME', '3600'))  # 0 = no cap
+HEARTBEAT_INTERVAL = int(os.getenv('HEARTBEAT_INTERVAL', '60'))  # "still working" message
+
+# What the CLI prints when it can't resume a conversation (e.g. it was deleted)
+SESSION_MISSING = re.compile(r'No conversation found|session (?:ID )?\S* ?not found', re.IGNORECASE)
+
+# Each (user, chat) resumes its own CLI conversation; rotated when too old/long/large
+CLI_SESSIONS_PATH = os.getenv(
+    'CLI_SESSIONS_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'telegram-claude-bot', 'cli_sessions.json')
+)
+CLI_SESSION_MAX_AGE = int(os.getenv('CLI_SESSION_MAX_AGE', str(24 * 3600)))
+CLI_SESSION_MAX_TURNS = int(os.getenv('CLI_SESSION_MAX_TURNS', '50'))
+CLI_SESSION_MAX_BYTES = int(os.getenv('CLI_SESSION_MAX_BYTES', str(2 * 1024 * 1024)))
+
 
 class ClaudeCodeSession:
     """Maintains persistent Claude Code CLI session with streaming I/O"""
@@ -44,28 +97,13 @@ class ClaudeCodeSession:
         self.session_active = False
         self.claude_cmd = self._find_claude_command()
         self.message_counter = 0
+        self.sessions = CLISessionStore(
+            CLI_SESSIONS_PATH, CLI_SESSION_MAX_AGE, CLI_SESSION_MAX_TURNS, CLI_SESSION_MAX_BYTES
+        )
 
     def _find_claude_command(self):
         """Find which Claude command is available (claude-code or claude)"""
-        import subprocess
-
-        # Try claude-code first (preferred)
-        try:
-            subprocess.run(['claude-code', '--version'], capture_output=True, check=True)
-            return 'claude-code'
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            pass
-
-        # Try claude as fallback
-        try:
-            result = subprocess.run(['claude', '--version'], capture_output=True, check=True, text=True)
-            # Make sure it's Claude Code, not the old claude CLI
-            if 'Claude Code' in result.stdout:
-                return 'claude'
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            pass
-
-        return None
+        return capabilities.detect().claude_command
 
     async def start(self):
         """Initialize Claude Code session"""
@@ -165,8 +203,12 @@ To see what agents have learned, check: {agents_path}/learnings/
 
         return agent_system_context
 
-    async def send_message(self, message: str) -> str:
-        """Send message to Claude Code and get response (optimized)"""
+    async def send_message(self, message: str, on_heartbeat=None, user_id: int = 0, context: str = 'default') -> str:
+        """Send message to Claude Code and get response (optimized)
+
+        Resumes the CLI conversation of (user_id, context), so users don't share one.
+        on_heartbeat(elapsed, idle) is called every HEARTBEAT_INTERVAL while it runs
+        """
 
         if not self.session_active:
             await self.start()
@@ -180,60 +222,83 @@ To see what agents have learned, check: {agents_path}/learnings/
             # Enhance message with agent system awareness
             enhanced_message = self._get_agent_aware_prompt(message)
 
-            # Use --print --continue for context persistence
-            # Use --verbose to get full output
-            cmd = [
-                self.claude_cmd,
-                '--print',
-                '--continue',
-                '--verbose',
-                enhanced_message
-            ]
-
-            # Run Claude Code command
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                cwd=self.project_dir,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                env={**os.environ}
-            )
+            key = self.sessions.key(user_id, context)
+            async with self.sessions.lock(key):
+                session = self.sessions.get(key)
+                returncode, full_output, watchdog = await self._run_cli(session, enhanced_message, on_heartbeat)
+                if returncode != 0 and session.started and SESSION_MISSING.search(full_output):
+                    # The CLI no longer has the conversation - start a new one.
+                    # Other failures are returned as-is: rerunning could apply edits twice
+                    logger.warning(
+                        f"Resuming CLI session {session.session_id} failed (exit {returncode}), starting a new one"
+                    )
+                    session = self.sessions.rotate(key)
+                    returncode, full_output, watchdog = await self._run_cli(session, enhanced_message, on_heartbeat)
+
+                if returncode == 0 or watchdog.reason:
+                    self.sessions.record_turn(key, session, len(enhanced_message) + len(full_output))
+                elif not session.started:
+                    self.sessions.rotate(key)
+
+            if watchdog.reason:
+                return f"❌ Stopped after {format_duration(watchdog.elapsed)}: {watchdog.reason}"
+            if returncode == 0:
+                return full_output if full_output else "No response received"
+            else:
+                logger.error(f"Claude Code error (exit {returncode})")
+                return full_output if full_output else f"❌ Error: Process exited with code {returncode}"
+
+        except Exception as e:
+            logger.error(f"Error communicating with Claude Code: {e}")
+            return f"❌ Error: {str(e)}"
 
-            # Wait for completion with timeout
+    async def _run_cli(self, session: CLISession, prompt: str, on_heartbeat) -> tuple:
+        """One CLI turn in `session`: (exit code, output, watchdog)"""
+
+        # Resume this conversation by ID (a new one is created under that ID)
+        # Stream events as they happen (stream-json needs --verbose), so the
+        # watchdog sees a working run instead of silence until the end
+        cmd = [
+            self.claude_cmd,
+            '--print',
+            '--resume' if session.started else '--session-id', session.session_id,
+            '--output-format', 'stream-json',
+            '--verbose',
+            prompt
+        ]
+
+        # Run Claude Code command
+        SUBPROCESS_SPAWNS.inc(self.claude_cmd)
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=self.project_dir,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env={**os.environ}
+        )
+
+        # Wait for completion while it keeps printing; verbose output is spooled
+        # to disk rather than held in memory, keeping its head and tail
+        watchdog = OutputWatchdog(CLAUDE_IDLE_TIMEOUT, CLAUDE_MAX_RUNTIME, HEARTBEAT_INTERVAL, on_heartbeat)
+        stdout = OutputCapture(spool_threshold=OUTPUT_SPOOL_THRESHOLD, tail_bytes=OUTPUT_TAIL_BYTES)
+        stderr = OutputCapture(spool_threshold=OUTPUT_SPOOL_THRESHOLD, tail_bytes=OUTPUT_TAIL_BYTES)
+        with stdout, stderr:
+            watch = asyncio.create_task(watchdog.watch(process))
             try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(),
-                    timeout=600  # 10 minutes max
+                await asyncio.gather(
+                    stdout.read_from(process.stdout, watchdog.touch),
+                    stderr.read_from(process.stderr, watchdog.touch),
+                    process.wait()
                 )
+            finally:
+                watch.cancel()
 
-                # Decode outputs
-                stdout_text = stdout.decode('utf-8') if stdout else ""
-                stderr_text = stderr.decode('utf-8') if stderr else ""
-
-                # Claude Code outputs to stderr in verbose mode
-                # Combine both for full output
-                full_output = ""
-                if stderr_text:
-                    full_output += stderr_text
-                if stdout_text:
-                    if full_output:
-                        full_output += "\n"
-                    full_output += stdout_text
-
-                if process.returncode == 0:
-                    return full_output.strip() if full_output.strip() else "No response received"
-                else:
-                    logger.error(f"Claude Code error (exit {process.returncode})")
-                    return full_output.strip() if full_output.strip() else f"❌ Error: Process exited with code {process.returncode}"
-
-            except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
-                return "❌ Response timeout (>10 minutes)"
+            # stdout is the event stream; stderr has CLI errors
+            full_output = '\n'.join(
+                text for text in (stderr.summary(), stream_json_reply(stdout)) if text
+            ).strip()
 
-        except Exception as e:
-            logger.error(f"Error communicating with Claude Code: {e}")
-            return f"❌ Error: {str(e)}"
+        return process.returncode, full_output, watchdog
 
     async def stop(self):
         """Stop Claude Code session"""
@@ -246,7 +311,13 @@ class TelegramClaudeProxy:
 
     def __init__(self):
         self.claude_session = ClaudeCodeSession(PROJECT_DIR)
-        self.app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        self.app = build_application(
+            TELEGRAM_BOT_TOKEN,
+            workers=UPDATE_WORKERS,
+            update_queue_size=UPDATE_QUEUE_SIZE,
+            base_url=TELEGRAM_API_BASE_URL
+        )
+        self.sender = TelegramSender(self.app.bot)
 
     def _extract_clean_response(self, full_response: str) -> str:
         """Extract clean text response from Claude Code output (remove XML, thinking blocks, etc.)"""
@@ -269,7 +340,8 @@ class TelegramClaudeProxy:
 
         # Check authorization
         if ALLOWED_USER_IDS and update.effective_user.id not in ALLOWED_USER_IDS:
-            await update.message.reply_text(
+            self._reply(
+                update,
                 f"❌ Unauthorized\n"
                 f"Your Telegram ID: {update.effective_user.id}"
             )
@@ -301,7 +373,7 @@ Try:
 Ready! 🚀
         """
 
-        await update.message.reply_text(welcome, parse_mode='Markdown')
+        self._reply(update, welcome, parse_mode='Markdown')
 
     async def cmd_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
@@ -331,17 +403,33 @@ Just chat naturally! Examples:
 • "Review my architecture"
 • "What are the security risks?"
 
+**Conversations:**
+Each chat keeps its own Claude Code conversation. /new starts a fresh one.
+
 **No limits, no restrictions - full Claude Code!** 🤖
         """
 
-        await update.message.reply_text(help_text, parse_mode='Markdown')
+        self._reply(update, help_text, parse_mode='Markdown')
+
+    async def cmd_new(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Start a new Claude Code conversation in this chat"""
+
+        if ALLOWED_USER_IDS and update.effective_user.id not in ALLOWED_USER_IDS:
+            return
+
+        sessions = self.claude_session.sessions
+        key = sessions.key(update.effective_user.id, str(update.effective_chat.id))
+        async with sessions.lock(key):
+            sessions.rotate(key)
+        self._reply(update, "🆕 Started a new conversation.")
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Forward message to Claude Code, return response"""
 
         # Check authorization
         if ALLOWED_USER_IDS and update.effective_user.id not in ALLOWED_USER_IDS:
-            await update.message.reply_text(
+            self._reply(
+                update,
                 f"❌ Unauthorized. Your ID: {update.effective_user.id}"
             )
             return
@@ -350,40 +438,59 @@ Just chat naturally! Examples:
         user_id = update.effective_user.id
         user_name = update.effective_user.first_name or f"User {user_id}"
 
-        # Print user message to console (exactly like Claude Code shows it)
-        print("\n" + "="*70)
-        print(f"You: {user_message}")
-        print("="*70 + "\n")
+        # Log the user message (written by the logging thread, not here)
+        transcript.info(f"You: {user_message}")
 
         # Show typing indicator
         await update.message.reply_chat_action("typing")
 
         # Forward to Claude Code CLI and print response exactly as it appears
-        full_response = await self.claude_session.send_message(user_message)
+        chat_id = update.effective_chat.id
+        full_response = await self.claude_session.send_message(
+            user_message, on_heartbeat=self._heartbeat(chat_id), user_id=user_id, context=str(chat_id)
+        )
 
-        # Print the full Claude Code output to terminal (includes thinking, tokens, time, etc.)
-        print(full_response)
-        print("\n" + "="*70 + "\n")
+        # Log the full Claude Code output (includes thinking, tokens, time, etc.), cut to LOG_MAX_CHARS
+        transcript.info(f"Claude:\n{full_response}")
 
         # Extract clean response for Telegram (remove XML tags, thinking blocks, etc.)
         clean_response = self._extract_clean_response(full_response)
 
-        # Send clean response back to Telegram
+        # Queue clean response back to Telegram (sender paces delivery)
         # Split into chunks if too long (Telegram has 4096 char limit)
         if len(clean_response) <= 4096:
-            await update.message.reply_text(clean_response)
+            self.sender.send_message(chat_id, clean_response)
         else:
             # Split into chunks
             chunks = [clean_response[i:i+4000] for i in range(0, len(clean_response), 4000)]
             for chunk in chunks:
-                await update.message.reply_text(chunk)
+                self.sender.send_message(chat_id, chunk)
+
+    def _heartbeat(self, chat_id: int):
+        """Heartbeat callback: one "still working" message, edited with the elapsed time"""
+        status = None
+
+        def beat(elapsed: float, idle: float):
+            nonlocal status
+            text = f"⏳ Still working... ({format_duration(elapsed)})"
+            if status is None:
+                status = self.sender.send_message(chat_id, text)
+            elif status.done() and not status.exception() and status.result():
+                self.sender.edit_message(chat_id, status.result().message_id, text)
+
+        return beat
+
+    def _reply(self, update: Update, text: str, **kwargs) -> asyncio.Future:
+        """Queue a message to the update's chat through the rate-limited sender"""
+        return self.sender.send_message(update.effective_chat.id, text, **kwargs)
 
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors"""
         logger.error(f"Exception: {context.error}", exc_info=context.error)
 
         if isinstance(update, Update) and update.effective_message:
-            await update.effective_message.reply_text(
+            self._reply(
+                update,
                 "❌ An error occurred. Please try again."
             )
 
@@ -417,6 +524,7 @@ Just chat naturally! Examples:
         print("\n" + "="*60)
         print("👋 Shutting down Telegram Claude Code Proxy...")
         print("="*60 + "\n")
+        await self.sender.stop()
         await self.claude_session.stop()
 
     def run(self):
@@ -430,6 +538,7 @@ Just chat naturally! Examples:
         # Add handlers
         self.app.add_handler(CommandHandler("start", self.cmd_start))
         self.app.add_handler(CommandHandler("help", self.cmd_help))
+        self.app.add_handler(CommandHandler("new", self.cmd_new))
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
 
         # Error handler
@@ -441,7 +550,15 @@ Just chat naturally! Examples:
 
         # Run
         logger.info("✅ Bot starting...")
-        self.app.run_polling(allowed_updates=Update.ALL_TYPES)
+        run_application(
+            self.app,
+            webhook_url=WEBHOOK_URL,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
 
 
 def main():
@@ -459,22 +576,8 @@ def main():
         print("Set it with:")
         print("  export ALLOWED_USER_IDS='123456789,987654321'")
 
-    # Check if claude-code or claude is installed
-    import subprocess
-    claude_cmd = None
-
-    # Try claude-code first
-    try:
-        subprocess.run(['claude-code', '--version'], capture_output=True, check=True)
-        claude_cmd = 'claude-code'
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        # Try claude as fallback
-        try:
-            result = subprocess.run(['claude', '--version'], capture_output=True, check=True, text=True)
-            if 'Claude Code' in result.stdout:
-                claude_cmd = 'claude'
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            pass
+    # Check if claude-code or claude is installed (probe result is cached across restarts)
+    claude_cmd = capabilities.detect().claude_command
 
     if not claude_cmd:
         print("❌ Error: Claude Code not found!")
@@ -0,0 +1,272 @@
+"""
+Outbound Telegram message dispatcher
+Paces sends/edits to stay within Telegram's flood limits
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+from telegram.error import BadRequest, RetryAfter
+
+from metrics import STAGE_SECONDS
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class OutboundMessage:
+    """A queued Bot API call"""
+
+    def __init__(self, method: str, chat_id: int, kwargs: dict, message_id: Optional[int] = None):
+        self.method = method
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.kwargs = kwargs
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.future.add_done_callback(self._consume_exception)
+        self.attempts = 0
+        # Covers queueing + delivery; keeps the request trace open until sent
+        self.span = tracer.start_span(f"telegram.{method}", chat_id=chat_id)
+
+    @staticmethod
+    def _consume_exception(future: asyncio.Future):
+        """Mark exceptions as retrieved; the dispatcher already logged them"""
+        if not future.cancelled():
+            future.exception()
+
+    @property
+    def is_edit(self) -> bool:
+        return self.method == 'edit_message_text'
+
+
+class TelegramSender:
+    """
+    Central outbound queue for Telegram messages
+
+    - Per-chat pacing (private chats and groups have different limits)
+    - Global token bucket across all chats
+    - Honors retry_after from 429 responses
+    - Merges pending edits of the same message so only the latest is sent
+    """
+
+    def __init__(
+        self,
+        bot,
+        global_per_second: float = 30.0,
+        chat_interval: float = 1.0,
+        group_interval: float = 3.0,
+        max_retries: int = 3
+    ):
+        self.bot = bot
+        self.global_per_second = global_per_second
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+
+        self._pending: "OrderedDict[int, Deque[OutboundMessage]]" = OrderedDict()
+        self._next_allowed: Dict[int, float] = {}
+        self._in_flight: set = set()
+        self._tasks: set = set()
+        self._tokens = global_per_second
+        self._last_refill = time.monotonic()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.sent = 0
+        self.merged = 0
+        self.retried = 0
+        self.failed = 0
+
+    # Public API -------------------------------------------------------
+
+    def send_message(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Queue a new message; returns a future resolving to the sent Message"""
+        return self._submit(OutboundMessage(
+            'send_message', chat_id, {'chat_id': chat_id, 'text': text, **kwargs}
+        ))
+
+    def edit_message(self, chat_id: int, message_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Queue an edit; supersedes any pending edit of the same message"""
+        return self._submit(OutboundMessage(
+            'edit_message_text', chat_id,
+            {'chat_id': chat_id, 'message_id': message_id, 'text': text, **kwargs},
+            message_id=message_id
+        ))
+
+    def send_document(self, chat_id: int, document: Any, **kwargs) -> asyncio.Future:
+        """Queue a document upload"""
+        return self._submit(OutboundMessage(
+            'send_document', chat_id, {'chat_id': chat_id, 'document': document, **kwargs}
+        ))
+
+    def queue_depth(self) -> int:
+        """Number of calls waiting to be sent"""
+        return sum(len(q) for q in self._pending.values())
+
+    def stats(self) -> dict:
+        """Dispatcher counters for status/metrics output"""
+        return {
+            'queue_depth': self.queue_depth(),
+            'chats_waiting': len(self._pending),
+            'in_flight': len(self._in_flight),
+            'sent': self.sent,
+            'merged': self.merged,
+            'retried': self.retried,
+            'failed': self.failed,
+        }
+
+    def start(self):
+        """Start the dispatcher task (called lazily on first submit)"""
+        if self._worker is None or self._worker.done():
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Drain the queue (bounded by timeout) and stop the dispatcher"""
+        if not self._worker:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._stopping = True
+        self._wakeup.set()
+        await self._worker
+        self._worker = None
+
+    # Internals --------------------------------------------------------
+
+    def _submit(self, item: OutboundMessage) -> asyncio.Future:
+        self.start()
+        queue = self._pending.setdefault(item.chat_id, deque())
+
+        if item.is_edit:
+            for queued in queue:
+                if queued.is_edit and queued.message_id == item.message_id:
+                    # Only the latest text matters - reuse the queued slot
+                    queued.kwargs = item.kwargs
+                    queued.future.add_done_callback(
+                        lambda f, target=item.future: self._chain(f, target)
+                    )
+                    self.merged += 1
+                    if item.span:
+                        item.span.set(merged=True)
+                        item.span.finish()
+                    return item.future
+
+        queue.append(item)
+        self._wakeup.set()
+        return item.future
+
+    @staticmethod
+    def _chain(source: asyncio.Future, target: asyncio.Future):
+        if target.done():
+            return
+        if source.cancelled():
+            target.cancel()
+        elif source.exception():
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+
+    @staticmethod
+    def _finish_span(item: OutboundMessage, error: Optional[Exception] = None):
+        if item.span:
+            item.span.set(attempts=item.attempts + 1, text_chars=len(item.kwargs.get('text') or ''))
+            item.span.finish(error=error)
+
+    def _interval_for(self, chat_id: int) -> float:
+        # Negative chat IDs are groups/channels
+        return self.group_interval if chat_id < 0 else self.chat_interval
+
+    def _take_token(self, now: float) -> bool:
+        self._tokens = min(
+            self.global_per_second,
+            self._tokens + (now - self._last_refill) * self.global_per_second
+        )
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def _run(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            now = time.monotonic()
+            wait = None
+
+            for chat_id in list(self._pending):
+                if chat_id in self._in_flight:
+                    continue
+                ready_at = self._next_allowed.get(chat_id, 0.0)
+                if ready_at > now:
+                    wait = min(wait, ready_at - now) if wait is not None else ready_at - now
+                    continue
+                if not self._take_token(now):
+                    wait = 1.0 / self.global_per_second
+                    break
+
+                item = self._pending[chat_id].popleft()
+                if not self._pending[chat_id]:
+                    del self._pending[chat_id]
+                else:
+                    # Round-robin: move chat to the back
+                    self._pending.move_to_end(chat_id)
+                self._in_flight.add(chat_id)
+                task = asyncio.create_task(self._dispatch(item))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch(self, item: OutboundMessage):
+        chat_id = item.chat_id
+        try:
+            with STAGE_SECONDS.time('telegram_send'):
+                result = await getattr(self.bot, item.method)(**item.kwargs)
+            self.sent += 1
+            self._finish_span(item)
+            if not item.future.done():
+                item.future.set_result(result)
+        except RetryAfter as e:
+            self.retried += 1
+            item.attempts += 1
+            blocked_until = time.monotonic() + float(e.retry_after)
+            logger.warning(f"Flood control for chat {chat_id}: retry after {e.retry_after}s")
+            self._next_allowed[chat_id] = blocked_until
+            if item.attempts <= self.max_retries:
+                self._pending.setdefault(chat_id, deque()).appendleft(item)
+            else:
+                self._fail(item, e)
+        except BadRequest as e:
+            if 'parse_mode' in item.kwargs and "can't parse entities" in str(e).lower():
+                # Unbalanced Markdown (common in Claude output): send the text once more as is
+                logger.warning(f"Telegram {item.method} to chat {chat_id}: {e}; resending without parse_mode")
+                item.kwargs = {key: value for key, value in item.kwargs.items() if key != 'parse_mode'}
+                self._pending.setdefault(chat_id, deque()).appendleft(item)
+            else:
+                self._fail(item, e)
+        except Exception as e:
+            self._fail(item, e)
+        finally:
+            self._in_flight.discard(chat_id)
+            self._next_allowed[chat_id] = max(
+                self._next_allowed.get(chat_id, 0.0),
+                time.monotonic() + self._interval_for(chat_id)
+            )
+            self._wakeup.set()
+
+    def _fail(self, item: OutboundMessage, e: Exception):
+        self.failed += 1
+        logger.error(f"Telegram {item.method} to chat {item.chat_id} failed: {e}")
+        self._finish_span(item, e)
+        if not item.future.done():
+            item.future.set_exception(e)
@@ -0,0 +1,250 @@
+"""
+Persisted test results
+Every run whose output contains test results (pytest, Django/unittest, Jest)
+or that leaves a JUnit XML report is stored per context and commit, with
+per-test outcomes and durations. /status reads the latest run from here
+instead of re-running the suite, and summarizes flaky and slow tests.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from typing import Iterable, List, Optional
+import logging
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS test_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    context TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    source TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    passed INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    skipped INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS test_runs_context ON test_runs (context, id);
+CREATE TABLE IF NOT EXISTS test_cases (
+    run_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    duration REAL,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS test_cases_run ON test_cases (run_id);
+"""
+
+# Per-test lines in runner output
+PYTEST_RESULT = re.compile(r'^(\S+::\S+?)\s+(PASSED|FAILED|SKIPPED|ERROR|XFAIL|XPASS)\b', re.MULTILINE)
+PYTEST_SUMMARY = re.compile(r'^(FAILED|ERROR)\s+(\S+::\S+?)(?:\s+-\s+(.*))?$', re.MULTILINE)
+PYTEST_DURATION = re.compile(r'^\s*([\d.]+)s\s+call\s+(\S+::\S+)', re.MULTILINE)
+UNITTEST_RESULT = re.compile(r'^(\w+) \(([\w.]+)\)[^\n]*? \.\.\. (ok|FAIL|ERROR|skipped|expected failure)', re.MULTILINE)
+JEST_RESULT = re.compile(r'^\s*(✓|✕|○|√|×)\s+(.+?)(?:\s+\((\d+)\s*ms\))?\s*$', re.MULTILINE)
+# Jest's per-file header or summary: without one, ✓/× lines are just bullets in Claude's reply
+JEST_MARKER = re.compile(r'^\s*(?:PASS|FAIL)\s+\S+\.\w+|^Tests:\s+\d', re.MULTILINE)
+
+OUTCOMES = {
+    'PASSED': 'passed', 'XPASS': 'passed', 'ok': 'passed', '✓': 'passed', '√': 'passed',
+    'FAILED': 'failed', 'FAIL': 'failed', '✕': 'failed', '×': 'failed',
+    'ERROR': 'error',
+    'SKIPPED': 'skipped', 'XFAIL': 'skipped', 'skipped': 'skipped', 'expected failure': 'skipped', '○': 'skipped',
+}
+
+# Where runners are usually told to write JUnit XML, relative to the working directory
+JUNIT_LOCATIONS = ('junit.xml', 'report.xml', 'test-results', 'reports', 'junit')
+
+MAX_CASES = 5000
+
+
+def parse_cases(blocks: Iterable[str]) -> List[dict]:
+    """Per-test outcomes (and durations, when printed) from runner output"""
+    cases = {}
+    durations = {}
+    jest = False
+    for block in blocks:
+        if '::' in block:
+            for name, outcome in PYTEST_RESULT.findall(block):
+                cases[name] = {'name': name, 'outcome': OUTCOMES[outcome], 'duration': None, 'message': None}
+            for outcome, name, message in PYTEST_SUMMARY.findall(block):
+                cases[name] = {'name': name, 'outcome': OUTCOMES[outcome], 'duration': None, 'message': message or None}
+            for seconds, name in PYTEST_DURATION.findall(block):
+                durations[name] = float(seconds)
+        if ' ... ' in block:
+            for method, qualified, outcome in UNITTEST_RESULT.findall(block):
+                name = f"{qualified}.{method}"
+                cases[name] = {'name': name, 'outcome': OUTCOMES[outcome], 'duration': None, 'message': None}
+        jest = jest or bool(JEST_MARKER.search(block))
+        for mark, name, millis in (JEST_RESULT.findall(block) if jest else ()):
+            cases[name] = {
+                'name': name, 'outcome': OUTCOMES[mark],
+                'duration': int(millis) / 1000 if millis else None, 'message': None
+            }
+        if len(cases) >= MAX_CASES:
+            break
+
+    for name, seconds in durations.items():
+        if name in cases:
+            cases[name]['duration'] = seconds
+    return list(cases.values())[:MAX_CASES]
+
+
+def find_junit_reports(working_dir: str, since: float) -> List[str]:
+    """JUnit XML files in the usual locations written after `since`"""
+    reports = []
+    for location in JUNIT_LOCATIONS:
+        path = os.path.join(working_dir, location)
+        candidates = [path] if os.path.isfile(path) else [
+            os.path.join(path, name) for name in (os.listdir(path) if os.path.isdir(path) else [])
+            if name.endswith('.xml')
+        ]
+        for candidate in candidates:
+            try:
+                if os.path.getmtime(candidate) >= since:
+                    reports.append(candidate)
+            except OSError:
+                continue
+    return reports
+
+
+def parse_junit(paths: Iterable[str]) -> List[dict]:
+    """Per-test outcomes and durations from JUnit XML reports"""
+    cases = []
+    for path in paths:
+        try:
+            root = ElementTree.parse(path).getroot()
+        except (ElementTree.ParseError, OSError) as e:
+            logger.warning(f"Could not read JUnit report {path}: {e}")
+            continue
+        for case in root.iter('testcase'):
+            classname = case.get('classname')
+            name = f"{classname}.{case.get('name')}" if classname else case.get('name', '?')
+            outcome, message = 'passed', None
+            for tag in ('failure', 'error', 'skipped'):
+                child = case.find(tag)
+                if child is not None:
+                    outcome = 'failed' if tag == 'failure' else tag
+                    message = (child.get('message') or '')[:500] or None
+                    break
+            duration = case.get('time')
+            cases.append({
+                'name': name, 'outcome': outcome,
+                'duration': float(duration) if duration else None, 'message': message
+            })
+    return cases[:MAX_CASES]
+
+
+def counts(cases: List[dict]) -> dict:
+    """tests_run-style counts from per-test outcomes"""
+    failed = sum(1 for case in cases if case['outcome'] in ('failed', 'error'))
+    skipped = sum(1 for case in cases if case['outcome'] == 'skipped')
+    return {
+        'ran': bool(cases),
+        'total': len(cases),
+        'passed': len(cases) - failed - skipped,
+        'failed': failed,
+        'skipped': skipped,
+    }
+
+
+class TestRunStore:
+    """SQLite store of test runs and their cases, trimmed to `keep` runs per context"""
+
+    def __init__(self, path: str, keep: int = 200):
+        self.path = path
+        self.keep = keep
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def record(self, context: str, commit: str, fingerprint: str, source: str, tests: dict, cases: List[dict]) -> int:
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            run_id = db.execute(
+                'INSERT INTO test_runs (context, commit_sha, fingerprint, source, total, passed, failed, skipped, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (context, commit, fingerprint, source, tests.get('total', 0), tests.get('passed', 0),
+                 tests.get('failed', 0), tests.get('skipped', 0), time.time())
+            ).lastrowid
+            db.executemany(
+                'INSERT INTO test_cases (run_id, name, outcome, duration, message) VALUES (?, ?, ?, ?, ?)',
+                [(run_id, case['name'], case['outcome'], case['duration'], case['message']) for case in cases]
+            )
+            self._trim(db, context)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return run_id
+
+    def latest(self, context: str) -> Optional[dict]:
+        row = self._connect().execute(
+            'SELECT * FROM test_runs WHERE context = ? ORDER BY id DESC LIMIT 1', (context,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def failures(self, run_id: int, limit: int = 10) -> List[dict]:
+        rows = self._connect().execute(
+            "SELECT name, message FROM test_cases WHERE run_id = ? AND outcome IN ('failed', 'error') LIMIT ?",
+            (run_id, limit)
+        )
+        return [dict(row) for row in rows]
+
+    def slowest(self, run_id: int, limit: int = 5) -> List[dict]:
+        rows = self._connect().execute(
+            'SELECT name, duration FROM test_cases WHERE run_id = ? AND duration IS NOT NULL '
+            'ORDER BY duration DESC LIMIT ?',
+            (run_id, limit)
+        )
+        return [dict(row) for row in rows]
+
+    def flaky(self, context: str, runs: int = 50, limit: int = 5) -> List[dict]:
+        """Tests that both passed and failed on the same code (same fingerprint) in the last `runs` git runs"""
+        rows = self._connect().execute(
+            """
+            SELECT c.name,
+                   SUM(c.outcome = 'passed') AS passes,
+                   SUM(c.outcome IN ('failed', 'error')) AS failures
+            FROM test_cases c
+            JOIN (SELECT id, fingerprint FROM test_runs WHERE context = ? AND fingerprint != '' ORDER BY id DESC LIMIT ?) r
+              ON c.run_id = r.id
+            GROUP BY r.fingerprint, c.name
+            HAVING passes > 0 AND failures > 0
+            ORDER BY failures DESC
+            LIMIT ?
+            """,
+            (context, runs, limit)
+        )
+        return [dict(row) for row in rows]
+
+    def _trim(self, db: sqlite3.Connection, context: str):
+        stale = db.execute(
+            'SELECT id FROM test_runs WHERE context = ? ORDER BY id DESC LIMIT -1 OFFSET ?', (context, self.keep)
+        ).fetchall()
+        for (run_id,) in stale:
+            db.execute('DELETE FROM test_cases WHERE run_id = ?', (run_id,))
+            db.execute('DELETE FROM test_runs WHERE id = ?', (run_id,))
+
+
+# Global store (None when TEST_RESULTS_DB is empty)
+test_runs: Optional[TestRunStore] = TestRunStore(config.TEST_RESULTS_DB) if config.TEST_RESULTS_DB else None
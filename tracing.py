@@ -0,0 +1,205 @@
+"""
+Lightweight request tracing
+Spans are logged as structured JSON; slow requests get their full span tree
+written to a separate log
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+
+class Trace:
+    """All spans belonging to one request"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.root: Optional['Span'] = None
+        self.spans: List['Span'] = []
+        self.open_spans = 0
+        self.finished = False
+
+
+class Span:
+    """A timed step within a trace"""
+
+    def __init__(self, tracer: 'Tracer', trace: Trace, name: str, parent: Optional['Span'], attrs: dict):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.span_id = uuid.uuid4().hex[:8]
+        self.attrs = attrs
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        trace.spans.append(self)
+        trace.open_spans += 1
+
+    def set(self, **attrs):
+        """Attach attributes (sizes, backend, fallback path, ...)"""
+        self.attrs.update(attrs)
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.attrs['error'] = f"{type(error).__name__}: {error}"[:300]
+        self.tracer._span_finished(self)
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent else None,
+            'span': self.name,
+            'start': round(self.start, 6),
+            'duration_ms': round((self.duration or 0) * 1000, 3),
+            **self.attrs,
+        }
+
+
+class _NullSpan:
+    """Stand-in used when no trace is active"""
+
+    def set(self, **attrs):
+        pass
+
+    def finish(self, error: Optional[BaseException] = None):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Creates traces/spans and writes slow-request reports"""
+
+    def __init__(self, slow_threshold: float = 30.0, slow_log_path: str = ''):
+        self.slow_threshold = slow_threshold
+        self.slow_log_path = slow_log_path
+        self._write_lock = threading.Lock()
+
+    def configure(self, slow_threshold: float, slow_log_path: str):
+        self.slow_threshold = slow_threshold
+        self.slow_log_path = slow_log_path
+
+    @staticmethod
+    def new_trace_id(prefix: str = '') -> str:
+        suffix = uuid.uuid4().hex[:12]
+        return f"{prefix}-{suffix}" if prefix else suffix
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        return _current_span.get()
+
+    def annotate(self, **attrs):
+        """Set attributes on the current span, if any"""
+        span = _current_span.get()
+        if span is not None:
+            span.set(**attrs)
+
+    @contextmanager
+    def trace(self, name: str, trace_id: Optional[str] = None, **attrs):
+        """Start a new trace with a root span for the with-block"""
+        trace = Trace(trace_id or self.new_trace_id())
+        root = Span(self, trace, name, None, attrs)
+        trace.root = root
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.finish(error=e)
+            raise
+        finally:
+            _current_span.reset(token)
+            root.finish()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Child span of the current span (no-op outside a trace)"""
+        span = self.start_span(name, **attrs)
+        if span is None:
+            yield NULL_SPAN
+            return
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(error=e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attrs) -> Optional[Span]:
+        """
+        Open a span that is finished explicitly (e.g. a queued Telegram send
+        that completes after the handler returned). Returns None outside a trace.
+        """
+        parent = parent or _current_span.get()
+        if parent is None or parent.trace.finished:
+            return None
+        return Span(self, parent.trace, name, parent, attrs)
+
+    # Internals --------------------------------------------------------
+
+    def _span_finished(self, span: Span):
+        trace = span.trace
+        trace.open_spans -= 1
+        logger.info(json.dumps(span.to_dict(), default=str))
+
+        # A trace is complete once the root and every late span (queued sends) ended
+        if trace.root.duration is not None and trace.open_spans == 0 and not trace.finished:
+            trace.finished = True
+            self._trace_finished(trace)
+
+    def _trace_finished(self, trace: Trace):
+        end = max(s.start + (s.duration or 0) for s in trace.spans)
+        total = end - trace.root.start
+
+        if total < self.slow_threshold or not self.slow_log_path:
+            return
+
+        report = {
+            'trace_id': trace.trace_id,
+            'name': trace.root.name,
+            'total_ms': round(total * 1000, 3),
+            'handler_ms': round(trace.root.duration * 1000, 3),
+            'attrs': trace.root.attrs,
+            'spans': self._tree(trace.root, trace.spans),
+        }
+        logger.warning(f"🐢 Slow request {trace.trace_id}: {report['total_ms']:.0f} ms")
+
+        try:
+            directory = os.path.dirname(self.slow_log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._write_lock, open(self.slow_log_path, 'a') as f:
+                f.write(json.dumps(report, default=str) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write slow-request log {self.slow_log_path}: {e}")
+
+    def _tree(self, span: Span, spans: List[Span]) -> dict:
+        node = span.to_dict()
+        node.pop('trace_id', None)
+        children = [s for s in spans if s.parent is span]
+        if children:
+            node['children'] = [self._tree(child, spans) for child in children]
+        return node
+
+
+# Global tracer (configured by the bot at startup)
+tracer = Tracer()
@@ -0,0 +1,127 @@
+"""
+Production traffic recorder
+Appends anonymized incoming updates and backend run timings to a JSONL file
+that benchmarks/traffic_replay.py can replay against a local build
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Identity fields removed from every recorded update
+_PERSONAL_KEYS = {'last_name', 'username', 'phone_number', 'bio', 'photo'}
+# Required by the Bot API schema, so replaced rather than removed
+_PLACEHOLDERS = {'first_name': 'User', 'title': 'Chat'}
+# Free text is masked (lengths and commands are kept)
+_TEXT_KEYS = {'text', 'caption'}
+# Objects whose 'id' is a Telegram user/chat ID
+_ID_OWNERS = {'from', 'chat', 'user', 'sender_chat', 'forward_from', 'forward_from_chat'}
+
+
+class TrafficRecorder:
+    """Writes one JSON event per line; disabled when no path is configured"""
+
+    def __init__(self, path: str = '', salt: str = ''):
+        self._lock = threading.Lock()
+        self.configure(path, salt)
+
+    def configure(self, path: str, salt: str = ''):
+        self.path = path
+        # Without a fixed salt IDs are only stable for this process
+        self._salt = (salt or os.urandom(16).hex()).encode()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def anonymize_id(self, value: int) -> int:
+        """Stable pseudonymous ID (keeps the sign so groups stay groups)"""
+        digest = hmac.new(self._salt, str(abs(value)).encode(), hashlib.sha256).hexdigest()
+        anonymous = int(digest[:12], 16) % 10 ** 10 + 1
+        return -anonymous if value < 0 else anonymous
+
+    @staticmethod
+    def mask_text(text: str) -> str:
+        """Replace words with filler of the same length; a leading /command is kept"""
+        command = ''
+        if text.startswith('/'):
+            command, _, text = text.partition(' ')
+            command += ' ' if text else ''
+        return command + re.sub(r'\w', 'x', text)
+
+    def anonymize_update(self, data, owner: Optional[str] = None):
+        if isinstance(data, list):
+            return [self.anonymize_update(item, owner) for item in data]
+        if not isinstance(data, dict):
+            return data
+
+        clean = {}
+        for key, value in data.items():
+            if key in _PERSONAL_KEYS:
+                continue
+            if key in _PLACEHOLDERS:
+                clean[key] = _PLACEHOLDERS[key]
+            elif key == 'id' and owner in _ID_OWNERS and isinstance(value, int):
+                clean[key] = self.anonymize_id(value)
+            elif key in ('user_id', 'chat_id') and isinstance(value, int):
+                clean[key] = self.anonymize_id(value)
+            elif key in _TEXT_KEYS and isinstance(value, str):
+                clean[key] = self.mask_text(value)
+            else:
+                clean[key] = self.anonymize_update(value, key)
+        return clean
+
+    async def on_update(self, update, context):
+        """PTB TypeHandler callback - records every incoming update"""
+        self.record_update(update.to_dict())
+
+    def record_update(self, data: dict):
+        if not self.enabled:
+            return
+        self._write({'type': 'update', 'update': self.anonymize_update(data)})
+
+    def record_backend(
+        self,
+        user_id: int,
+        context: str,
+        backend: str,
+        latency: float,
+        output_bytes: int,
+        success: bool,
+        route: str = ''
+    ):
+        """One Claude run: which backend (and model tier), how long it took and how much it printed"""
+        if not self.enabled:
+            return
+        event = {
+            'type': 'backend',
+            'user': self.anonymize_id(user_id),
+            'context': context,
+            'backend': backend,
+            'latency': round(latency, 4),
+            'output_bytes': output_bytes,
+            'success': success,
+        }
+        if route:
+            event['route'] = route
+        self._write(event)
+
+    def _write(self, event: dict):
+        event = {'t': round(time.time(), 4), **event}
+        try:
+            with self._lock, open(self.path, 'a') as f:
+                f.write(json.dumps(event, default=str) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write traffic recording {self.path}: {e}")
+
+
+# Global recorder (configured by the bot at startup)
+recorder = TrafficRecorder()
@@ -0,0 +1,157 @@
+"""
+Searchable archive of past interactions
+Every request is appended with its output (zlib-compressed) and changed files,
+per user and context, and indexed with SQLite FTS5, so /search finds an answer
+Claude already gave instead of paying for the same request again. Unlike the
+session history it survives session expiry and restarts.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Optional
+import logging
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# The FTS index is contentless (content=''): the text lives compressed in
+# interactions, the index only maps terms to interaction ids
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    context TEXT NOT NULL,
+    created REAL NOT NULL,
+    prompt TEXT NOT NULL,
+    files TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    output BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS interactions_user ON interactions (user_id, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS interactions_fts USING fts5 (
+    prompt, output, files, content='', prefix='2 3'
+);
+"""
+
+SNIPPET_BEFORE = 80
+SNIPPET_AFTER = 200
+
+
+def match_query(terms: str) -> str:
+    """User search terms as an FTS5 query: every word must appear (as a prefix), quoted so
+    FTS5 syntax characters in the terms are taken literally"""
+    words = [word.replace('"', '') for word in terms.split()]
+    return ' '.join(f'"{word}"*' for word in words if word)
+
+
+def snippet(text: str, terms: str) -> Optional[str]:
+    """The part of text around the first search term it contains (None if it has none)"""
+    words = [re.escape(word.replace('"', '')) for word in terms.split()]
+    found = re.search('|'.join(words), text, re.IGNORECASE) if words else None
+    if not found:
+        return None
+    start = max(0, found.start() - SNIPPET_BEFORE)
+    end = found.start() + SNIPPET_AFTER
+    return ('…' if start else '') + text[start:end].strip() + ('…' if end < len(text) else '')
+
+
+class TranscriptArchive:
+    """Append-only interactions with a full-text index over prompt, output and changed files"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def add(self, user_id: int, context: str, prompt: str, output: str, files: List[str], success: bool) -> int:
+        files_text = '\n'.join(files)
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            interaction_id = db.execute(
+                'INSERT INTO interactions (user_id, context, created, prompt, files, success, output) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (user_id, context, time.time(), prompt, files_text, int(success),
+                 zlib.compress(output.encode('utf-8'), 6))
+            ).lastrowid
+            db.execute(
+                'INSERT INTO interactions_fts (rowid, prompt, output, files) VALUES (?, ?, ?, ?)',
+                (interaction_id, prompt, output, files_text)
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return interaction_id
+
+    def search(self, user_id: int, terms: str, limit: int = 5, context: Optional[str] = None) -> List[dict]:
+        """The user's best-matching interactions, each with a snippet of the matching text"""
+        query = match_query(terms)
+        if not query:
+            return []
+        sql = (
+            'SELECT i.* FROM interactions_fts f JOIN interactions i ON i.id = f.rowid '
+            'WHERE interactions_fts MATCH ? AND i.user_id = ?'
+        )
+        params = [query, user_id]
+        if context:
+            sql += ' AND i.context = ?'
+            params.append(context)
+        sql += ' ORDER BY bm25(interactions_fts) LIMIT ?'
+        params.append(limit)
+
+        results = []
+        for row in self._connect().execute(sql, params):
+            interaction = self._row(row)
+            interaction['snippet'] = (
+                snippet(interaction['output'], terms)
+                or snippet('\n'.join(interaction['files']), terms)
+                or interaction['output'][:SNIPPET_AFTER]
+            )
+            results.append(interaction)
+        return results
+
+    def get(self, interaction_id: int, user_id: int) -> Optional[dict]:
+        """One of the user's interactions, with its full output"""
+        row = self._connect().execute(
+            'SELECT * FROM interactions WHERE id = ? AND user_id = ?', (interaction_id, user_id)
+        ).fetchone()
+        return self._row(row) if row else None
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> dict:
+        interaction = dict(row)
+        interaction['output'] = zlib.decompress(interaction['output']).decode('utf-8')
+        interaction['files'] = interaction['files'].split('\n') if interaction['files'] else []
+        interaction['success'] = bool(interaction['success'])
+        return interaction
+
+
+def _open(path: str) -> Optional[TranscriptArchive]:
+    try:
+        return TranscriptArchive(path)
+    except sqlite3.OperationalError as e:
+        # e.g. an SQLite build without FTS5
+        logger.warning(f"Transcript archive disabled, cannot open {path}: {e}")
+        return None
+
+
+# Global archive (None when TRANSCRIPT_ARCHIVE_PATH is empty or SQLite lacks FTS5)
+archive: Optional[TranscriptArchive] = _open(config.TRANSCRIPT_ARCHIVE_PATH) if config.TRANSCRIPT_ARCHIVE_PATH else None
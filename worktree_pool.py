@@ -0,0 +1,216 @@
+"""
+Pool of git worktrees so parallel sessions don't edit the same checkout
+Each session leases a worktree of its context's repository and works on its own
+branch (claude/<session_id>). Worktrees are recycled with a checkout + clean
+rather than a fresh clone; a session's uncommitted work is committed to its
+branch before the worktree is handed to someone else, and restored when the
+session leases again.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+import logging
+
+from metrics import SUBPROCESS_SPAWNS
+
+logger = logging.getLogger(__name__)
+
+BRANCH_PREFIX = 'claude/'
+
+
+class WorktreeError(Exception):
+    """A git command needed to prepare a worktree failed"""
+
+
+class Lease:
+    """A worktree slot held by one session"""
+
+    def __init__(self, slot: str, lock_fd: int, toplevel: str):
+        self.slot = slot
+        self.lock_fd = lock_fd
+        self.toplevel = toplevel
+        self.session_id: Optional[str] = None
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class WorktreePool:
+    """
+    Up to `size` worktrees per repository under `root`
+
+    Slots are claimed with an flock on <slot>.lock, so several bot processes
+    (sharded workers, the executor) can share one pool directory.
+    """
+
+    def __init__(self, root: str, size: int):
+        self.root = root
+        self.size = size
+        self.leases: Dict[str, Lease] = {}  # session_id -> lease
+        self._repos: Dict[str, Optional[Tuple[str, str]]] = {}  # path -> (toplevel, prefix)
+        self._lock = asyncio.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @asynccontextmanager
+    async def checkout(self, session_id: str, path: str):
+        """Working directory for one run: the session's worktree, or `path` if it can't have one"""
+        lease = None
+        working_dir = path
+        try:
+            repo = await self._repo(path)
+            if repo:
+                toplevel, prefix = repo
+                async with self._lock:
+                    lease = await self._lease(session_id, toplevel)
+                if lease:
+                    lease.in_use += 1
+                    working_dir = os.path.join(lease.slot, prefix)
+                else:
+                    logger.warning(f"No free worktree for {session_id}, using the shared checkout")
+        except WorktreeError as e:
+            logger.error(f"Worktree setup failed for {session_id}, using the shared checkout: {e}")
+
+        try:
+            yield working_dir
+        finally:
+            if lease:
+                lease.in_use -= 1
+                lease.last_used = time.monotonic()
+
+    async def release(self, session_id: str) -> bool:
+        """Save the session's work to its branch and free the worktree (False while a run still uses it)"""
+        async with self._lock:
+            lease = self.leases.get(session_id)
+            if not lease:
+                return True
+            if lease.in_use:
+                logger.info(f"Not releasing worktree {lease.slot} of {session_id}: still in use")
+                return False
+            del self.leases[session_id]
+            try:
+                await self._save(lease)
+            except WorktreeError as e:
+                logger.error(f"Could not save worktree {lease.slot} for {session_id}: {e}")
+            lease.session_id = None
+            self._unlock(lease)
+            return True
+
+    async def _lease(self, session_id: str, toplevel: str) -> Optional[Lease]:
+        lease = self.leases.get(session_id)
+        if lease:
+            return lease
+
+        lease = self._claim_free_slot(toplevel) or await self._evict(toplevel)
+        if not lease:
+            return None
+
+        started = time.perf_counter()
+        try:
+            await self._prepare(lease, session_id)
+        except WorktreeError:
+            self._unlock(lease)
+            raise
+        lease.session_id = session_id
+        self.leases[session_id] = lease
+        logger.info(f"Leased worktree {lease.slot} to {session_id} ({time.perf_counter() - started:.2f}s)")
+        return lease
+
+    def _claim_free_slot(self, toplevel: str) -> Optional[Lease]:
+        name = os.path.basename(toplevel.rstrip('/')) or 'repo'
+        digest = hashlib.sha1(toplevel.encode()).hexdigest()[:8]
+        held = {lease.slot for lease in self.leases.values()}
+        for index in range(self.size):
+            slot = os.path.join(self.root, f"{name}-{digest}-{index}")
+            if slot in held:
+                continue
+            fd = os.open(f"{slot}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)  # Held by another process
+                continue
+            return Lease(slot, fd, toplevel)
+        return None
+
+    async def _evict(self, toplevel: str) -> Optional[Lease]:
+        """Take the least recently used idle worktree from another session"""
+        idle = [
+            lease for lease in self.leases.values()
+            if lease.toplevel == toplevel and lease.in_use == 0
+        ]
+        if not idle:
+            return None
+        lease = min(idle, key=lambda lease: lease.last_used)
+        logger.info(f"Recycling worktree {lease.slot} from idle session {lease.session_id}")
+        del self.leases[lease.session_id]
+        try:
+            await self._save(lease)
+        except WorktreeError:
+            self._unlock(lease)
+            raise
+        lease.session_id = None
+        return lease
+
+    async def _prepare(self, lease: Lease, session_id: str):
+        """Fast reset of a slot onto the session's branch (created from the main checkout's HEAD)"""
+        if not os.path.exists(os.path.join(lease.slot, '.git')):
+            await self._git(lease.toplevel, 'worktree', 'prune')
+            if os.path.exists(lease.slot):
+                shutil.rmtree(lease.slot)
+            await self._git(lease.toplevel, 'worktree', 'add', '--detach', lease.slot, 'HEAD')
+
+        branch = f"{BRANCH_PREFIX}{session_id}"
+        if await self._git(lease.slot, 'branch', '--list', branch):
+            await self._git(lease.slot, 'checkout', '--force', '--ignore-other-worktrees', branch)
+        else:
+            head = await self._git(lease.toplevel, 'rev-parse', 'HEAD')
+            await self._git(lease.slot, 'checkout', '--force', '-b', branch, head)
+        # Leaves ignored files (node_modules, virtualenvs, build caches) for the next run
+        await self._git(lease.slot, 'clean', '-fdq')
+
+    async def _save(self, lease: Lease):
+        """Commit uncommitted work to the session branch, then detach so the branch is free"""
+        if await self._git(lease.slot, 'status', '--porcelain'):
+            await self._git(lease.slot, 'add', '-A')
+            await self._git(
+                lease.slot,
+                '-c', 'user.name=Telegram Claude Bot', '-c', 'user.email=bot@localhost',
+                'commit', '-q', '--no-verify', '-m', f"WIP: saved from bot session {lease.session_id}"
+            )
+            logger.info(f"Saved work of {lease.session_id} to {BRANCH_PREFIX}{lease.session_id}")
+        await self._git(lease.slot, 'checkout', '-q', '--detach')
+
+    @staticmethod
+    def _unlock(lease: Lease):
+        fcntl.flock(lease.lock_fd, fcntl.LOCK_UN)
+        os.close(lease.lock_fd)
+
+    async def _repo(self, path: str) -> Optional[Tuple[str, str]]:
+        """(repository top level, path of `path` inside it), or None if it isn't in a git repo"""
+        if path not in self._repos:
+            try:
+                output = await self._git(path, 'rev-parse', '--show-toplevel', '--show-prefix')
+                toplevel, _, prefix = output.partition('\n')
+                self._repos[path] = (toplevel, prefix)
+            except (WorktreeError, OSError):
+                self._repos[path] = None
+        return self._repos[path]
+
+    @staticmethod
+    async def _git(cwd: str, *args: str) -> str:
+        SUBPROCESS_SPAWNS.inc('git')
+        process = await asyncio.create_subprocess_exec(
+            'git', *args,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise WorktreeError(f"git {' '.join(args)}: {stderr.decode(errors='replace').strip()}")
+        return stdout.decode().strip()